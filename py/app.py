@@ -4,19 +4,34 @@
 Flask backend for Suno Song Processor
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response
 import os
 import sys
 import subprocess
 import uuid
 import shutil
 import json
-import zipfile
 import hashlib
 import base64
 from pathlib import Path
 import threading
 import time
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from worker_pool import WorkerPool
+from job_scheduler import JobScheduler, JobCancelled
+from audio_cache import ContentCache, file_sha256, make_key
+from media_index import MediaIndex, MediaCacheEvictor, media_key
+from single_flight import SingleFlight
+from model_registry import ModelRegistry
+from metrics import MetricsCollector
+
+try:
+    import audio_buffers
+except ImportError:
+    audio_buffers = None
 
 # ====== הגדרות תיקיות ======
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -26,6 +41,87 @@ SEPARATION_OUTPUT_DIR = os.path.join(BASE_DIR, "separation_outputs")
 LOCAL_MODELS_PATH = os.path.join(BASE_DIR, "MyDownloadedModels")
 MEDIA_CACHE_DIR = os.path.join(BASE_DIR, "media_cache")
 YOUTUBE_AUDIO_CACHE_PATH = os.path.join(BASE_DIR, "youtube_audio_cache.json")
+MEDIA_INDEX_PATH = os.path.join(BASE_DIR, "media_cache.sqlite3")
+STEM_CACHE_DIR = os.path.join(BASE_DIR, "stem_cache")
+RVC_CACHE_DIR = os.path.join(BASE_DIR, "rvc_cache")
+FEATURE_CACHE_DIR = os.path.join(BASE_DIR, "feature_cache")
+
+# ====== מטמון stems ======
+STEM_CACHE_MAX_BYTES = int(float(os.environ.get("STEM_CACHE_MAX_GB", "10")) * 1024 ** 3)
+RVC_CACHE_MAX_BYTES = int(float(os.environ.get("RVC_CACHE_MAX_GB", "5")) * 1024 ** 3)
+# תכונות HuBERT ו-f0 לכל stem, משותפות לכל מודלי הקול (0 = כבוי)
+RVC_FEATURE_CACHE_GB = float(os.environ.get("RVC_FEATURE_CACHE_GB", "2"))
+
+# ====== workers קבועים ל-RVC ======
+# RVC_WORKERS=0 מבטל את המאגר וחוזר להרצת סקריפט חד-פעמית לכל שיר
+RVC_WORKERS = int(os.environ.get("RVC_WORKERS", "1"))
+RVC_WORKER_MAX_MODELS = int(os.environ.get("RVC_WORKER_MAX_MODELS", "2"))
+# המרה בחלונות חופפים באורך הזה (שניות) כדי שהזיכרון לא יגדל עם אורך השיר; 0 = כל השיר בבת אחת
+RVC_CHUNK_SECONDS = float(os.environ.get("RVC_CHUNK_SECONDS", "60"))
+# מדלגים על אזורים שקטים ב-vocals (אינטרו, הפסקות, אאוטרו) במקום להמיר אותם
+RVC_SKIP_SILENCE = os.environ.get("RVC_SKIP_SILENCE", "1") != "0"
+# מספר תהליכי המרה מקבילים על מחשבים בלי GPU (0 = תהליך לכל 4 ליבות)
+RVC_CPU_PROCESSES = int(os.environ.get("RVC_CPU_PROCESSES", "0"))
+# על CPU ה-worker משתמש במאגר תהליכים (pool, בלי באצ'ים) או בבאצ'ים בתהליך אחד (batch)
+RVC_CPU_MODE = os.environ.get("RVC_CPU_MODE", "pool").lower()
+# קטעים מכמה שירים מאוחדים לבאצ' אחד של HuBERT/net_g בתוך ה-worker (1 = בלי באצ'ים)
+RVC_BATCH_SIZE = int(os.environ.get("RVC_BATCH_SIZE", "4"))
+RVC_BATCH_WAIT_MS = float(os.environ.get("RVC_BATCH_WAIT_MS", "100"))
+# כמה משימות כל worker מקבל במקביל כדי שיהיה ממה לבנות באצ'ים
+RVC_WORKER_JOBS = int(os.environ.get("RVC_WORKER_JOBS", str(RVC_BATCH_SIZE))) if RVC_BATCH_SIZE > 1 else 1
+
+# ====== שירות הפרדה קבוע ======
+# SEPARATION_WORKERS=0 מבטל את השירות וחוזר להרצת סקריפט חד-פעמית לכל שיר
+SEPARATION_WORKERS = int(os.environ.get("SEPARATION_WORKERS", "1"))
+SEPARATION_MAX_MODELS = int(os.environ.get("SEPARATION_MAX_MODELS", "2"))
+
+# ====== הורדות ======
+# מספר ההורדות שרצות במקביל, ומספר המקטעים שכל הורדה מושכת במקביל
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", "3"))
+YTDLP_CONCURRENT_FRAGMENTS = int(os.environ.get("YTDLP_CONCURRENT_FRAGMENTS", "4"))
+
+# ====== פינוי media_cache ======
+MEDIA_CACHE_MAX_BYTES = int(float(os.environ.get("MEDIA_CACHE_MAX_GB", "20")) * 1024 ** 3)
+MEDIA_CACHE_MAX_AGE = float(os.environ.get("MEDIA_CACHE_MAX_AGE_DAYS", "30")) * 86400
+MEDIA_CACHE_POLICY = os.environ.get("MEDIA_CACHE_POLICY", "lru").lower()
+MEDIA_CACHE_EVICT_INTERVAL = int(os.environ.get("MEDIA_CACHE_EVICT_INTERVAL", "600"))
+
+# ====== מתזמן משימות ======
+# כמה משימות יכולות להיות בכל שלב בו-זמנית
+STAGE_LIMITS = {
+    'download': int(os.environ.get("STAGE_LIMIT_DOWNLOAD", str(DOWNLOAD_WORKERS))),
+    'separation': int(os.environ.get("STAGE_LIMIT_SEPARATION", str(max(1, SEPARATION_WORKERS)))),
+    'rvc': int(os.environ.get("STAGE_LIMIT_RVC", str(max(1, RVC_WORKERS) * RVC_WORKER_JOBS))),
+    'ffmpeg': int(os.environ.get("STAGE_LIMIT_FFMPEG", "2")),
+}
+JOB_MAX_ACTIVE = int(os.environ.get("JOB_MAX_ACTIVE", "8"))
+# threads נוספים שמריצים רק משימות preview, גם כשכל JOB_MAX_ACTIVE תפוסים
+JOB_PREVIEW_RESERVED = int(os.environ.get("JOB_PREVIEW_RESERVED", "1"))
+
+# ====== מצב preview ======
+# קטע קצר סביב הפזמון הראשון, עם מודל ההפרדה המהיר והגדרות RVC מצומצמות
+PREVIEW_SECONDS = float(os.environ.get("PREVIEW_SECONDS", "45"))
+PREVIEW_SECONDS_RANGE = (30, 60)
+PREVIEW_SEPARATION_MODEL = 'UVR_MDXNET_KARA_2.onnx'
+PREVIEW_F0_METHOD = os.environ.get("PREVIEW_F0_METHOD", "pm")
+PREVIEW_INDEX_RATE = float(os.environ.get("PREVIEW_INDEX_RATE", "0"))
+# protect=0.5 מדלג על מעבר ההגנה על עיצורים
+PREVIEW_PROTECT = 0.5
+# חיפוש הפזמון צריך רק אנרגיה לכל שנייה: קצב דגימה נמוך, ורק תחילת השיר
+PREVIEW_ANALYSIS_SR = 2000
+PREVIEW_ANALYSIS_SECONDS = float(os.environ.get("PREVIEW_ANALYSIS_SECONDS", "180"))
+
+# ====== כמה קולות לשיר אחד ======
+# מספר הקולות המרבי בבקשה; ההמרות רצות במקביל עד מגבלת שלב ה-RVC
+FANOUT_MAX_VOICES = int(os.environ.get("FANOUT_MAX_VOICES", "8"))
+
+# משקל כל שלב בהתקדמות הכוללת של משימה, לפי סדר השלבים
+PROGRESS_WEIGHTS = OrderedDict([('download', 0.1), ('separation', 0.35), ('rvc', 0.45), ('ffmpeg', 0.1)])
+# כל כמה שניות זרם האירועים שולח keep-alive כשאין שינוי
+EVENTS_KEEPALIVE = float(os.environ.get("EVENTS_KEEPALIVE_SECONDS", "15"))
+
+# מיקס בזיכרון (NumPy) במקום פענוח חוזר של כל הקבצים ב-ffmpeg
+IN_MEMORY_MIX = os.environ.get("IN_MEMORY_MIX", "1") != "0"
 
 # יצירת כל התיקיות הנדרשות
 for dir_path in [OUTPUT_DIR, UNPACKED_MODELS_DIR, SEPARATION_OUTPUT_DIR,
@@ -34,7 +130,27 @@ for dir_path in [OUTPUT_DIR, UNPACKED_MODELS_DIR, SEPARATION_OUTPUT_DIR,
 
 # ====== טעינת מודלים מקומיים ======
 local_models = {}
-youtube_audio_cache = {}
+model_registry = ModelRegistry(UNPACKED_MODELS_DIR)
+media_index = MediaIndex(MEDIA_INDEX_PATH)
+media_evictor = MediaCacheEvictor(
+    media_index,
+    MEDIA_CACHE_MAX_BYTES,
+    max_age=MEDIA_CACHE_MAX_AGE,
+    policy=MEDIA_CACHE_POLICY,
+    interval=MEDIA_CACHE_EVICT_INTERVAL
+)
+rvc_pool = None
+separation_pool = None
+scheduler = JobScheduler(STAGE_LIMITS, max_active=JOB_MAX_ACTIVE, reserved=JOB_PREVIEW_RESERVED)
+# בקשות זהות שמגיעות יחד חולקות הורדה/הפרדה/המרה/רינדור אחד
+inflight = SingleFlight()
+# מדידות זמן/CPU/זיכרון/I/O לכל שלב, לכל משימה ובהיסטוגרמות מצטברות
+stage_metrics = MetricsCollector()
+batches = OrderedDict()
+batches_lock = threading.Lock()
+BATCH_HISTORY = 50
+stem_cache = ContentCache(STEM_CACHE_DIR, STEM_CACHE_MAX_BYTES, "Stem Cache")
+rvc_cache = ContentCache(RVC_CACHE_DIR, RVC_CACHE_MAX_BYTES, "RVC Cache")
 
 def load_local_models_config():
     """טוען את קובץ ההגדרות של המודלים המקומיים"""
@@ -43,6 +159,8 @@ def load_local_models_config():
         with open('local_models.json', 'r', encoding='utf-8') as f:
             local_models = json.load(f)
         print(f"Loaded {len(local_models)} models")
+        # חילוץ, hash וקריאת המטא-דאטה של כל מודל פעם אחת - הבחירה בזמן עיבוד לא עולה כלום
+        model_registry.load(local_models)
         return True
     except FileNotFoundError:
         print("⚠️ local_models.json not found")
@@ -53,24 +171,16 @@ def load_local_models_config():
         return False
 
 def load_youtube_cache():
-    """טוען את קאש היוטיוב מהדיסק"""
-    global youtube_audio_cache
+    """טוען את אינדקס הקאש, ומעביר אליו את קובץ ה-JSON הישן אם הוא קיים"""
     try:
         if os.path.exists(YOUTUBE_AUDIO_CACHE_PATH):
-            with open(YOUTUBE_AUDIO_CACHE_PATH, 'r', encoding='utf-8') as f:
-                youtube_audio_cache = json.load(f)
-            print(f"Loaded {len(youtube_audio_cache)} cached files")
+            imported = media_index.import_json(YOUTUBE_AUDIO_CACHE_PATH)
+            os.replace(YOUTUBE_AUDIO_CACHE_PATH, f"{YOUTUBE_AUDIO_CACHE_PATH}.migrated")
+            if imported:
+                print(f"Migrated {imported} entries from youtube_audio_cache.json")
+        print(f"Loaded {media_index.count()} cached files")
     except Exception as e:
         print(f"⚠️ Cannot load cache: {e}")
-        youtube_audio_cache = {}
-
-def save_youtube_cache():
-    """שומר את קאש היוטיוב לדיסק"""
-    try:
-        with open(YOUTUBE_AUDIO_CACHE_PATH, 'w', encoding='utf-8') as f:
-            json.dump(youtube_audio_cache, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"⚠️ Cannot save cache: {e}")
 
 def search_youtube(query):
     """מחפש שיר ביוטיוב ומחזיר 3 תוצאות ראשונות"""
@@ -124,72 +234,39 @@ def search_youtube(query):
         print(f"❌ Search error: {e}")
         raise
 
-def prepare_model_files(model_name):
-    """מכין את קבצי המודל (חילוץ מ-ZIP אם צריך)"""
-    global local_models
-
-    if model_name not in local_models:
-        raise Exception(f"מודל '{model_name}' not found")
-
-    model_config = local_models[model_name]
-    zip_path = model_config['path']
-    pitch = model_config.get('pitch', 0)
-    target_dir = os.path.join(UNPACKED_MODELS_DIR, model_name)
-
-    if not os.path.exists(target_dir):
-        print(f"📦 Extracting model '{model_name}'...")
-        os.makedirs(target_dir)
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(target_dir)
-
-    pth_file = next((os.path.join(target_dir, f) for f in os.listdir(target_dir)
-                     if f.endswith(".pth")), None)
-    if not pth_file:
-        raise Exception(f"not found קובץ .pth למודל '{model_name}'")
-
-    return pth_file, pitch
-
-def download_youtube_audio(url):
-    """מוריד אודיו מיוטיוב"""
-    global youtube_audio_cache
+def get_cached_audio(url):
+    """מחפש את השיר בקאש לפי מזהה הסרטון, בלי לגשת לרשת; מחזיר (נתיב, כותרת) או None"""
+    entry = media_index.get(media_key(url))
+    if entry is None:
+        return None
+    return entry['path'], entry['title']
 
+def download_youtube_audio(url, on_progress=None):
+    """מוריד אודיו מיוטיוב - קריאה אחת ל-yt-dlp שמחזירה גם מטא-דאטה, בלי המרה ל-MP3"""
     try:
-        cmd_title = ['yt-dlp', '--get-title', '--extractor-args', 'youtube:player_client=android', url]
-        result = subprocess.run(cmd_title, capture_output=True, text=True, encoding='utf-8', errors='replace')
-
-        if result.returncode != 0:
-            raise Exception(f"Failed to get video title: {result.stderr}")
-
-        video_title = result.stdout.strip()
-        safe_title = "".join(c for c in video_title if c.isalnum() or c in (' ', '-', '_')).strip()
-        safe_title = safe_title[:100]
-
-        cached_path = os.path.join(MEDIA_CACHE_DIR, f"{safe_title}.mp3")
-
-        if url in youtube_audio_cache and os.path.exists(youtube_audio_cache[url]):
+        cached = get_cached_audio(url)
+        if cached is not None:
             print(f"✅ [YouTube Audio Cache] HIT")
-            return youtube_audio_cache[url], video_title
-
-        if os.path.exists(cached_path):
-            print(f"✅ [YouTube Audio Cache] HIT from disk")
-            youtube_audio_cache[url] = cached_path
-            save_youtube_cache()
-            return cached_path, video_title
+            return cached
 
         print(f"[YouTube Cache] MISS. Starting download...")
 
         cookies_path = os.path.join(BASE_DIR, 'cookies.txt')
 
+        # הזרם המקורי (m4a/opus) נשמר כמו שהוא - ההפרדה יודעת לפענח אותו
         cmd = [
             'yt-dlp',
             url,
             '-f', 'bestaudio[ext=m4a]/bestaudio/best',
-            '-x',
-            '--audio-format', 'mp3',
-            '--audio-quality', '0',
             '--no-playlist',
             '--extractor-args', 'youtube:player_client=android',
-            '-o', cached_path
+            '--concurrent-fragments', str(YTDLP_CONCURRENT_FRAGMENTS),
+            '--no-simulate',
+            '--progress',
+            '--newline',
+            '--progress-template', 'download:[progress] %(progress.{downloaded_bytes,total_bytes,total_bytes_estimate,eta})j',
+            '--print', 'after_move:%(.{id,title,filepath})j',
+            '-o', os.path.join(MEDIA_CACHE_DIR, '%(id)s.%(ext)s')
         ]
 
         if os.path.exists(cookies_path):
@@ -206,12 +283,33 @@ def download_youtube_audio(url):
             bufsize=1
         )
 
+        info = None
         while True:
             line = process.stdout.readline()
             if not line and process.poll() is not None:
                 break
             if line:
                 line = line.strip()
+                if line.startswith('{'):
+                    try:
+                        info = json.loads(line)
+                        continue
+                    except json.JSONDecodeError:
+                        pass
+                if line.startswith('[progress] '):
+                    try:
+                        status = json.loads(line[len('[progress] '):])
+                    except json.JSONDecodeError:
+                        continue
+                    total = status.get('total_bytes') or status.get('total_bytes_estimate')
+                    if on_progress and total:
+                        on_progress({
+                            'event': 'progress',
+                            'stage': 'download',
+                            'fraction': min(1.0, (status.get('downloaded_bytes') or 0) / total),
+                            'eta': status.get('eta')
+                        })
+                    continue
                 print(f"[yt-dlp] {line}")
 
         return_code = process.wait()
@@ -219,25 +317,179 @@ def download_youtube_audio(url):
         if return_code != 0:
             raise Exception(f"Download failed with code {return_code}")
 
-        if not os.path.exists(cached_path):
+        if not info or not info.get('filepath') or not os.path.exists(info['filepath']):
             raise Exception("Downloaded file not found")
 
-        youtube_audio_cache[url] = cached_path
-        save_youtube_cache()
+        cached_path = info['filepath']
+        video_title = info.get('title') or info.get('id')
+
+        media_index.put(media_key(url), cached_path, video_title)
+        media_evictor.trigger()
 
-        print(f"✅ Downloaded and cached: {safe_title}.mp3")
+        print(f"✅ Downloaded and cached: {os.path.basename(cached_path)}")
         return cached_path, video_title
 
     except Exception as e:
         raise
 
-def run_separation(input_path, model_filename='UVR_MDXNET_KARA_2.onnx',
-                   vocals_keyword='vocals', instrumental_keyword='instrumental'):
-    """מפריד vocals מ-instrumental"""
+def time_window(start=None, duration=None):
+    """(start, duration) כשהתבקש חלון, או () לשיר כולו - נכנס כך גם למפתחות המטמון"""
+    if not start and not duration:
+        return ()
+    return (float(start or 0), float(duration) if duration else None)
+
+def format_clock(seconds):
+    """1m30s - לשמות קבצים (בלי נקודתיים)"""
+    seconds = int(round(seconds))
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+def output_suffix(label, start=None, duration=None):
+    """סיומת שם הקובץ; חלון זמן נכנס לשם כדי שקטע לא ידרוס רינדור של השיר כולו"""
+    window = time_window(start, duration)
+    if not window:
+        return label
+    start, duration = window
+    end = format_clock(start + duration) if duration else 'end'
+    return f"{label} {format_clock(start)}-{end}"
+
+def window_args(start=None, duration=None):
+    """הפרמטרים --start/--duration לסקריפטים בהרצה חד-פעמית"""
+    args = []
+    if start:
+        args.extend(["--start", str(start)])
+    if duration:
+        args.extend(["--duration", str(duration)])
+    return args
+
+def report_progress(job, stage, fraction=None, eta=None, step=None):
+    """שומר את התקדמות השלב במשימה, יחד עם ההתקדמות הכוללת לפי PROGRESS_WEIGHTS"""
+    if job is None:
+        return
+    overall = 0.0
+    for name, weight in PROGRESS_WEIGHTS.items():
+        if name == stage:
+            overall += weight * (fraction or 0)
+            break
+        overall += weight
+    job.report(stage=stage, step=step, fraction=fraction, eta=eta, overall=round(overall, 4))
+
+def progress_relay(job):
+    """callback לאירועים מתהליך-בן: רק אירועי progress מועברים למשימה"""
+    if job is None:
+        return None
+
+    def relay(event):
+        if event.get('event') == 'progress':
+            report_progress(job, event['stage'], event.get('fraction'), event.get('eta'), event.get('step'))
+
+    return relay
+
+def fanout_progress(job, count):
+    """callback התקדמות לכל קול במשימת fan-out; השלב מדווח לפי הממוצע של כל הקולות"""
+    if job is None:
+        return [None] * count
+    fractions = [0.0] * count
+    etas = [None] * count
+    lock = threading.Lock()
+
+    def relay_for(index):
+        def relay(event):
+            if event.get('event') != 'progress':
+                return
+            with lock:
+                fractions[index] = event.get('fraction') or fractions[index]
+                etas[index] = event.get('eta')
+                finished = sum(1 for fraction in fractions if fraction >= 1)
+                known = [eta for eta in etas if eta is not None]
+                report_progress(job, 'rvc', sum(fractions) / count, max(known) if known else None,
+                                step=f"{finished}/{count} voices")
+        return relay
+
+    return [relay_for(index) for index in range(count)]
+
+def fetch_audio(url, job=None):
+    """מחזיר (נתיב, כותרת) מהקאש, או מוריד - הורדות מקבילות של אותו סרטון מאוחדות
+
+    הקובץ מוצמד ב-media_index עד media_index.release(media_key(url)), כדי שהפינוי לא ימחק
+    אותו באמצע משימה ארוכה.
+    """
+    media_index.pin(media_key(url))
     try:
-        output_dir = os.path.join(SEPARATION_OUTPUT_DIR, str(uuid.uuid4()))
-        os.makedirs(output_dir)
+        return _fetch_audio(url, job)
+    except BaseException:
+        media_index.release(media_key(url))
+        raise
+
+def _fetch_audio(url, job=None):
+    with stage_metrics.measure('download', job) as stage:
+        cached = get_cached_audio(url)
+        if cached is not None:
+            print(f"✅ [YouTube Audio Cache] HIT")
+            stage['cache'] = 'hit'
+            return cached
+
+        def download():
+            with scheduler.stage('download', job):
+                return download_youtube_audio(url, on_progress=progress_relay(job))
+
+        result, shared = inflight.do('download', media_key(url), download, job)
+        stage['cache'] = 'shared' if shared else 'miss'
+        return result
+
+def start_separation_pool():
+    """מפעיל את שירות ההפרדה הקבוע (אם לא בוטל)"""
+    global separation_pool
+
+    if SEPARATION_WORKERS <= 0:
+        print("Separation service disabled, using one-shot separations")
+        return None
+
+    separation_pool = WorkerPool(
+        [sys.executable, "your_separation_script.py", "--serve",
+         "--max_models", str(SEPARATION_MAX_MODELS)],
+        SEPARATION_WORKERS,
+        "[Separation]"
+    )
+    separation_pool.start()
+    atexit.register(separation_pool.shutdown)
+    print(f"Started {SEPARATION_WORKERS} separation worker(s)")
+    return separation_pool
+
+def run_separation(input_path, model_filename='UVR_MDXNET_KARA_2.onnx',
+                   vocals_keyword='vocals', instrumental_keyword='instrumental', on_progress=None,
+                   start=None, duration=None):
+    """מפריד vocals מ-instrumental; on_progress מקבל את אירועי ה-progress של התהליך
+
+    start/duration - מפריד רק את החלון הזה (ffmpeg עם seek בתהליך ההפרדה).
+    """
+    output_dir = os.path.join(SEPARATION_OUTPUT_DIR, str(uuid.uuid4()))
+    os.makedirs(output_dir)
 
+    if separation_pool is not None:
+        try:
+            result = separation_pool.submit({
+                "input_path": input_path,
+                "output_dir": output_dir,
+                "model_filename": model_filename,
+                "vocals_keyword": vocals_keyword,
+                "instrumental_keyword": instrumental_keyword,
+                "start": start,
+                "duration": duration
+            }, on_event=on_progress)
+        except Exception:
+            remove_dirs([output_dir])
+            raise
+        paths_result = {}
+        for key, path in result.items():
+            if not key.endswith('_path'):
+                continue
+            if not os.path.isabs(path):
+                path = os.path.join(output_dir, os.path.basename(path))
+            paths_result[key] = path
+        paths_result['metrics'] = result.get('metrics', [])
+        return paths_result
+
+    try:
         command = [
             sys.executable, "your_separation_script.py",
             "--input_path", input_path,
@@ -246,6 +498,7 @@ def run_separation(input_path, model_filename='UVR_MDXNET_KARA_2.onnx',
             "--vocals_keyword", vocals_keyword,
             "--instrumental_keyword", instrumental_keyword
         ]
+        command.extend(window_args(start, duration))
 
         process = subprocess.Popen(
             command,
@@ -267,12 +520,19 @@ def run_separation(input_path, model_filename='UVR_MDXNET_KARA_2.onnx',
                 break
             if line:
                 line = line.strip()
+                if line.startswith('{"event": "progress"'):
+                    if on_progress:
+                        on_progress(json.loads(line))
+                    continue
                 print(f"[Separation] {line}")
                 output_lines.append(line)
 
                 try:
                     paths = json.loads(line)
-                    corrected_paths = {}
+                    if not isinstance(paths, dict):
+                        continue
+                    metrics = paths.pop('metrics', [])
+                    corrected_paths = {'metrics': metrics}
                     for key, path in paths.items():
                         if not os.path.isabs(path):
                             corrected_paths[key] = os.path.join(output_dir, os.path.basename(path))
@@ -293,19 +553,143 @@ def run_separation(input_path, model_filename='UVR_MDXNET_KARA_2.onnx',
         return paths_result
 
     except Exception as e:
+        remove_dirs([output_dir])
         raise
 
-def run_rvc_conversion(input_path, model_pth_path, pitch):
-    """מריץ המרת קול עם RVC"""
+def separate_stems(source_audio, model_filename, job=None,
+                   vocals_keyword='vocals', instrumental_keyword='instrumental', start=None, duration=None):
+    """מפריד שיר דרך מטמון ה-stems; מחזיר (נתיבים, מפתח) - יש לשחרר את המפתח בסיום
+
+    עם start/duration ה-stems מכסים רק את החלון. אם ה-stems של כל השיר כבר במטמון הם מוחזרים
+    במקום הפרדה חדשה, ו-paths['window'] מסמן שהשלבים הבאים צריכים לקרוא רק את החלון.
+    """
+    worker_metrics = []
+    window = time_window(start, duration)
+
+    def separate():
+        with scheduler.stage('separation', job):
+            separation_paths = run_separation(
+                source_audio,
+                model_filename=model_filename,
+                vocals_keyword=vocals_keyword,
+                instrumental_keyword=instrumental_keyword,
+                on_progress=progress_relay(job),
+                start=start,
+                duration=duration
+            )
+        worker_metrics.extend(separation_paths.get('metrics', []))
+        stored = stem_cache.put(stem_key, {
+            'vocals': separation_paths['vocals_path'],
+            'instrumental': separation_paths['instrumental_path']
+        })
+        remove_dirs([os.path.dirname(separation_paths['vocals_path'])])
+        return stored
+
+    with stage_metrics.measure('separation', job, cache='hit', worker=worker_metrics) as stage:
+        key_parts = ('separation', file_sha256(source_audio), model_filename, vocals_keyword, instrumental_keyword)
+        stem_key = make_key(*key_parts, *window)
+        if window:
+            full = stem_cache.get(make_key(*key_parts))
+            if full is not None:
+                print(f"✅ [Stem Cache] HIT (full song, reading only the window)")
+                return ({'vocals_path': full['vocals'], 'instrumental_path': full['instrumental'],
+                         'window': window}, make_key(*key_parts))
+        while True:
+            cached = stem_cache.get(stem_key)
+            if cached is not None:
+                print(f"✅ [Stem Cache] HIT")
+                break
+            print(f"[Stem Cache] MISS. Separating...")
+            cached, shared = inflight.do('separation', stem_key, separate, job)
+            # עוקב לוקח הצמדה משלו בסיבוב הבא דרך get
+            if not shared:
+                stage['cache'] = 'miss'
+                break
+            stage['cache'] = 'shared'
+
+    return {'vocals_path': cached['vocals'], 'instrumental_path': cached['instrumental'], 'window': ()}, stem_key
+
+def start_rvc_pool():
+    """מפעיל את מאגר ה-workers של RVC (אם לא בוטל)"""
+    global rvc_pool
+
+    if RVC_WORKERS <= 0:
+        print("RVC worker pool disabled, using one-shot conversions")
+        return None
+
+    rvc_pool = WorkerPool(
+        [sys.executable, "your_rvc_script_new.py", "--worker",
+         "--max_models", str(RVC_WORKER_MAX_MODELS),
+         "--cpu_processes", str(RVC_CPU_PROCESSES),
+         "--cpu_mode", RVC_CPU_MODE,
+         "--batch_size", str(RVC_BATCH_SIZE),
+         "--batch_wait_ms", str(RVC_BATCH_WAIT_MS),
+         "--max_jobs", str(RVC_WORKER_JOBS),
+         "--feature_cache_dir", FEATURE_CACHE_DIR,
+         "--feature_cache_max_gb", str(RVC_FEATURE_CACHE_GB)],
+        RVC_WORKERS,
+        "[RVC]",
+        concurrency=RVC_WORKER_JOBS
+    )
+    rvc_pool.start()
+    atexit.register(rvc_pool.shutdown)
+    print(f"Started {RVC_WORKERS} RVC worker(s)")
+    return rvc_pool
+
+def run_rvc_conversion(input_path, model, pitch,
+                       index_rate=0.75, protect=0.33, f0_method='rmvpe', on_progress=None,
+                       start=None, duration=None):
+    """מריץ המרת קול עם RVC עם מודל מה-registry; מחזיר (נתיב, מדידות ה-worker)
+
+    start/duration - ממיר רק את החלון הזה מתוך קובץ הקלט.
+    """
+    output_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}.wav")
+
+    if rvc_pool is not None:
+        try:
+            result = rvc_pool.submit({
+                "input_path": input_path,
+                "model_path": model.pth_path,
+                "model_hash": model.pth_sha256,
+                "index_path": model.index_path,
+                "output_path": output_path,
+                "pitch": pitch,
+                "index_rate": index_rate,
+                "protect": protect,
+                "f0_method": f0_method,
+                "chunk_seconds": RVC_CHUNK_SECONDS,
+                "skip_silence": RVC_SKIP_SILENCE,
+                "start": start,
+                "duration": duration
+            }, on_event=on_progress)
+        except Exception:
+            # worker שנפל או בוטל באמצע עשוי להשאיר WAV חלקי
+            remove_files([output_path])
+            raise
+        final_output_path = result.get("output_path", output_path)
+        if not os.path.exists(final_output_path):
+            raise Exception("RVC did not create valid output file")
+        return final_output_path, result.get("metrics", [])
+
     try:
-        output_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}.wav")
         command = [
             sys.executable, "your_rvc_script_new.py",
             "--input_path", input_path,
-            "--model_path", model_pth_path,
+            "--model_path", model.pth_path,
             "--output_path", output_path,
-            "--pitch", str(pitch)
+            "--pitch", str(pitch),
+            "--index_rate", str(index_rate),
+            "--protect", str(protect),
+            "--f0_method", f0_method,
+            "--chunk_seconds", str(RVC_CHUNK_SECONDS),
+            "--feature_cache_dir", FEATURE_CACHE_DIR,
+            "--feature_cache_max_gb", str(RVC_FEATURE_CACHE_GB)
         ]
+        if RVC_SKIP_SILENCE:
+            command.append("--skip_silence")
+        if model.index_path:
+            command.extend(["--index_path", model.index_path])
+        command.extend(window_args(start, duration))
 
         process = subprocess.Popen(
             command,
@@ -319,6 +703,7 @@ def run_rvc_conversion(input_path, model_pth_path, pitch):
         )
 
         output_lines = []
+        metrics = []
 
         while True:
             line = process.stdout.readline()
@@ -326,6 +711,13 @@ def run_rvc_conversion(input_path, model_pth_path, pitch):
                 break
             if line:
                 line = line.strip()
+                if line.startswith('{"event": "metrics"'):
+                    metrics = json.loads(line).get('stages', [])
+                    continue
+                if line.startswith('{"event": "progress"'):
+                    if on_progress:
+                        on_progress(json.loads(line))
+                    continue
                 print(f"[RVC] {line}")
                 output_lines.append(line)
 
@@ -338,11 +730,55 @@ def run_rvc_conversion(input_path, model_pth_path, pitch):
         if not os.path.exists(final_output_path):
             raise Exception("RVC did not create valid output file")
 
-        return final_output_path
+        return final_output_path, metrics
 
-    except Exception as e:
+    except Exception:
+        remove_files([output_path])
         raise
 
+def convert_vocals(vocals_path, model, pitch, job=None,
+                   index_rate=0.75, protect=0.33, f0_method='rmvpe', window=(), on_progress=None):
+    """ממיר vocals דרך מטמון ה-RVC; מחזיר (נתיב, מפתח) - יש לשחרר את המפתח בסיום
+
+    window - (start, duration) כשה-vocals הם של כל השיר וצריך להמיר רק חלון מתוכם.
+    on_progress - מקבל את אירועי ההתקדמות של ה-worker (ברירת המחדל: ישירות למשימה).
+    """
+    worker_metrics = []
+    start, duration = window or (None, None)
+
+    def convert():
+        with scheduler.stage('rvc', job):
+            output_path, metrics = run_rvc_conversion(
+                vocals_path,
+                model,
+                pitch,
+                index_rate=index_rate,
+                protect=protect,
+                f0_method=f0_method,
+                on_progress=on_progress or progress_relay(job),
+                start=start,
+                duration=duration
+            )
+        worker_metrics.extend(metrics)
+        return rvc_cache.put(rvc_key, {'vocals': output_path})
+
+    with stage_metrics.measure('rvc', job, cache='hit', worker=worker_metrics) as stage:
+        rvc_key = make_key('rvc', file_sha256(vocals_path), model.pth_sha256,
+                           pitch, index_rate, protect, f0_method, RVC_CHUNK_SECONDS, RVC_SKIP_SILENCE, *window)
+        while True:
+            cached = rvc_cache.get(rvc_key)
+            if cached is not None:
+                print(f"✅ [RVC Cache] HIT")
+                break
+            print(f"[RVC Cache] MISS. Converting...")
+            cached, shared = inflight.do('rvc', rvc_key, convert, job)
+            if not shared:
+                stage['cache'] = 'miss'
+                break
+            stage['cache'] = 'shared'
+
+    return cached['vocals'], rvc_key
+
 def merge_audio(input_paths, output_path):
     """מאחד מספר קבצי אודיו"""
     try:
@@ -371,11 +807,7 @@ def apply_speed_pitch(input_path, speed=1.07, pitch_shift=1.03):
     try:
         output_path = os.path.join(OUTPUT_DIR, f"final_modified_{uuid.uuid4()}.mp3")
 
-        filters = []
-        if speed and speed != 1.0:
-            filters.append(f"atempo={speed}")
-        if pitch_shift and pitch_shift != 1.0:
-            filters.append(f"asetrate=44100*{pitch_shift},aresample=44100")
+        filters = build_speed_pitch_filters(speed, pitch_shift)
 
         if not filters:
             shutil.copy(input_path, output_path)
@@ -398,19 +830,178 @@ def apply_speed_pitch(input_path, speed=1.07, pitch_shift=1.03):
     except Exception as e:
         raise
 
-def process_song(youtube_url, heavy_processing=False):
-    """פונקציה ראשית לעיבוד שיר"""
+def build_speed_pitch_filters(speed=1.07, pitch_shift=1.03, sample_rate=44100):
+    """בונה את שרשרת הפילטרים של שינוי מהירות ופיץ'"""
+    filters = []
+    if speed and speed != 1.0:
+        filters.append(f"atempo={speed}")
+    if pitch_shift and pitch_shift != 1.0:
+        filters.append(f"asetrate={sample_rate}*{pitch_shift},aresample={sample_rate}")
+    return filters
+
+def render_final_mix(input_paths, output_path, speed=1.07, pitch_shift=1.03, input_windows=None):
+    """מאחד, משנה מהירות ופיץ' ומקודד ל-MP3 במעבר ffmpeg אחד
+
+    input_windows - (start, duration) או () לכל קלט; ffmpeg קורא רק את החלון (seek בכניסה).
+    """
+    command = ['ffmpeg', '-y']
+
+    for path, window in zip(input_paths, input_windows or [()] * len(input_paths)):
+        if window:
+            start, duration = window
+            if start:
+                command.extend(['-ss', f"{start:.3f}"])
+            if duration:
+                command.extend(['-t', f"{duration:.3f}"])
+        command.extend(['-i', path])
+
+    amix_inputs = ''.join([f'[{i}:a]' for i in range(len(input_paths))])
+    # aresample קבוע לפני asetrate כדי שחישוב הפיץ' יתבסס על 44100
+    chain = [f'amix=inputs={len(input_paths)}:duration=longest', 'aresample=44100']
+    chain.extend(build_speed_pitch_filters(speed, pitch_shift))
+    filter_complex = f"{amix_inputs}{','.join(chain)}"
+
+    command.extend(['-filter_complex', filter_complex, '-c:a', 'libmp3lame', '-q:a', '2', output_path])
+
+    result = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', errors='replace')
+
+    if result.returncode != 0:
+        raise Exception(f"Final render failed: {result.stderr}")
+
+    return output_path
+
+def render_final_mix_in_memory(vocals_path, instrumental_path, output_path,
+                               speed=1.07, pitch_shift=1.03, reference_vocals_path=None, window=()):
+    """מיקס בזיכרון: קריאת PCM ישירה, דגימה מחדש, התאמת עוצמה וחיבור ב-NumPy, וקידוד ffmpeg יחיד
+
+    הכל עובר בבלוקים של audio_buffers.BLOCK_SECONDS אל ה-stdin של ffmpeg, כך שהזיכרון לא גדל
+    עם אורך השיר. window - (start, duration) כשה-instrumental וה-reference הם של כל השיר; נקרא רק החלון.
+    """
+    sample_rate = 44100
+    start, duration = window or (None, None)
+
+    # הכותרות נבדקות לפני הקידוד, כך שקובץ לא קריא חוזר למיקס של ffmpeg לפני שנכתב פלט
+    _, vocals_sr, vocals_channels = audio_buffers.audio_info(vocals_path)
+    channels = max(vocals_channels, audio_buffers.audio_info(instrumental_path)[2])
+
+    gain = 1.0
+    if reference_vocals_path:
+        reference_sr = audio_buffers.audio_info(reference_vocals_path)[1]
+        gain = audio_buffers.matching_gain(
+            audio_buffers.blocks_rms(audio_buffers.read_blocks(vocals_path, vocals_sr)),
+            audio_buffers.blocks_rms(audio_buffers.read_blocks(reference_vocals_path, reference_sr,
+                                                               start=start, duration=duration))
+        )
+
+    mixed = audio_buffers.mix_blocks(
+        [audio_buffers.read_blocks(vocals_path, sample_rate),
+         audio_buffers.read_blocks(instrumental_path, sample_rate, start=start, duration=duration)],
+        channels, int(audio_buffers.BLOCK_SECONDS * sample_rate), gains=[gain, 1.0]
+    )
+    filters = build_speed_pitch_filters(speed, pitch_shift, sample_rate)
+    return audio_buffers.encode_mp3(mixed, sample_rate, channels, output_path, filters)
+
+def preview_length(seconds=None):
+    """אורך ה-preview בשניות, בתוך PREVIEW_SECONDS_RANGE"""
+    low, high = PREVIEW_SECONDS_RANGE
+    return min(high, max(low, float(seconds or PREVIEW_SECONDS)))
+
+def find_preview_start(source_audio, seconds):
+    """השנייה שבה מתחיל ה-preview: הפזמון הראשון לפי אנרגיה, או תחילת השיר"""
+    start = 0.0
+    if audio_buffers is not None:
+        try:
+            buffer = audio_buffers.decode_mono(source_audio, PREVIEW_ANALYSIS_SR, PREVIEW_ANALYSIS_SECONDS)
+            start = audio_buffers.find_excerpt(buffer, PREVIEW_ANALYSIS_SR, seconds)
+        except Exception as e:
+            print(f"⚠️ Chorus detection failed, previewing from the start: {e}")
+
+    print(f"✅ Preview excerpt: {start:.0f}s - {start + seconds:.0f}s")
+    return start
+
+def render_song(new_vocals_path, vocals_path, instrumental_path, stem_key, rvc_key, video_title, suffix,
+                temp_files, job=None, trim=(), report=True):
+    """מיקס של ה-vocals המומרים עם ה-instrumental וקידוד ל-<title> - <suffix>.mp3; מחזיר את הנתיב
+
+    רינדור זהה שכבר רץ במשימה אחרת משותף; report=False כשההתקדמות מדווחת ע"י הקורא.
+    """
+    in_memory = bool(IN_MEMORY_MIX and audio_buffers is not None)
+    render_key = make_key('render', stem_key, rvc_key, 1.07, 1.03, in_memory, video_title, suffix, *trim)
+
+    def render():
+        temp_output = os.path.join(OUTPUT_DIR, f"final_modified_{uuid.uuid4()}.mp3")
+        temp_files.append(temp_output)
+        with scheduler.stage('ffmpeg', job):
+            if report:
+                report_progress(job, 'ffmpeg', 0.0, step='mix')
+            mixed = False
+            if in_memory:
+                try:
+                    render_final_mix_in_memory(
+                        new_vocals_path,
+                        instrumental_path,
+                        temp_output,
+                        speed=1.07,
+                        pitch_shift=1.03,
+                        reference_vocals_path=vocals_path,
+                        window=trim
+                    )
+                    mixed = True
+                except audio_buffers.UnreadableAudio as e:
+                    # stem ש-soundfile לא קורא (פורמט/קידוד לא נתמך) - ffmpeg מפענח כל פורמט
+                    print(f"⚠️ In-memory mix failed, falling back to ffmpeg: {e}")
+            if not mixed:
+                render_final_mix(
+                    [new_vocals_path, instrumental_path],
+                    temp_output,
+                    speed=1.07,
+                    pitch_shift=1.03,
+                    input_windows=[(), trim]
+                )
+
+        # Rename using video title
+        if video_title:
+            safe_name = "".join(c for c in video_title if c.isalnum() or c in (' ', '-', '_')).strip()
+            safe_name = f"{safe_name} - {suffix}"
+            final_output = os.path.join(OUTPUT_DIR, f"{safe_name}.mp3")
+            shutil.move(temp_output, final_output)
+            return final_output
+        return temp_output
+
+    with stage_metrics.measure('render', job) as stage:
+        final_output, shared = inflight.do('ffmpeg', render_key, render, job)
+        stage['cache'] = 'shared' if shared else 'miss'
+    return final_output
+
+def process_song(youtube_url, heavy_processing=False, job=None, preview=False, preview_seconds=None,
+                 start=None, duration=None):
+    """פונקציה ראשית לעיבוד שיר; preview מעבד רק קטע קצר בהגדרות מהירות
+
+    start/duration - מעבד רק את החלון הזה מהשיר (ההפרדה וה-RVC עובדים רק עליו).
+    מחזיר (נתיב ה-MP3, כותרת, סיומת שם הקובץ).
+    """
     temp_files = []
+    cache_leases = []
     video_title = None
 
     try:
         print("Processing...")
 
         # שלב 1: הורדת אודיו
-        source_audio, video_title = download_youtube_audio(youtube_url)
+        source_audio, video_title = fetch_audio(youtube_url, job)
+        cache_leases.append((media_index, media_key(youtube_url)))
 
         # בחירת פרמטרים
-        if heavy_processing:
+        rvc_options = {}
+        if preview:
+            model_name = 'האק'
+            separation_model = PREVIEW_SEPARATION_MODEL
+            rvc_options = {'index_rate': PREVIEW_INDEX_RATE, 'protect': PREVIEW_PROTECT,
+                           'f0_method': PREVIEW_F0_METHOD}
+            duration = preview_length(preview_seconds)
+            with stage_metrics.measure('excerpt', job):
+                start = find_preview_start(source_audio, duration)
+        elif heavy_processing:
             model_name = 'האק'
             separation_model = 'bs_roformer_vocals_gabox.ckpt'
         else:
@@ -419,55 +1010,27 @@ def process_song(youtube_url, heavy_processing=False):
 
         # שלב 2: הפרדת vocals מ-instrumental
         print("Processing audio...")
-        separation_paths = run_separation(
-            source_audio,
-            model_filename=separation_model,
-            vocals_keyword='vocals',
-            instrumental_keyword='instrumental'
-        )
+        separation_paths, stem_key = separate_stems(source_audio, separation_model, job, start=start, duration=duration)
+        cache_leases.append((stem_cache, stem_key))
 
         vocals_path = separation_paths['vocals_path']
         instrumental_path = separation_paths['instrumental_path']
-        temp_files.extend([vocals_path, instrumental_path])
+        # חלון שעוד לא נחתך - כשה-stems של כל השיר הגיעו מהמטמון
+        trim = separation_paths['window']
 
-        # שלב 3: הכנת RVC Model
-        print("Loading model...")
-        model_pth_path, model_pitch = prepare_model_files(model_name)
+        # שלב 3: מודל ה-RVC מה-registry (כבר מחולץ ומאומת)
+        model = model_registry.get(model_name)
 
         # שלב 4: המרת ה-vocals עם RVC
         print("Processing vocals...")
-        new_vocals_path = run_rvc_conversion(
-            vocals_path,
-            model_pth_path,
-            pitch=0
-        )
-        temp_files.append(new_vocals_path)
+        new_vocals_path, rvc_key = convert_vocals(vocals_path, model, 0, job, window=trim, **rvc_options)
+        cache_leases.append((rvc_cache, rvc_key))
 
-        # שלב 5: איחוד vocals חדש עם instrumental
+        # שלב 5: איחוד vocals חדש עם instrumental + שינוי מהירות ופיץ' בקידוד אחד
         print("Merging audio...")
-        merged_path = os.path.join(OUTPUT_DIR, f"merged_{uuid.uuid4()}.mp3")
-        merge_audio(
-            [new_vocals_path, instrumental_path],
-            merged_path
-        )
-        temp_files.append(merged_path)
-
-        # שלב 6: החלת שינוי מהירות ופיץ'
-        print("Applying modifications...")
-        temp_output = apply_speed_pitch(
-            merged_path,
-            speed=1.07,
-            pitch_shift=1.03
-        )
-
-        # Rename using video title
-        if video_title:
-            safe_name = "".join(c for c in video_title if c.isalnum() or c in (' ', '-', '_')).strip()
-            safe_name = f"{safe_name} - processed"
-            final_output = os.path.join(OUTPUT_DIR, f"{safe_name}.mp3")
-            shutil.move(temp_output, final_output)
-        else:
-            final_output = temp_output
+        suffix = output_suffix('preview' if preview else 'processed', start, duration)
+        final_output = render_song(new_vocals_path, vocals_path, instrumental_path, stem_key, rvc_key,
+                                   video_title, suffix, temp_files, job, trim)
 
         # ניקוי temp files והתיקיות
         for temp_file in temp_files:
@@ -477,26 +1040,9 @@ def process_song(youtube_url, heavy_processing=False):
             except Exception as e:
                 print(f"⚠️ Cannot delete temp file: {temp_file} - {e}")
 
-        # ניקוי תיקיות ריקות ב-separation_outputs
-        try:
-            for folder in os.listdir(SEPARATION_OUTPUT_DIR):
-                folder_path = os.path.join(SEPARATION_OUTPUT_DIR, folder)
-                if os.path.isdir(folder_path):
-                    try:
-                        # מחיקת התיקייה אם היא ריקה
-                        if not os.listdir(folder_path):
-                            os.rmdir(folder_path)
-                        else:
-                            # מחיקת כל הקבצים בתיקייה ואז את התיקייה
-                            shutil.rmtree(folder_path)
-                    except Exception as e:
-                        print(f"⚠️ Cannot delete folder: {folder_path} - {e}")
-        except Exception as e:
-            print(f"⚠️ Cannot clean separation folders: {e}")
-
         print("✅ Complete!")
 
-        return final_output, video_title
+        return final_output, video_title, suffix
 
     except Exception as e:
         # ניקוי בשגיאה
@@ -507,9 +1053,366 @@ def process_song(youtube_url, heavy_processing=False):
             except:
                 pass
 
-        print(f"\n❌ Error: {str(e)}\n")
+        if isinstance(e, JobCancelled):
+            print(f"\n⏹️ Cancelled: {str(e)}\n")
+        else:
+            print(f"\n❌ Error: {str(e)}\n")
         raise
 
+    finally:
+        # ה-stems וה-vocals המומרים נשארים במטמון לשירים הבאים
+        for cache, key in cache_leases:
+            cache.release(key)
+
+def voice_suffix(model_name, pitch, taken):
+    """סיומת שם הקובץ לקול: שם המודל והפיץ', ייחודית בתוך הבקשה"""
+    label = model_name if not pitch else f"{model_name} {pitch:+d}"
+    label = "".join(c for c in label if c.isalnum() or c in (' ', '-', '_', '+')).strip() or 'voice'
+    suffix, count = label, 1
+    while suffix in taken:
+        count += 1
+        suffix = f"{label} ({count})"
+    taken.add(suffix)
+    return suffix
+
+def process_voices(youtube_url, voices, heavy_processing=False, job=None, start=None, duration=None):
+    """שיר אחד בכמה קולות: הורדה והפרדה פעם אחת, ולכל קול המרה, מיקס וקידוד משלו
+
+    הקול הראשון מומר לבד וממלא את מטמון התכונות (HuBERT ו-f0) של ה-worker, כך שהקולות
+    הבאים מריצים רק את הסינתיסייזר; הם רצים במקביל עד מגבלת שלב ה-RVC.
+    מחזיר (כותרת, [תוצאה לכל קול, לפי הסדר]) - קול שנכשל מחזיר שגיאה בלי לעצור את האחרים.
+    """
+    cache_leases = []
+    leases_lock = threading.Lock()
+
+    try:
+        print(f"Processing {len(voices)} voices...")
+        source_audio, video_title = fetch_audio(youtube_url, job)
+        cache_leases.append((media_index, media_key(youtube_url)))
+
+        separation_model = 'bs_roformer_vocals_gabox.ckpt' if heavy_processing else 'UVR_MDXNET_KARA_2.onnx'
+        separation_paths, stem_key = separate_stems(source_audio, separation_model, job, start=start, duration=duration)
+        cache_leases.append((stem_cache, stem_key))
+        vocals_path = separation_paths['vocals_path']
+        instrumental_path = separation_paths['instrumental_path']
+        trim = separation_paths['window']
+
+        relays = fanout_progress(job, len(voices))
+        taken = set()
+        suffixes = [output_suffix(voice_suffix(voice['model'], voice['pitch'], taken), start, duration)
+                    for voice in voices]
+
+        def run_voice(index):
+            voice = voices[index]
+            temp_files = []
+            final_output = None
+            try:
+                model = model_registry.get(voice['model'])
+                options = {name: voice[name] for name in ('index_rate', 'protect', 'f0_method') if name in voice}
+                new_vocals_path, rvc_key = convert_vocals(vocals_path, model, voice['pitch'], job, window=trim,
+                                                          on_progress=relays[index], **options)
+                with leases_lock:
+                    cache_leases.append((rvc_cache, rvc_key))
+
+                final_output = render_song(new_vocals_path, vocals_path, instrumental_path, stem_key, rvc_key,
+                                           video_title, suffixes[index], temp_files, job, trim, report=False)
+                if relays[index] is not None:
+                    relays[index]({'event': 'progress', 'fraction': 1.0})
+                print(f"✅ Voice {voice['model']} ({voice['pitch']:+d}) complete")
+                result = build_process_result(final_output, video_title, suffix=suffixes[index])
+            except JobCancelled:
+                raise
+            except Exception as e:
+                print(f"❌ Voice {voice['model']} failed: {str(e)}")
+                result = {'success': False, 'error': str(e)}
+            finally:
+                # בלי כותרת render_song מחזיר את הקובץ הזמני עצמו - הוא התוצאה
+                for temp_file in temp_files:
+                    try:
+                        if os.path.exists(temp_file) and temp_file != final_output:
+                            os.remove(temp_file)
+                    except OSError:
+                        pass
+
+            result.update(model=voice['model'], pitch=voice['pitch'])
+            return result
+
+        results = [run_voice(0)]
+        if len(voices) > 1:
+            with ThreadPoolExecutor(max_workers=min(len(voices) - 1, STAGE_LIMITS['rvc'])) as executor:
+                futures = [executor.submit(run_voice, index) for index in range(1, len(voices))]
+                results.extend(future.result() for future in futures)
+
+        print("✅ Complete!")
+        return video_title, results
+
+    finally:
+        for cache, key in cache_leases:
+            cache.release(key)
+
+def remove_files(file_paths):
+    """מוחק קבצים זמניים אם הם קיימים"""
+    for file_path in file_paths:
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except Exception as e:
+            print(f"⚠️ Cannot delete file: {file_path} - {e}")
+
+def remove_dirs(dir_paths):
+    """מוחק תיקיות זמניות (כולל התוכן שלהן)"""
+    for folder_path in dir_paths:
+        try:
+            if os.path.isdir(folder_path):
+                shutil.rmtree(folder_path)
+        except Exception as e:
+            print(f"⚠️ Cannot delete folder: {folder_path} - {e}")
+
+def build_process_result(final_output, title, preview=False, suffix=None):
+    """בונה את תשובת ה-API עבור שיר מעובד"""
+    # Return relative path for web serving
+    relative_path = os.path.relpath(final_output, BASE_DIR)
+    suffix = suffix or ('preview' if preview else 'processed')
+
+    return {
+        'success': True,
+        'audio_path': '/' + relative_path.replace('\\', '/'),
+        'title': f"{title} - {suffix}" if title else f'{suffix.capitalize()} Song',
+        'preview': preview,
+        'message': 'Complete!'
+    }
+
+def process_song_job(job, youtube_url, enhanced=False, preview=False, preview_seconds=None,
+                     start=None, duration=None):
+    """מריץ את process_song כמשימת רקע"""
+    with stage_metrics.measure('job', job, lane=job.lane):
+        final_output, title, suffix = process_song(youtube_url, heavy_processing=enhanced, job=job,
+                                                   preview=preview, preview_seconds=preview_seconds,
+                                                   start=start, duration=duration)
+    return build_process_result(final_output, title, preview, suffix)
+
+def process_voices_job(job, youtube_url, voices, enhanced=False, start=None, duration=None):
+    """מריץ את process_voices כמשימת רקע; נכשלת רק אם אף קול לא הצליח"""
+    with stage_metrics.measure('job', job, lane=job.lane, voices=len(voices)):
+        title, variants = process_voices(youtube_url, voices, heavy_processing=enhanced, job=job,
+                                         start=start, duration=duration)
+    if not any(variant['success'] for variant in variants):
+        raise Exception(variants[0]['error'])
+    return {
+        'success': True,
+        'title': title,
+        'variants': variants,
+        'message': 'Complete!'
+    }
+
+def parse_time_window(data):
+    """start/duration אופציונליים מגוף הבקשה (שניות); ValueError אם אינם תקינים"""
+    try:
+        start = float(data['start']) if data.get('start') is not None else None
+        duration = float(data['duration']) if data.get('duration') is not None else None
+    except (TypeError, ValueError):
+        raise ValueError('start and duration must be numbers of seconds')
+    if (start is not None and start < 0) or (duration is not None and duration <= 0):
+        raise ValueError('start must be >= 0 and duration > 0')
+    return start, duration
+
+def parse_preview_seconds(value):
+    """preview_seconds מהבקשה - מספר בתוך PREVIEW_SECONDS_RANGE, או None; ValueError אחרת"""
+    if value is None:
+        return None
+    low, high = PREVIEW_SECONDS_RANGE
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('preview_seconds must be a number of seconds')
+    if not low <= seconds <= high:
+        raise ValueError(f'preview_seconds must be between {low} and {high}')
+    return seconds
+
+def parse_voices(items):
+    """רשימת הקולות מהבקשה: שם מודל או {'model', 'pitch', 'index_rate', 'protect', 'f0_method'}"""
+    if not isinstance(items, list) or not items:
+        raise ValueError('voices must be a non-empty list')
+    if len(items) > FANOUT_MAX_VOICES:
+        raise ValueError(f'At most {FANOUT_MAX_VOICES} voices per request')
+
+    known = set(model_registry.names())
+    voices = []
+    for item in items:
+        if isinstance(item, str):
+            item = {'model': item}
+        if not isinstance(item, dict) or item.get('model') not in known:
+            raise ValueError(f"Unknown voice model: {item.get('model') if isinstance(item, dict) else item}")
+        try:
+            voice = {'model': item['model'], 'pitch': int(item.get('pitch') or 0)}
+            for name in ('index_rate', 'protect'):
+                if item.get(name) is not None:
+                    voice[name] = float(item[name])
+        except (TypeError, ValueError):
+            raise ValueError('pitch must be an integer, index_rate and protect numbers')
+        if item.get('f0_method'):
+            voice['f0_method'] = str(item['f0_method'])
+        voices.append(voice)
+    return voices
+
+def looks_like_url(text):
+    return text.startswith(('http://', 'https://')) or 'youtu' in text
+
+def expand_playlist(playlist_url):
+    """מחזיר את כל הסרטונים בפלייליסט בלי להוריד אותם (yt-dlp --flat-playlist)"""
+    cmd = [
+        'yt-dlp',
+        '--flat-playlist',
+        '--extractor-args', 'youtube:player_client=android',
+        '--print', '%(.{id,title,url})j',
+        playlist_url
+    ]
+
+    result = subprocess.run(
+        cmd,
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='replace'
+    )
+
+    if result.returncode != 0:
+        raise Exception(f"Playlist failed: {result.stderr if result.stderr else 'Unknown error'}")
+
+    entries = []
+    for line in result.stdout.splitlines():
+        line = line.strip()
+        if not line.startswith('{'):
+            continue
+        entry = json.loads(line)
+        if entry.get('id'):
+            entries.append(f"https://www.youtube.com/watch?v={entry['id']}")
+        elif entry.get('url'):
+            entries.append(entry['url'])
+
+    if not entries:
+        raise Exception("Playlist is empty")
+
+    print(f"✅ Playlist: {len(entries)} videos")
+    return entries
+
+def batch_item_job(job, item, enhanced=False):
+    """פריט אחד באצווה - קישור, או חיפוש שלוקח את התוצאה הראשונה"""
+    if looks_like_url(item):
+        youtube_url = item
+    else:
+        with scheduler.stage('download', job):
+            youtube_url = search_youtube(item)[0]['url']
+
+    result = process_song_job(job, youtube_url, enhanced)
+    result['url'] = youtube_url
+    return result
+
+def submit_batch(items, playlist=None, enhanced=False):
+    """מכניס את כל הפריטים למתזמן בבת אחת - שלבי ההורדה/הפרדה/RVC של שירים שונים רצים במקביל"""
+    items = [item.strip() for item in items if item and item.strip()]
+    if playlist:
+        items.extend(expand_playlist(playlist))
+    if not items:
+        raise Exception("No input provided")
+
+    batch = {
+        'batch_id': uuid.uuid4().hex,
+        'created': time.time(),
+        'enhanced': bool(enhanced),
+        'items': []
+    }
+    # המשימות של אצווה שעוד ברשימה לא נמחקות מהיסטוריית המתזמן
+    scheduler.hold(batch['batch_id'])
+    for index, item in enumerate(items):
+        job = scheduler.submit(batch_item_job, {'item': item, 'enhanced': bool(enhanced)},
+                               kind='batch_item', lane='batch', group=batch['batch_id'])
+        batch['items'].append({'index': index, 'input': item, 'job_id': job.id})
+
+    with batches_lock:
+        batches[batch['batch_id']] = batch
+        while len(batches) > BATCH_HISTORY:
+            old_id, _ = batches.popitem(last=False)
+            scheduler.release_group(old_id)
+
+    print(f"✅ Batch {batch['batch_id'][:8]}: {len(items)} items queued")
+    return batch
+
+def batch_snapshot(batch):
+    """מצב האצווה: מצב ותוצאה לכל פריט וסיכום לפי סטטוס"""
+    items = []
+    counts = {}
+    for entry in batch['items']:
+        job = scheduler.get(entry['job_id'])
+        item = dict(entry)
+        if job is None:
+            item['status'] = 'unknown'
+        else:
+            item.update(job.to_dict())
+            if job.status == 'done':
+                item['result'] = job.result
+        counts[item['status']] = counts.get(item['status'], 0) + 1
+        items.append(item)
+
+    finished = sum(counts.get(status, 0) for status in ('done', 'failed', 'cancelled', 'unknown'))
+    return {
+        'batch_id': batch['batch_id'],
+        'created': batch['created'],
+        'total': len(items),
+        'finished': finished,
+        'done': finished == len(items),
+        'counts': counts,
+        'items': items
+    }
+
+def job_state(job):
+    """מצב המשימה לזרם האירועים; בסיום כולל גם את התוצאה"""
+    state = job.to_dict()
+    state.pop('metrics', None)
+    if job.status == 'done':
+        state['result'] = job.result
+    return state
+
+def job_events(job, keepalive=EVENTS_KEEPALIVE):
+    """מחולל Server-Sent Events: אירוע progress לכל שינוי במשימה, ואירוע done בסיום
+
+    בלי שינויים נשלחת הערת keep-alive כל keepalive שניות, כדי שפרוקסי לא יסגור את החיבור.
+    """
+    version = None
+    while True:
+        current = job.version
+        if current != version:
+            version = current
+            event = 'done' if job.done else 'progress'
+            data = json.dumps(job_state(job), ensure_ascii=False)
+            yield f"id: {version}\nevent: {event}\ndata: {data}\n\n"
+            if job.done:
+                return
+        elif job.wait_for_change(version, keepalive) == version:
+            yield ": keep-alive\n\n"
+
+def batch_events(batch, interval=1.0):
+    """מחולל אירועי התקדמות: אירוע לכל שינוי שלב/סטטוס של פריט, ואירוע סיכום בסוף"""
+    last_seen = {}
+    while True:
+        snapshot = batch_snapshot(batch)
+        for item in snapshot['items']:
+            state = (item['status'], item.get('stage'))
+            if last_seen.get(item['index']) != state:
+                last_seen[item['index']] = state
+                event = {'event': 'item', 'finished': snapshot['finished'], 'total': snapshot['total']}
+                event.update(item)
+                yield event
+        if snapshot['done']:
+            yield {
+                'event': 'done',
+                'batch_id': snapshot['batch_id'],
+                'total': snapshot['total'],
+                'counts': snapshot['counts']
+            }
+            return
+        time.sleep(interval)
+
 # Initialize Flask
 app = Flask(__name__,
             template_folder='.',
@@ -557,8 +1460,14 @@ def api_system_info():
         return jsonify({
             'yt_dlp': yt_dlp_status,
             'ffmpeg': ffmpeg_status,
-            'models': len(local_models),
-            'cached_files': len(youtube_audio_cache)
+            'models': len(model_registry),
+            'cached_files': media_index.count(),
+            'media_cache': media_evictor.stats(),
+            'jobs': scheduler.stats(),
+            'lanes': scheduler.lane_stats(),
+            'stem_cache': stem_cache.stats(),
+            'rvc_cache': rvc_cache.stats(),
+            'inflight': inflight.stats()
         })
 
     except Exception as e:
@@ -567,7 +1476,6 @@ def api_system_info():
 @app.route('/api/clear-cache', methods=['POST'])
 def api_clear_cache():
     try:
-        global youtube_audio_cache
         if os.path.exists(MEDIA_CACHE_DIR):
             for file in os.listdir(MEDIA_CACHE_DIR):
                 file_path = os.path.join(MEDIA_CACHE_DIR, file)
@@ -575,41 +1483,202 @@ def api_clear_cache():
                     os.remove(file_path)
                 except:
                     pass
-        youtube_audio_cache = {}
-        if os.path.exists(YOUTUBE_AUDIO_CACHE_PATH):
-            os.remove(YOUTUBE_AUDIO_CACHE_PATH)
-        save_youtube_cache()
+        media_index.clear()
         return jsonify({'success': True, 'message': 'Cache cleared'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/process', methods=['POST'])
 def api_process():
-    """API endpoint for processing songs - FULL PIPELINE"""
+    """API endpoint for processing songs - queues the FULL PIPELINE as a background job"""
     try:
         data = request.json
         youtube_url = data.get('youtube_url', '')
         enhanced = data.get('enhanced', False)
+        preview = bool(data.get('preview', False))
 
         if not youtube_url:
             return jsonify({'error': 'No input provided'}), 400
 
-        # Run full processing pipeline
-        final_output, title = process_song(youtube_url, heavy_processing=enhanced)
+        # חלון זמן אופציונלי (שניות) - רק הוא מופרד, מומר ומרונדר
+        try:
+            start, duration = parse_time_window(data)
+            preview_seconds = parse_preview_seconds(data.get('preview_seconds'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # preview רץ בנתיב העדיפות הגבוה - לפני שירים מלאים ואצוות
+        job = scheduler.submit(process_song_job, {
+            'youtube_url': youtube_url,
+            'enhanced': bool(enhanced),
+            'preview': preview,
+            'preview_seconds': preview_seconds,
+            'start': start,
+            'duration': duration
+        }, kind='preview' if preview else 'process', lane='preview' if preview else 'interactive')
+
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status
+        }), 202
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/process-voices', methods=['POST'])
+def api_process_voices():
+    """API endpoint for one song in several voices - one download and separation, one conversion per voice"""
+    try:
+        data = request.json or {}
+        youtube_url = data.get('youtube_url', '')
+        if not youtube_url:
+            return jsonify({'error': 'No input provided'}), 400
 
-        # Return relative path for web serving
-        relative_path = os.path.relpath(final_output, BASE_DIR)
+        try:
+            voices = parse_voices(data.get('voices'))
+            start, duration = parse_time_window(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        job = scheduler.submit(process_voices_job, {
+            'youtube_url': youtube_url,
+            'voices': voices,
+            'enhanced': bool(data.get('enhanced', False)),
+            'start': start,
+            'duration': duration
+        }, kind='voices')
 
         return jsonify({
             'success': True,
-            'audio_path': '/' + relative_path.replace('\\', '/'),
-            'title': f"{title} - processed" if title else 'Processed Song',
-            'message': 'Complete!'
-        })
+            'job_id': job.id,
+            'status': job.status,
+            'voices': len(voices)
+        }), 202
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/models', methods=['GET'])
+def api_models():
+    """מודלי הקול הזמינים ל-/api/process-voices"""
+    try:
+        return jsonify({'models': [model_registry.get(name).to_dict() for name in sorted(model_registry.names())]})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job_status(job_id):
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def api_job_result(job_id):
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status == 'done':
+        return jsonify(job.result)
+    if job.status == 'failed':
+        return jsonify({'error': job.error}), 500
+    if job.status == 'cancelled':
+        return jsonify({'error': 'Job was cancelled'}), 410
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def api_job_events(job_id):
+    """זרם SSE (text/event-stream) של שלב, התקדמות ו-ETA - חיבור אחד במקום polling"""
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return Response(job_events(job), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def api_job_cancel(job_id):
+    job = scheduler.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    """היסטוגרמות זמן/CPU, I/O, זיכרון ופגיעות מטמון לכל שלב (JSON, או ?format=prometheus)"""
+    if request.args.get('format') == 'prometheus':
+        return Response(stage_metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+    return jsonify({'stages': stage_metrics.snapshot(), 'jobs': scheduler.stats()})
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """API endpoint for batch processing - URLs, search queries and/or a playlist"""
+    try:
+        data = request.json or {}
+        items = data.get('items', [])
+        if isinstance(items, str):
+            items = items.splitlines()
+
+        batch = submit_batch(items, playlist=data.get('playlist'), enhanced=data.get('enhanced', False))
+
+        return jsonify({
+            'success': True,
+            'batch_id': batch['batch_id'],
+            'total': len(batch['items'])
+        }), 202
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def get_batch(batch_id):
+    with batches_lock:
+        return batches.get(batch_id)
+
+@app.route('/api/batches/<batch_id>', methods=['GET'])
+def api_batch_status(batch_id):
+    batch = get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(batch_snapshot(batch))
+
+@app.route('/api/batches/<batch_id>/events', methods=['GET'])
+def api_batch_events(batch_id):
+    """זרם NDJSON של התקדמות האצווה - שורה לכל אירוע"""
+    batch = get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found'}), 404
+
+    def generate():
+        for event in batch_events(batch):
+            yield json.dumps(event, ensure_ascii=False) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/api/batches/<batch_id>/cancel', methods=['POST'])
+def api_batch_cancel(batch_id):
+    batch = get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    for entry in batch['items']:
+        scheduler.cancel(entry['job_id'])
+    return jsonify(batch_snapshot(batch))
+
+def start_services():
+    """טעינת הגדרות, קאש ו-workers - משותף לשרת ולשורת הפקודה"""
+    print("Loading configuration...")
+    models_ok = load_local_models_config()
+    load_youtube_cache()
+    media_evictor.start()
+    media_evictor.trigger()
+    start_separation_pool()
+    start_rvc_pool()
+    # זמני הגישה של פגיעות במטמון נכתבים לאינדקס באיחור - שומרים את מה שנשאר ביציאה
+    atexit.register(stem_cache.flush)
+    atexit.register(rvc_cache.flush)
+    return models_ok
+
 if __name__ == "__main__":
     import logging
 
@@ -622,9 +1691,7 @@ if __name__ == "__main__":
     print("="*60)
     print()
 
-    print("Loading configuration...")
-    models_ok = load_local_models_config()
-    load_youtube_cache()
+    models_ok = start_services()
 
     if not models_ok:
         print("WARNING: Models issue!")
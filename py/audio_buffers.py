@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory float32 audio helpers: PCM decode without ffmpeg, resampling, block-wise mixing and a single final encode
+"""
+
+import subprocess
+from math import ceil, gcd
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
+
+# soundfile >= 0.11 מוסיף SoundFileError; בגרסאות ישנות יותר השגיאות הן RuntimeError
+_READ_ERRORS = (RuntimeError, OSError, getattr(sf, 'SoundFileError', RuntimeError))
+# אורך בלוק במיקס ובקידוד - הזיכרון חסום לבלוקים כאלה ולא לאורך השיר
+BLOCK_SECONDS = 10.0
+
+
+class UnreadableAudio(Exception):
+    """soundfile לא מצליח לקרוא את הקובץ - הקורא יכול לחזור ל-ffmpeg"""
+
+
+def read_audio(path, start=None, duration=None):
+    """קורא קובץ PCM (WAV/FLAC) ישירות לבאפר float32 בצורה (samples, channels)
+
+    start/duration (שניות) - קורא רק את החלון הזה, עם seek בקובץ ולא חיתוך אחרי קריאה מלאה.
+    """
+    # פתיחה דרך Python כדי שנתיבים בעברית יעבדו בלי העתקה
+    try:
+        with open(path, 'rb') as f, sf.SoundFile(f) as snd:
+            sr = snd.samplerate
+            first = min(snd.frames, int(round((start or 0) * sr)))
+            frames = snd.frames - first if duration is None else min(snd.frames - first, int(round(duration * sr)))
+            snd.seek(first)
+            data = snd.read(frames, dtype='float32', always_2d=True)
+    except _READ_ERRORS as e:
+        raise UnreadableAudio(f"Cannot read {path}: {e}") from e
+    return data, sr
+
+
+def audio_info(path):
+    """(frames, samplerate, channels) מכותרת הקובץ, בלי לקרוא את הדגימות"""
+    try:
+        with open(path, 'rb') as f:
+            info = sf.info(f)
+    except _READ_ERRORS as e:
+        raise UnreadableAudio(f"Cannot read {path}: {e}") from e
+    return info.frames, info.samplerate, info.channels
+
+
+def read_blocks(path, sr, block_seconds=BLOCK_SECONDS, start=None, duration=None, pad=256):
+    """קורא את הקובץ (או את החלון start/duration) כבלוקים רציפים של float32 (samples, channels) ב-sr
+
+    כל בלוק נדגם מחדש עם pad דגימות הקשר משני הצדדים. הבלוקים וההקשר הם כפולות של יחס
+    הדגימה, כך שכל גבול בלוק נופל על דגימת פלט שלמה והחיבור זהה לדגימה מחדש של כל הקובץ.
+    """
+    try:
+        with open(path, 'rb') as f, sf.SoundFile(f) as snd:
+            native_sr = snd.samplerate
+            first = min(snd.frames, int(round((start or 0) * native_sr)))
+            total = snd.frames if duration is None else min(snd.frames, first + int(round(duration * native_sr)))
+            factor = gcd(int(native_sr), int(sr))
+            up, down = int(sr) // factor, int(native_sr) // factor
+            block = max(1, int(block_seconds * native_sr) // down) * down
+            pad = ceil(pad / down) * down if up != down else 0
+            for pos in range(first, total, block):
+                end = min(total, pos + block)
+                lead_in = min(pad, pos // down * down)
+                snd.seek(pos - lead_in)
+                data = snd.read(min(snd.frames, end + pad) - pos + lead_in, dtype='float32', always_2d=True)
+                out = resample(data, native_sr, sr)
+                lead = lead_in * up // down
+                yield out[lead:lead + ceil((end - pos) * up / down)]
+    except _READ_ERRORS as e:
+        raise UnreadableAudio(f"Cannot read {path}: {e}") from e
+
+
+def rechunk(blocks, frames):
+    """מאחד בלוקים באורכים שונים לבלוקים של frames דגימות בדיוק (האחרון יכול להיות קצר יותר)"""
+    pending = []
+    available = 0
+    for block in blocks:
+        pending.append(block)
+        available += len(block)
+        while available >= frames:
+            joined = np.concatenate(pending)
+            yield joined[:frames]
+            pending = [joined[frames:]]
+            available -= frames
+    if available:
+        yield np.concatenate(pending)
+
+
+def to_mono(buffer):
+    if buffer.ndim == 1:
+        return buffer
+    return buffer.mean(axis=1, dtype=np.float32)
+
+
+def match_channels(buffer, channels):
+    """מתאים את מספר הערוצים (מונו <-> סטריאו)"""
+    if buffer.ndim == 1:
+        buffer = buffer[:, None]
+    if buffer.shape[1] == channels:
+        return buffer
+    mono = buffer.mean(axis=1, keepdims=True, dtype=np.float32)
+    return np.repeat(mono, channels, axis=1)
+
+
+def resample(buffer, sr_from, sr_to):
+    """דגימה מחדש פולי-פאזית, וקטורית על כל הערוצים"""
+    if sr_from == sr_to:
+        return buffer
+    factor = gcd(int(sr_from), int(sr_to))
+    return resample_poly(buffer, int(sr_to) // factor, int(sr_from) // factor, axis=0).astype(np.float32)
+
+
+def rms(buffer):
+    if buffer.size == 0:
+        return 0.0
+    return float(np.sqrt(np.mean(np.square(buffer, dtype=np.float64))))
+
+
+def blocks_rms(blocks):
+    """RMS של זרם בלוקים, בלי להחזיק אותו בזיכרון"""
+    total = 0.0
+    count = 0
+    for block in blocks:
+        total += float(np.sum(np.square(block, dtype=np.float64)))
+        count += block.size
+    return float(np.sqrt(total / count)) if count else 0.0
+
+
+def matching_gain(current, reference, max_gain=4.0):
+    """ההגבר שמשווה עוצמת RMS current לזו של reference"""
+    if current == 0.0:
+        return 1.0
+    return min(reference / current, max_gain)
+
+
+def mix_blocks(streams, channels, block_frames, gains=None):
+    """מחבר זרמי בלוקים כמו amix (duration=longest, נרמול לפי מספר הכניסות), בלוק אחר בלוק"""
+    gains = gains or [1.0] * len(streams)
+    streams = [rechunk(stream, block_frames) for stream in streams]
+    while True:
+        parts = [next(stream, None) for stream in streams]
+        if all(part is None for part in parts):
+            return
+        length = max(len(part) for part in parts if part is not None)
+        mixed = np.zeros((length, channels), dtype=np.float32)
+        for part, gain in zip(parts, gains):
+            if part is not None:
+                mixed[:len(part)] += match_channels(part, channels) * gain
+        mixed /= len(parts)
+        yield mixed
+
+
+def encode_mp3(blocks, sr, channels, output_path, filters=None):
+    """מקודד זרם בלוקים float32 ל-MP3 דרך ffmpeg (stdin) - הקידוד היחיד בצינור"""
+    command = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'f32le', '-ar', str(sr), '-ac', str(channels), '-i', 'pipe:0'
+    ]
+    if filters:
+        command.extend(['-af', ','.join(filters)])
+    command.extend(['-c:a', 'libmp3lame', '-q:a', '2', output_path])
+
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        for block in blocks:
+            process.stdin.write(np.ascontiguousarray(block, dtype='<f4').tobytes())
+        process.stdin.close()
+    except BrokenPipeError:
+        # ffmpeg יצא באמצע - השגיאה שלו נקראת למטה
+        pass
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    stderr = process.stderr.read()
+    if process.wait() != 0:
+        raise Exception(f"Encode failed: {stderr.decode('utf-8', errors='replace')}")
+    return output_path
+
+
+def decode_mono(path, sr, duration=None):
+    """מפענח כל פורמט דרך ffmpeg למונו float32 ב-sr (לניתוח, לא לפלט); duration - רק השניות הראשונות"""
+    command = ['ffmpeg', '-v', 'error', '-nostdin']
+    if duration:
+        command.extend(['-t', f"{duration:.3f}"])
+    command.extend(['-i', path, '-vn', '-ac', '1', '-ar', str(sr), '-f', 'f32le', 'pipe:1'])
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise Exception(f"Decode failed: {result.stderr.decode('utf-8', errors='replace')}")
+    return np.frombuffer(result.stdout, dtype='<f4')
+
+
+def find_excerpt(buffer, sr, seconds, skip_intro=0.1, tolerance=0.9):
+    """תחילת הקטע (בשניות) לתצוגה מקדימה: החלון הראשון שהאנרגיה שלו קרובה לחזק ביותר - בדרך כלל הפזמון הראשון
+
+    skip_intro - חלק מהשיר בהתחלה שלא נבחר (פתיח שקט/אינטרו).
+    tolerance - חלון נבחר אם האנרגיה שלו לפחות היחס הזה מהחלון החזק ביותר.
+    """
+    total = len(buffer) / sr
+    if total <= seconds:
+        return 0.0
+
+    # אנרגיה לכל שנייה, וסכום נע באורך הקטע
+    n = int(total)
+    energy = np.square(buffer[:n * sr].reshape(n, sr), dtype=np.float64).mean(axis=1)
+    length = max(1, int(seconds))
+    windows = np.convolve(energy, np.ones(length), mode='valid')
+    first = min(int(total * skip_intro), len(windows) - 1)
+    candidates = windows[first:]
+    start = first + int(np.flatnonzero(candidates >= candidates.max() * tolerance)[0])
+    return float(start)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed on-disk caches for intermediate audio (separation stems, converted vocals)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+_hash_memo = {}
+_hash_lock = threading.Lock()
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """מחשב hash של תוכן קובץ (נשמר בזיכרון לפי נתיב, גודל וזמן שינוי)"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _hash_lock:
+        if memo_key in _hash_memo:
+            return _hash_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    value = digest.hexdigest()
+
+    with _hash_lock:
+        _hash_memo[memo_key] = value
+    return value
+
+
+def make_key(*parts):
+    """בונה מפתח מטמון יציב מרשימת פרמטרים"""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ContentCache:
+    """מטמון קבצים בתיקייה, מוגבל בגודל כולל עם פינוי LRU
+
+    זמני הגישה של פגיעות נשמרים בזיכרון ונכתבים לאינדקס לכל היותר פעם ב-flush_interval
+    שניות, או יחד עם הכנסה/פינוי - לא בכל פגיעה.
+    """
+
+    def __init__(self, root, max_bytes, name, flush_interval=60.0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.name = name
+        self.index_path = os.path.join(root, 'index.json')
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flush_interval = flush_interval
+        self._pins = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.time()
+        os.makedirs(root, exist_ok=True)
+        self._entries = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+        # מסירים רשומות שהקבצים שלהן כבר לא קיימים
+        return {key: entry for key, entry in entries.items()
+                if all(os.path.exists(os.path.join(self.root, key, filename))
+                       for filename in entry['files'].values())}
+
+    def _save_index(self):
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(temp_path, self.index_path)
+        self._dirty = False
+        self._saved_at = time.time()
+
+    def flush(self):
+        """כותב לאינדקס זמני גישה שעוד לא נשמרו (למשל ביציאה)"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def _paths(self, key, entry):
+        return {name: os.path.join(self.root, key, filename) for name, filename in entry['files'].items()}
+
+    def get(self, key):
+        """מחזיר את הקבצים השמורים (ומצמיד אותם עד release), או None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                paths = self._paths(key, entry)
+                if all(os.path.exists(path) for path in paths.values()):
+                    entry['last_access'] = time.time()
+                    self._pins[key] = self._pins.get(key, 0) + 1
+                    self.hits += 1
+                    self._dirty = True
+                    if time.time() - self._saved_at >= self.flush_interval:
+                        self._save_index()
+                    return paths
+                self._remove(key)
+                self._dirty = True
+            self.misses += 1
+            return None
+
+    def put(self, key, files, move=True):
+        """שומר קבצים {שם: נתיב} תחת key ומחזיר את הנתיבים במטמון (מוצמדים עד release)"""
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                # משימה אחרת כבר שמרה את אותה תוצאה במקביל
+                if move:
+                    for src_path in files.values():
+                        try:
+                            os.remove(src_path)
+                        except OSError:
+                            pass
+                self._pins[key] = self._pins.get(key, 0) + 1
+                return self._paths(key, existing)
+
+        entry_dir = os.path.join(self.root, key)
+        os.makedirs(entry_dir, exist_ok=True)
+
+        stored = {}
+        size = 0
+        for name, src_path in files.items():
+            filename = f"{name}{os.path.splitext(src_path)[1]}"
+            dst_path = os.path.join(entry_dir, filename)
+            if move:
+                shutil.move(src_path, dst_path)
+            else:
+                shutil.copy2(src_path, dst_path)
+            stored[name] = filename
+            size += os.path.getsize(dst_path)
+
+        with self._lock:
+            now = time.time()
+            self._entries[key] = {'files': stored, 'size': size, 'created': now, 'last_access': now}
+            self._pins[key] = self._pins.get(key, 0) + 1
+            self._evict()
+            self._save_index()
+            return self._paths(key, self._entries[key])
+
+    def release(self, key):
+        """משחרר הצמדה שנלקחה ב-get/put"""
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    def _evict(self):
+        total = sum(entry['size'] for entry in self._entries.values())
+        if total <= self.max_bytes:
+            return
+
+        for key, entry in sorted(self._entries.items(), key=lambda item: item[1]['last_access']):
+            if total <= self.max_bytes:
+                break
+            # קבצים שמשימה פעילה משתמשת בהם לא נמחקים
+            if self._pins.get(key):
+                continue
+            total -= entry['size']
+            self._remove(key)
+            self.evictions += 1
+            print(f"[{self.name}] Evicted {key[:12]}")
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                if not self._pins.get(key):
+                    self._remove(key)
+            self._save_index()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': sum(entry['size'] for entry in self._entries.values()),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Command-line batch processing: many URLs, search queries or a playlist through the same pipelined scheduler
+"""
+
+import argparse
+import json
+import sys
+
+import app
+
+
+def read_items(args):
+    items = list(args.items)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            items.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process many songs at once")
+    parser.add_argument("items", nargs='*', help="YouTube URLs or search queries")
+    parser.add_argument("--file", type=str, help="Text file with one URL or search query per line")
+    parser.add_argument("--playlist", type=str, help="Playlist URL to expand into its videos")
+    parser.add_argument("--enhanced", action="store_true", help="Use the heavy separation model")
+    parser.add_argument("--output", type=str, help="Write per-item results as JSON lines to this file")
+    args = parser.parse_args()
+
+    items = read_items(args)
+    if not items and not args.playlist:
+        parser.error("provide items, --file or --playlist")
+
+    if not app.start_services():
+        print("WARNING: Models issue!")
+
+    batch = app.submit_batch(items, playlist=args.playlist, enhanced=args.enhanced)
+
+    summary = None
+    for event in app.batch_events(batch):
+        if event['event'] == 'done':
+            summary = event
+            break
+        if event['status'] == 'done':
+            print(f"✅ [{event['finished']}/{event['total']}] {event['input']} -> {event['result']['audio_path']}")
+        elif event['status'] == 'failed':
+            print(f"❌ [{event['finished']}/{event['total']}] {event['input']}: {event['error']}")
+        elif event['status'] == 'cancelled':
+            print(f"⏹️ [{event['finished']}/{event['total']}] {event['input']}")
+        else:
+            print(f"[Batch] {event['input']}: {event['stage'] or event['status']}")
+
+    snapshot = app.batch_snapshot(batch)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for item in snapshot['items']:
+                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+    print(f"Batch finished: {json.dumps(summary['counts'])}")
+    return 0 if snapshot['counts'].get('done', 0) == snapshot['total'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of HuBERT features and raw f0 per vocal block, shared by every voice model and pitch setting
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+
+META_NAME = 'meta.json'
+# אותם גבולות כמו ב-VC.get_f0 של RVC
+F0_MIN = 50
+F0_MAX = 1100
+F0_MEL_MIN = 1127 * np.log(1 + F0_MIN / 700)
+F0_MEL_MAX = 1127 * np.log(1 + F0_MAX / 700)
+
+
+def f0_to_pitch(f0_raw, f0_up_key):
+    """מחיל שינוי פיץ' על f0 גולמי ומחזיר (pitch גס 1-255, pitchf) כמו VC.get_f0"""
+    f0 = np.asarray(f0_raw, dtype=np.float64) * pow(2, f0_up_key / 12)
+    f0_mel = 1127 * np.log(1 + f0 / 700)
+    voiced = f0_mel > 0
+    f0_mel[voiced] = (f0_mel[voiced] - F0_MEL_MIN) * 254 / (F0_MEL_MAX - F0_MEL_MIN) + 1
+    f0_mel[f0_mel <= 1] = 1
+    f0_mel[f0_mel > 255] = 255
+    return np.rint(f0_mel).astype(np.int64), f0
+
+
+class FeatureCache:
+    """תכונות HuBERT ו-f0 לכל בלוק אודיו, כקבצי .npy ב-float16 שנטענים ב-mmap
+
+    המפתח הוא hash של דגימות הבלוק עצמו יחד עם הפרמטרים שמשפיעים על החישוב (hop, שיטת f0,
+    גרסת HuBERT, החיתוך לקטעים), כך שאותו stem נותן אותם מפתחות בכל מודל קול ובכל pitch/protect.
+    מוגבל בגודל כולל; הרשומות שלא נקראו הכי הרבה זמן נמחקות ראשונות. הגודל נספר בזיכרון
+    (סריקה אחת בהתחלה) והתיקייה נסרקת שוב רק כשעוברים את הגבול - כמה תהליכים שכותבים
+    לאותה תיקייה מתקנים כך את הספירה שלהם בפינוי.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._total = sum(size for _, size, _ in self._entries())
+
+    def key(self, audio, **params):
+        digest = hashlib.sha256(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+        digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def load(self, key):
+        """מחזיר (f0 גולמי או None, [תכונות לכל קטע]) ממופים לזיכרון, או None"""
+        entry_dir = os.path.join(self.root, key)
+        try:
+            with open(os.path.join(entry_dir, META_NAME), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            f0 = np.load(os.path.join(entry_dir, 'f0.npy'), mmap_mode='r') if meta['f0'] else None
+            feats = [np.load(os.path.join(entry_dir, f'feats_{i}.npy'), mmap_mode='r')
+                     for i in range(meta['pieces'])]
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # זמן השינוי של התיקייה משמש כזמן הגישה האחרון לפינוי
+        try:
+            os.utime(entry_dir)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return f0, feats
+
+    def store(self, key, f0, feats):
+        """שומר ב-float16; נכתב לתיקייה זמנית ומוחלף בבת אחת כדי שקורא לא יראה רשומה חלקית"""
+        entry_dir = os.path.join(self.root, key)
+        temp_dir = f"{entry_dir}.{uuid.uuid4().hex[:8]}.tmp"
+        os.makedirs(temp_dir)
+        try:
+            if f0 is not None:
+                np.save(os.path.join(temp_dir, 'f0.npy'), np.asarray(f0, dtype=np.float16))
+            for i, piece in enumerate(feats):
+                np.save(os.path.join(temp_dir, f'feats_{i}.npy'), np.asarray(piece, dtype=np.float16))
+            with open(os.path.join(temp_dir, META_NAME), 'w', encoding='utf-8') as f:
+                json.dump({'f0': f0 is not None, 'pieces': len(feats)}, f)
+            size = sum(entry.stat().st_size for entry in os.scandir(temp_dir))
+            try:
+                os.replace(temp_dir, entry_dir)
+            except OSError:
+                # תהליך אחר כבר שמר את אותו בלוק
+                size = 0
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        with self._lock:
+            self._total += size
+            over = self._total > self.max_bytes
+        if over:
+            self._evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith('.tmp') or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.stat(path).st_mtime, size, path))
+            except OSError:
+                continue
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+            self._total = total
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'entries': len(entries),
+            'bytes': self._total,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Background job scheduler with separate concurrency limits per pipeline stage and priority lanes
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# נתיבי עדיפות - מספר נמוך קודם, גם בכניסה למתזמן וגם בכל שלב
+LANES = OrderedDict([('preview', 0), ('interactive', 1), ('batch', 2)])
+
+
+class JobCancelled(Exception):
+    """המשימה בוטלה על ידי המשתמש"""
+
+
+class Job:
+    """משימת עיבוד אחת ומצבה"""
+
+    def __init__(self, kind, params, lane='interactive', group=None):
+        # כל שינוי בסטטוס/שלב/התקדמות מעיר את מי שמחכה לו (זרמי אירועים ללקוח)
+        self._changed = threading.Condition()
+        self.version = 0
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.lane = lane
+        self.priority = LANES[lane]
+        # קבוצה (למשל אצווה) - כל עוד היא מוחזקת, המשימות שלה לא נמחקות מההיסטוריה
+        self.group = group
+        self.status = 'queued'
+        self.stage = None
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        # מדידות לכל שלב וזמן ההמתנה בתור של כל שלב
+        self.metrics = []
+        self.waits = {}
+        self._cancel = threading.Event()
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in ('status', 'stage', 'progress'):
+            self.touch()
+
+    def touch(self):
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait_for_change(self, version, timeout=None):
+        """מחכה עד שהמשימה משתנה אחרי version (או timeout) ומחזיר את הגרסה הנוכחית"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def report(self, **progress):
+        """מעדכן את ההתקדמות בשלב הנוכחי (stage, fraction, eta...)"""
+        progress['updated'] = time.time()
+        self.progress = progress
+
+    @property
+    def done(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'lane': self.lane,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'waits': self.waits,
+            'metrics': self.metrics
+        }
+
+
+class PriorityLimiter:
+    """כמו Semaphore, אבל מקום שמתפנה ניתן לממתין בעדיפות הגבוהה ביותר, ובתוכה לפי סדר הגעה"""
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self.in_use = 0
+        self._waiting = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority, check=None, poll=0.5):
+        """מחכה לתורו; check נקרא כל poll שניות ויכול לזרוק (למשל ביטול) כדי לצאת מהתור"""
+        entry = (priority, next(self._order))
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while self.in_use >= self.limit or self._waiting[0] != entry:
+                    self._cond.wait(poll)
+                    if check is not None:
+                        check()
+                self.in_use += 1
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self.in_use -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            waiting = {}
+            for priority, _ in self._waiting:
+                waiting[priority] = waiting.get(priority, 0) + 1
+            return {'limit': self.limit, 'in_use': self.in_use, 'waiting': waiting}
+
+
+class JobScheduler:
+    """מריץ משימות ברקע ומגביל כמה משימות נמצאות בכל שלב בו-זמנית
+
+    משימות ממתינות יוצאות לפי נתיב העדיפות (LANES), ו-reserved threads נוספים
+    מריצים רק משימות מהנתיב הראשון, כדי ש-preview לא יחכה מאחורי אצווה שלמה.
+    """
+
+    def __init__(self, stage_limits, max_active=8, history=200, reserved=1):
+        self._stages = {name: PriorityLimiter(limit) for name, limit in stage_limits.items()}
+        self.stage_limits = dict(stage_limits)
+        self.max_active = max(1, max_active)
+        self.reserved = max(0, reserved)
+        self._queue = []
+        self._order = itertools.count()
+        self._queue_cond = threading.Condition()
+        self._threads = []
+        self._jobs = OrderedDict()
+        self._held = set()
+        self._lock = threading.Lock()
+        self.history = history
+
+    def hold(self, group):
+        """משימות הקבוצה נשארות בהיסטוריה עד release_group, גם מעבר ל-history"""
+        with self._lock:
+            self._held.add(group)
+
+    def release_group(self, group):
+        with self._lock:
+            self._held.discard(group)
+            self._prune()
+
+    def submit(self, fn, params, kind='process', lane='interactive', group=None):
+        """יוצר משימה חדשה ומחזיר אותה מיד; fn(job, **params) רצה ברקע"""
+        job = Job(kind, params, lane, group)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        with self._queue_cond:
+            self._start_threads()
+            heapq.heappush(self._queue, (job.priority, next(self._order), job, fn))
+            self._queue_cond.notify_all()
+        return job
+
+    def _start_threads(self):
+        while len(self._threads) < self.max_active + self.reserved:
+            reserved = len(self._threads) >= self.max_active
+            thread = threading.Thread(target=self._worker, args=(reserved,), daemon=True,
+                                      name=f"job-{'reserved-' if reserved else ''}{len(self._threads)}")
+            self._threads.append(thread)
+            thread.start()
+
+    def _worker(self, reserved):
+        top_priority = next(iter(LANES.values()))
+        while True:
+            with self._queue_cond:
+                while not self._queue or (reserved and self._queue[0][0] > top_priority):
+                    self._queue_cond.wait()
+                _, _, job, fn = heapq.heappop(self._queue)
+            self._run(job, fn)
+
+    def _run(self, job, fn):
+        if job.cancelled:
+            job.finished = time.time()
+            job.status = 'cancelled'
+            return
+
+        job.started = time.time()
+        job.status = 'running'
+        try:
+            job.result = fn(job, **job.params)
+            status = 'done'
+        except JobCancelled:
+            status = 'cancelled'
+        except Exception as e:
+            job.error = str(e)
+            status = 'failed'
+        # הסטטוס הסופי נקבע אחרון, כדי שמי שרואה done (זרם אירועים, snapshot) יראה גם finished
+        job.stage = None
+        job.finished = time.time()
+        job.status = status
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job.done and (job.group is None or job.group not in self._held)]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    @contextmanager
+    def stage(self, name, job=None):
+        """תופס מקום בשלב name (download/separation/rvc/ffmpeg) למשך הבלוק
+
+        ביטול נבדק בכניסה לשלב ובזמן ההמתנה, לא ביציאה: שלב שהסתיים שומר את התוצאה שלו במטמון
+        (וממשיכים שמחכים לה מקבלים אותה), והמשימה נעצרת בכניסה לשלב הבא.
+        """
+        limiter = self._stages[name]
+        if job is not None:
+            job.check_cancelled()
+            job.stage = f"waiting:{name}"
+
+        # ממתינים בפרוסות זמן קצרות כדי שביטול ייקלט גם בזמן המתנה בתור
+        waiting_since = time.time()
+        limiter.acquire(job.priority if job is not None else LANES['interactive'],
+                        check=job.check_cancelled if job is not None else None)
+
+        try:
+            if job is not None:
+                job.waits[name] = round(job.waits.get(name, 0) + time.time() - waiting_since, 3)
+                job.stage = name
+            yield
+        finally:
+            limiter.release()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if not job.done:
+            job.cancel()
+        return job
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def lane_stats(self):
+        """משימות לפי נתיב וסטטוס, ומצב התור של כל שלב"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        lanes = {lane: {} for lane in LANES}
+        for job in jobs:
+            lanes[job.lane][job.status] = lanes[job.lane].get(job.status, 0) + 1
+        stages = {}
+        for name, limiter in self._stages.items():
+            stages[name] = limiter.stats()
+            waiting = stages[name]['waiting']
+            stages[name]['waiting'] = {lane: waiting.get(priority, 0) for lane, priority in LANES.items()}
+        return {'lanes': lanes, 'stages': stages}
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite-backed index of downloaded audio, keyed by canonical YouTube video ID
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+_VIDEO_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+_PATH_PREFIXES = ('/shorts/', '/embed/', '/live/', '/v/', '/e/')
+
+
+def canonical_video_id(url):
+    """מחלץ את מזהה הסרטון מכל צורות הקישור (youtu.be, watch?v=, shorts...), או None"""
+    url = (url or '').strip()
+    if _VIDEO_ID.match(url):
+        return url
+
+    if '://' not in url:
+        url = f"https://{url}"
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+
+    candidate = None
+    if host in ('youtu.be', 'www.youtu.be'):
+        candidate = parsed.path.lstrip('/').split('/')[0]
+    elif host == 'youtube.com' or host.endswith('.youtube.com') or host == 'youtube-nocookie.com' \
+            or host.endswith('.youtube-nocookie.com'):
+        if parsed.path == '/watch':
+            candidate = parse_qs(parsed.query).get('v', [None])[0]
+        else:
+            for prefix in _PATH_PREFIXES:
+                if parsed.path.startswith(prefix):
+                    candidate = parsed.path[len(prefix):].split('/')[0]
+                    break
+
+    if candidate and _VIDEO_ID.match(candidate):
+        return candidate
+    return None
+
+
+def media_key(url):
+    """מפתח הקאש: מזהה הסרטון, או הקישור עצמו לאתרים שאינם יוטיוב"""
+    return canonical_video_id(url) or url.strip()
+
+
+class MediaIndex:
+    """אינדקס קבצי האודיו שהורדו - חיפוש O(1) לפי מפתח, כתיבה אטומית בטרנזקציה"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # מפתחות שמשימה פעילה מחזיקה (בזיכרון בלבד) - לא מפונים עד release
+        self._pins = {}
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS media (
+                    key TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    title TEXT,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+
+    def get(self, key):
+        """מחזיר את הרשומה ומעדכן זמן גישה, או None אם אין/הקובץ נמחק"""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM media WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row['path']):
+                self._conn.execute('DELETE FROM media WHERE key = ?', (key,))
+                return None
+            self._conn.execute('UPDATE media SET last_access = ?, hits = hits + 1 WHERE key = ?',
+                               (time.time(), key))
+            return dict(row)
+
+    def put(self, key, path, title):
+        now = time.time()
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        with self._lock:
+            self._conn.execute('''
+                INSERT INTO media (key, path, title, size, created, last_access, hits)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+                ON CONFLICT(key) DO UPDATE SET
+                    path = excluded.path, title = excluded.title,
+                    size = excluded.size, last_access = excluded.last_access
+            ''', (key, path, title, size, now, now))
+
+    def pin(self, key):
+        """מצמיד את הקובץ של key עד release, כמו ContentCache"""
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def release(self, key):
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+
+    def pinned(self, key):
+        with self._lock:
+            return bool(self._pins.get(key))
+
+    def remove(self, key):
+        with self._lock:
+            self._conn.execute('DELETE FROM media WHERE key = ?', (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM media')
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM media').fetchone()[0]
+
+    def total_size(self):
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM media').fetchone()[0]
+
+    def eviction_order(self, policy='lru', idle_before=None):
+        """רשומות לפי סדר הפינוי: LRU לפי זמן גישה, LFU לפי מספר פגיעות ואז זמן גישה; בלי מוצמדות"""
+        order = 'hits ASC, last_access ASC' if policy == 'lfu' else 'last_access ASC'
+        query = 'SELECT key, path, size, last_access, hits FROM media'
+        params = ()
+        if idle_before is not None:
+            query += ' WHERE last_access < ?'
+            params = (idle_before,)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(f'{query} ORDER BY {order}', params)
+                    if not self._pins.get(row['key'])]
+
+    def import_json(self, json_path):
+        """מייבא את קובץ youtube_audio_cache.json הישן (url -> נתיב) ומחזיר כמה רשומות יובאו"""
+        with open(json_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+
+        imported = 0
+        for url, entry in entries.items():
+            if isinstance(entry, str):
+                entry = {'path': entry, 'title': os.path.splitext(os.path.basename(entry))[0]}
+            if os.path.exists(entry['path']):
+                self.put(media_key(url), entry['path'], entry.get('title'))
+                imported += 1
+        return imported
+
+
+class MediaCacheEvictor:
+    """פינוי ברקע של קבצי אודיו ישנים/קרים כדי שהקאש יישאר מוגבל בגודל ובגיל"""
+
+    def __init__(self, index, max_bytes, max_age=None, policy='lru', interval=600, min_idle=3600):
+        self.index = index
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.policy = policy
+        self.interval = interval
+        # קבצים מוצמדים (index.pin) לא מפונים; min_idle מגן גם על קבצים שנגעו בהם לאחרונה
+        self.min_idle = min_idle
+        self.runs = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.evicted_by_age = 0
+        self.evicted_by_size = 0
+        self.last_run = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='media-evictor', daemon=True)
+            self._thread.start()
+
+    def trigger(self):
+        """מבקש ריצת פינוי מיידית (למשל אחרי הורדה חדשה)"""
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️ Media cache eviction failed: {e}")
+
+    def _evict(self, entry):
+        # משימה עשויה להצמיד את הקובץ בין שליפת הרשימה למחיקה
+        if self.index.pinned(entry['key']):
+            return False
+        try:
+            if os.path.exists(entry['path']):
+                os.remove(entry['path'])
+        except OSError as e:
+            print(f"⚠️ Cannot evict {entry['path']}: {e}")
+            return False
+        self.index.remove(entry['key'])
+        self.evicted_files += 1
+        self.evicted_bytes += entry['size']
+        return True
+
+    def run_once(self):
+        with self._lock:
+            now = time.time()
+            idle_before = now - self.min_idle
+
+            if self.max_age:
+                for entry in self.index.eviction_order(self.policy, min(idle_before, now - self.max_age)):
+                    if self._evict(entry):
+                        self.evicted_by_age += 1
+
+            total = self.index.total_size()
+            if self.max_bytes and total > self.max_bytes:
+                for entry in self.index.eviction_order(self.policy, idle_before):
+                    if total <= self.max_bytes:
+                        break
+                    if self._evict(entry):
+                        total -= entry['size']
+                        self.evicted_by_size += 1
+
+            self.runs += 1
+            self.last_run = now
+
+    def stats(self):
+        return {
+            'files': self.index.count(),
+            'bytes': self.index.total_size(),
+            'max_bytes': self.max_bytes,
+            'max_age_days': self.max_age / 86400 if self.max_age else None,
+            'policy': self.policy,
+            'eviction_runs': self.runs,
+            'evicted_files': self.evicted_files,
+            'evicted_bytes': self.evicted_bytes,
+            'evicted_by_age': self.evicted_by_age,
+            'evicted_by_size': self.evicted_by_size,
+            'last_eviction_run': self.last_run
+        }
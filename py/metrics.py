@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Per-stage instrumentation (wall/CPU time, peak RSS, I/O bytes) shared by the server and the child scripts
+"""
+
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# גבולות ה-buckets של ההיסטוגרמות (שניות)
+SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def peak_rss():
+    """שיא הזיכרון של התהליך מאז שעלה (לא של שלב) בבתים, או None אם אין דרך למדוד"""
+    if resource is not None:
+        value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ב-Linux היחידה היא KB וב-macOS בתים
+        return value if sys.platform == 'darwin' else value * 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    return None
+
+
+def io_bytes():
+    """(נקרא, נכתב) בבתים של התהליך מאז שעלה, או (None, None)"""
+    if psutil is not None:
+        try:
+            counters = psutil.Process().io_counters()
+            return counters.read_bytes, counters.write_bytes
+        except (AttributeError, psutil.Error):
+            pass
+    try:
+        with open('/proc/self/io', 'r') as f:
+            values = dict(line.split(': ') for line in f.read().splitlines())
+        return int(values['read_bytes']), int(values['write_bytes'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _delta(end, start):
+    if end is None or start is None:
+        return None
+    return end - start
+
+
+@contextmanager
+def measure(name, sink=None, cpu_scope='thread', **fields):
+    """מודד את הבלוק כשלב name; השדות שהבלוק מוסיף ל-dict שמוחזר נשמרים עם התוצאה
+
+    cpu_scope - 'thread' לשלבים שרצים ב-thread משותף בשרת, 'process' בתהליכי-הבן.
+    התוצאה נמסרת ל-sink (למשל list.append או MetricsCollector.observe).
+    שדות process_* הם של התהליך כולו: שיא ה-RSS מאז שעלה, ו-I/O של כל ה-threads בזמן השלב -
+    כשכמה משימות רצות יחד בתהליך (השרת, worker עם max_jobs>1) הם כוללים גם את שלהן.
+    """
+    cpu_clock = time.thread_time if cpu_scope == 'thread' else time.process_time
+    fields = dict(fields)
+    wall_start = time.perf_counter()
+    cpu_start = cpu_clock()
+    read_start, write_start = io_bytes()
+    ok = False
+    try:
+        yield fields
+        ok = True
+    finally:
+        read_end, write_end = io_bytes()
+        result = {
+            'stage': name,
+            'wall': round(time.perf_counter() - wall_start, 4),
+            'cpu': round(cpu_clock() - cpu_start, 4),
+            'process_peak_rss': peak_rss(),
+            'process_read_bytes': _delta(read_end, read_start),
+            'process_write_bytes': _delta(write_end, write_start),
+            'ok': ok
+        }
+        result.update(fields)
+        if sink is not None:
+            sink(result)
+
+
+class Histogram:
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """הערכה לפי גבול ה-bucket העליון שבו נמצא האחוזון"""
+        if not self.count:
+            return None
+        target = q * self.count
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= target:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+
+    def to_dict(self):
+        cumulative, running = {}, 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            running += count
+            cumulative[str(bound)] = running
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': cumulative
+        }
+
+
+class StageStats:
+    def __init__(self):
+        self.wall = Histogram()
+        self.cpu = Histogram()
+        self.failures = 0
+        self.process_read_bytes = 0
+        self.process_write_bytes = 0
+        self.process_peak_rss = 0
+        self.cache = {}
+
+    def observe(self, result):
+        self.wall.observe(result['wall'])
+        self.cpu.observe(result['cpu'])
+        if not result.get('ok', True):
+            self.failures += 1
+        self.process_read_bytes += result.get('process_read_bytes') or 0
+        self.process_write_bytes += result.get('process_write_bytes') or 0
+        self.process_peak_rss = max(self.process_peak_rss, result.get('process_peak_rss') or 0)
+        if result.get('cache'):
+            self.cache[result['cache']] = self.cache.get(result['cache'], 0) + 1
+
+    def to_dict(self):
+        return {
+            'wall_seconds': self.wall.to_dict(),
+            'cpu_seconds': self.cpu.to_dict(),
+            'failures': self.failures,
+            'process_read_bytes': self.process_read_bytes,
+            'process_write_bytes': self.process_write_bytes,
+            'process_peak_rss': self.process_peak_rss,
+            'cache': self.cache
+        }
+
+
+class MetricsCollector:
+    """אוסף את מדידות השלבים מכל המשימות להיסטוגרמות לפי שלב"""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, result, job=None, prefix=''):
+        """מוסיף מדידה למשימה ולהיסטוגרמות; מדידות של תהליך-בן (worker) נכנסות כ-stage.substage"""
+        name = f"{prefix}{result['stage']}"
+        if job is not None and not prefix:
+            job.metrics.append(result)
+        with self._lock:
+            self._stages.setdefault(name, StageStats()).observe(result)
+        for child in result.get('worker') or []:
+            self.observe(child, prefix=f"{name}.")
+
+    def measure(self, name, job=None, **fields):
+        return measure(name, sink=lambda result: self.observe(result, job), **fields)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in sorted(self._stages.items())}
+
+    def prometheus(self):
+        """אותם נתונים בפורמט הטקסט של Prometheus"""
+        lines = []
+        with self._lock:
+            stages = sorted(self._stages.items())
+        for metric in ('wall', 'cpu'):
+            family = f"suno_stage_{metric}_seconds"
+            lines.append(f"# TYPE {family} histogram")
+            for name, stats in stages:
+                histogram = getattr(stats, metric)
+                running = 0
+                for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                    running += count
+                    lines.append(f'{family}_bucket{{stage="{name}",le="{bound}"}} {running}')
+                lines.append(f'{family}_sum{{stage="{name}"}} {histogram.sum:.4f}')
+                lines.append(f'{family}_count{{stage="{name}"}} {histogram.count}')
+        for field, help_text in (('process_read_bytes', 'Bytes read by the whole process while the stage ran'),
+                                 ('process_write_bytes', 'Bytes written by the whole process while the stage ran'),
+                                 ('failures', 'Failed stage runs')):
+            lines.append(f"# HELP suno_stage_{field}_total {help_text}")
+            lines.append(f"# TYPE suno_stage_{field}_total counter")
+            for name, stats in stages:
+                lines.append(f'suno_stage_{field}_total{{stage="{name}"}} {getattr(stats, field)}')
+        lines.append("# TYPE suno_stage_cache_total counter")
+        for name, stats in stages:
+            for outcome, count in sorted(stats.cache.items()):
+                lines.append(f'suno_stage_cache_total{{stage="{name}",result="{outcome}"}} {count}')
+        lines.append("# HELP suno_stage_process_peak_rss_bytes Lifetime peak RSS of the process that ran the stage")
+        lines.append("# TYPE suno_stage_process_peak_rss_bytes gauge")
+        for name, stats in stages:
+            lines.append(f'suno_stage_process_peak_rss_bytes{{stage="{name}"}} {stats.process_peak_rss}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of local voice models: extracted once, content-hashed, with checkpoint metadata read up front
+"""
+
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+
+from audio_cache import file_sha256
+
+MANIFEST_NAME = 'registry.json'
+_LEGACY_MAGIC = 0x1950a86a20f9469cfc6c
+
+
+def _skip(*args, **kwargs):
+    return None
+
+
+class _HeaderUnpickler(pickle.Unpickler):
+    """קורא את המבנה של קובץ checkpoint בלי לטעון טנזורים (ובלי torch)"""
+
+    def find_class(self, module, name):
+        if module.split('.')[0] == 'torch':
+            return _skip
+        return super().find_class(module, name)
+
+    def persistent_load(self, pid):
+        return None
+
+
+def read_checkpoint_info(pth_path):
+    """מחזיר sample rate, גרסה ו-f0 מתוך checkpoint של RVC"""
+    if zipfile.is_zipfile(pth_path):
+        with zipfile.ZipFile(pth_path) as archive:
+            data_name = next(name for name in archive.namelist() if name.endswith('data.pkl'))
+            with archive.open(data_name) as f:
+                cpt = _HeaderUnpickler(f).load()
+    else:
+        # הפורמט הישן של torch: magic, protocol, sys_info ואז האובייקט
+        with open(pth_path, 'rb') as f:
+            unpickler = _HeaderUnpickler(f)
+            if unpickler.load() != _LEGACY_MAGIC:
+                raise Exception(f"Unknown checkpoint format: {os.path.basename(pth_path)}")
+            unpickler.load()
+            unpickler.load()
+            cpt = unpickler.load()
+
+    if 'config' not in cpt:
+        raise Exception(f"Not an RVC voice model: {os.path.basename(pth_path)}")
+
+    return {
+        'sample_rate': cpt['config'][-1],
+        'version': cpt.get('version', 'v1'),
+        'f0': cpt.get('f0', 1)
+    }
+
+
+def find_model_files(model_dir):
+    """מוצא את קובץ ה-.pth ואת קובץ ה-.index המתאים לו (גם בתתי-תיקיות)"""
+    pth_files, index_files = [], []
+    for root, _, files in os.walk(model_dir):
+        for name in sorted(files):
+            if name.endswith('.pth'):
+                pth_files.append(os.path.join(root, name))
+            elif name.endswith('.index'):
+                index_files.append(os.path.join(root, name))
+
+    if not pth_files:
+        return None, None
+    pth_path = pth_files[0]
+
+    # עדיפות לאינדקס עם אותו שם כמו המודל, ואחר כך לאינדקס ה-added של RVC
+    stem = os.path.splitext(os.path.basename(pth_path))[0]
+    index_files.sort(key=lambda path: (os.path.splitext(os.path.basename(path))[0] != stem,
+                                       'added' not in os.path.basename(path)))
+    return pth_path, index_files[0] if index_files else None
+
+
+class VoiceModel:
+    """מודל קול מוכן: נתיבים, hashes ומטא-דאטה מה-checkpoint"""
+
+    def __init__(self, name, zip_path, pitch, manifest, model_dir):
+        self.name = name
+        self.zip_path = zip_path
+        self.pitch = pitch
+        self.zip_stat = tuple(manifest['zip_stat'])
+        self.zip_sha256 = manifest['zip_sha256']
+        self.pth_sha256 = manifest['pth_sha256']
+        self.pth_path = os.path.join(model_dir, manifest['pth'])
+        self.index_path = os.path.join(model_dir, manifest['index']) if manifest.get('index') else None
+        self.sample_rate = manifest['sample_rate']
+        self.version = manifest['version']
+        self.f0 = manifest['f0']
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'pitch': self.pitch,
+            'sample_rate': self.sample_rate,
+            'version': self.version,
+            'f0': self.f0,
+            'has_index': self.index_path is not None,
+            'hash': self.pth_sha256[:12]
+        }
+
+
+class ModelRegistry:
+    """בונה פעם אחת את רשימת המודלים מ-local_models.json; ZIP שהשתנה מחולץ מחדש
+
+    check_interval - כל כמה שניות לכל היותר get בודק (stat) אם ה-ZIP השתנה.
+    ZIP שנמחק אחרי החילוץ לא מפיל את המודל - משתמשים בעותק המחולץ שכבר אומת.
+    """
+
+    def __init__(self, unpacked_dir, check_interval=10.0):
+        self.unpacked_dir = unpacked_dir
+        self.check_interval = check_interval
+        self._configs = {}
+        self._models = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def load(self, configs):
+        """מכין את כל המודלים מראש; מודל שנכשל מדווח ומדולג"""
+        with self._lock:
+            self._configs = dict(configs)
+            self._models = {}
+            self._checked = {}
+            for name, config in self._configs.items():
+                try:
+                    self._models[name] = self._prepare(name, config)
+                except Exception as e:
+                    print(f"⚠️ Cannot prepare model '{name}': {e}")
+        print(f"✅ Model registry: {len(self._models)}/{len(self._configs)} models ready")
+        return self._models
+
+    def _zip_stat(self, zip_path):
+        """(גודל, זמן שינוי) של ה-ZIP, או None אם הוא כבר לא קיים"""
+        try:
+            stat = os.stat(zip_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _prepare(self, name, config):
+        zip_path = config['path']
+        model_dir = os.path.join(self.unpacked_dir, name)
+        zip_stat = self._zip_stat(zip_path)
+
+        manifest = self._read_manifest(model_dir)
+        if zip_stat is None:
+            if manifest is None:
+                raise Exception(f"ZIP not found for model '{name}': {zip_path}")
+            print(f"⚠️ ZIP for model '{name}' is missing, using the extracted copy")
+        elif manifest is not None and tuple(manifest['zip_stat']) != zip_stat:
+            # הזמן/גודל השתנו - בודקים לפי התוכן אם באמת צריך לחלץ מחדש
+            if manifest['zip_sha256'] == file_sha256(zip_path):
+                manifest['zip_stat'] = list(zip_stat)
+                self._write_manifest(model_dir, manifest)
+            else:
+                manifest = None
+
+        if manifest is None:
+            manifest = self._extract(name, zip_path, zip_stat, model_dir)
+
+        return VoiceModel(name, zip_path, config.get('pitch', 0), manifest, model_dir)
+
+    def _read_manifest(self, model_dir):
+        try:
+            with open(os.path.join(model_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        files = [manifest.get('pth')] + ([manifest['index']] if manifest.get('index') else [])
+        if not all(name and os.path.exists(os.path.join(model_dir, name)) for name in files):
+            return None
+        return manifest
+
+    def _write_manifest(self, model_dir, manifest):
+        path = os.path.join(model_dir, MANIFEST_NAME)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def _extract(self, name, zip_path, zip_stat, model_dir):
+        print(f"📦 Extracting model '{name}'...")
+        temp_dir = f"{model_dir}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                zip_ref.extractall(temp_dir)
+
+            pth_path, index_path = find_model_files(temp_dir)
+            if not pth_path:
+                raise Exception(f"not found קובץ .pth למודל '{name}'")
+
+            manifest = {
+                'zip_stat': list(zip_stat),
+                'zip_sha256': file_sha256(zip_path),
+                'pth': os.path.relpath(pth_path, temp_dir),
+                'index': os.path.relpath(index_path, temp_dir) if index_path else None,
+                'pth_sha256': file_sha256(pth_path)
+            }
+            manifest.update(read_checkpoint_info(pth_path))
+            self._write_manifest(temp_dir, manifest)
+
+            shutil.rmtree(model_dir, ignore_errors=True)
+            os.replace(temp_dir, model_dir)
+            return manifest
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def get(self, name):
+        """מחזיר מודל מוכן; אם קובץ ה-ZIP השתנה מאז, מכין אותו מחדש"""
+        with self._lock:
+            if name not in self._configs:
+                raise Exception(f"מודל '{name}' not found")
+
+            model = self._models.get(name)
+            now = time.time()
+            if model is not None and now - self._checked.get(name, 0) < self.check_interval:
+                return model
+
+            # בודקים שוב רק אם ה-ZIP קיים; בלעדיו העותק המחולץ (שאומת בהכנה) נשאר בשימוש
+            zip_stat = self._zip_stat(model.zip_path) if model is not None else None
+            if model is None or (zip_stat is not None and zip_stat != model.zip_stat):
+                model = self._models[name] = self._prepare(name, self._configs[name])
+            self._checked[name] = now
+            return model
+
+    def names(self):
+        with self._lock:
+            return list(self._models)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._models)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Structured progress events (stage, fraction, ETA) emitted by the child scripts
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+def estimate_eta(elapsed, fraction):
+    """זמן נותר לפי קצב ההתקדמות עד עכשיו, או None כשאין מספיק מידע"""
+    if not fraction or fraction <= 0:
+        return None
+    return max(0.0, elapsed * (1 - fraction) / fraction)
+
+
+class ProgressReporter:
+    """שולח אירועי progress דרך emit, לכל היותר פעם ב-interval שניות (חוץ מתחילת/סוף שלב)
+
+    stage - שם השלב כפי שהשרת מכיר אותו (download/separation/rvc).
+    job_id - מזהה המשימה בפרוטוקול ה-worker; בהרצה חד-פעמית אין מזהה.
+    """
+
+    def __init__(self, emit, stage, job_id=None, interval=1.0):
+        self.emit = emit
+        self.stage = stage
+        self.job_id = job_id
+        self.interval = interval
+        self.started = time.time()
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, fraction=None, step=None, eta=None, force=False):
+        """fraction בין 0 ל-1 (או None כשההתקדמות לא ידועה); ה-ETA מחושב מהקצב אם לא נמסר"""
+        now = time.time()
+        with self._lock:
+            if not force and fraction != 1 and now - self._last < self.interval:
+                return
+            self._last = now
+
+        if fraction is not None:
+            fraction = min(1.0, max(0.0, fraction))
+            if eta is None:
+                eta = estimate_eta(now - self.started, fraction)
+
+        message = {
+            "event": "progress",
+            "stage": self.stage,
+            "step": step,
+            "fraction": None if fraction is None else round(fraction, 4),
+            "eta": None if eta is None else round(eta, 1)
+        }
+        if self.job_id is not None:
+            message["id"] = self.job_id
+        self.emit(message)
+
+    @contextmanager
+    def estimate(self, step, expected, start=0.0, end=1.0):
+        """לשלב שלא מדווח התקדמות בעצמו: heartbeat שמעריך את החלק לפי זמן צפוי (שניות)
+
+        ההתקדמות עולה מ-start עד קצת לפני end לפי elapsed/expected; בלי expected נשלח רק heartbeat.
+        """
+        stop = threading.Event()
+        step_started = time.time()
+
+        def beat():
+            while not stop.wait(self.interval):
+                elapsed = time.time() - step_started
+                if expected:
+                    done = min(0.99, elapsed / expected)
+                    self.update(start + (end - start) * done, step, eta=max(0.0, expected - elapsed), force=True)
+                else:
+                    self.update(None, step, force=True)
+
+        self.update(start if expected else None, step, force=True)
+        thread = threading.Thread(target=beat, name=f"progress-{step}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Cross-job batched RVC inference: the synthesizer runs on padded batches of segments from several songs
+"""
+
+import threading
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from scipy import signal
+
+from feature_cache import f0_to_pitch
+from rvc_index import load_index
+from vc_infer_pipeline import bh, ah, change_rms
+
+
+class _Piece:
+    """קטע אחד מהצינור של שיר - אודיו מרופד ו-f0 תואם"""
+
+    def __init__(self, model, audio, pitch, pitchf, index, big_npy, index_rate, protect, feats=None):
+        self.model = model
+        self.audio = audio
+        # תכונות HuBERT גולמיות (לפני האינדקס) - מהמטמון, או ממולאות כאן אחרי החילוץ
+        self.feats = feats
+        self.pitch = pitch
+        self.pitchf = pitchf
+        self.index = index
+        self.big_npy = big_npy
+        self.index_rate = index_rate
+        self.protect = protect
+        self.arrived = time.time()
+        self.output = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class RVCBatcher:
+    """אוסף קטעים ממשימות שונות לבאצ'ים מרופדים של HuBERT ו-net_g, ומחזיר לכל משימה את שלה
+
+    max_batch - מספר הקטעים המרבי בבאצ'.
+    max_wait - כמה זמן (שניות) מחכים לקטעים נוספים לפני שמריצים באצ' חלקי.
+    max_pad_ratio - קטעים מאוחדים רק אם הארוך ארוך מהקצר בעד היחס הזה, כדי שהריפוד לא יבזבז חישוב.
+    """
+
+    def __init__(self, hubert_model, device, is_half, max_batch=4, max_wait=0.1, max_pad_ratio=0.25):
+        self.hubert_model = hubert_model
+        self.device = device
+        self.is_half = is_half
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.max_pad_ratio = max_pad_ratio
+        self.batches = 0
+        self.pieces = 0
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._loop, name='rvc-batcher', daemon=True)
+        self._thread.start()
+
+    def infer(self, pieces):
+        """מכניס את הקטעים לתור, מחכה שכולם יעובדו ומחזיר את האודיו שלהם לפי הסדר"""
+        with self._cond:
+            self._pending.extend(pieces)
+            self._cond.notify()
+        for piece in pieces:
+            piece.done.wait()
+        for piece in pieces:
+            if piece.error is not None:
+                raise piece.error
+        return [piece.output for piece in pieces]
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+
+            # הקטע הוותיק ביותר קובע את המודל ואת טווח האורכים של הבאצ'
+            anchor = self._pending[0]
+            deadline = anchor.arrived + self.max_wait
+            while True:
+                batch = self._select(anchor)
+                remaining = deadline - time.time()
+                if len(batch) >= self.max_batch or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            for piece in batch:
+                self._pending.remove(piece)
+            return batch
+
+    def _select(self, anchor):
+        # כל קריאה בונה dict מודל משלה, ולכן משווים את ה-net_g הטעון עצמו
+        net_g = anchor.model["net_g"]
+        candidates = [piece for piece in self._pending
+                      if piece is not anchor and piece.model["net_g"] is net_g]
+        candidates.sort(key=lambda piece: abs(len(piece.audio) - len(anchor.audio)))
+
+        batch = [anchor]
+        shortest = longest = len(anchor.audio)
+        for piece in candidates:
+            if len(batch) >= self.max_batch:
+                break
+            lo, hi = min(shortest, len(piece.audio)), max(longest, len(piece.audio))
+            if hi <= lo * (1 + self.max_pad_ratio):
+                batch.append(piece)
+                shortest, longest = lo, hi
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                self._run_safe(batch)
+            finally:
+                for piece in batch:
+                    piece.done.set()
+
+    def _run_safe(self, batch):
+        try:
+            outputs = self._run_batch(batch)
+        except RuntimeError as e:
+            # באצ' שלא נכנס לזיכרון הכרטיס מורץ שוב קטע-קטע
+            if "out of memory" not in str(e) or len(batch) == 1:
+                for piece in batch:
+                    piece.error = e
+                return
+            print(f"Batch of {len(batch)} ran out of memory, retrying one by one")
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            for piece in batch:
+                self._run_safe([piece])
+            return
+        except Exception as e:
+            for piece in batch:
+                piece.error = e
+            return
+
+        for piece, output in zip(batch, outputs):
+            piece.output = output
+        self.batches += 1
+        self.pieces += len(batch)
+
+    def _extract(self, pieces, version):
+        """HuBERT על קטעים באורך זהה בלבד; התכונות של כל קטע נשמרות ב-piece.feats
+
+        ה-GroupNorm בתחילת מחלץ התכונות של hubert_base מחשב סטטיסטיקה על כל ציר הזמן כולל
+        הריפוד, כך ש-padding_mask לא מגן על קטע קצר - התכונות שלו היו תלויות בשכנים לבאצ'.
+        לכן רק קטעים באורך זהה רצים יחד; ה-net_g מקבל את הבאצ' המרופד.
+        """
+        dtype = torch.float16 if self.is_half else torch.float32
+        groups = {}
+        for piece in pieces:
+            groups.setdefault(len(piece.audio), []).append(piece)
+
+        for length, group in groups.items():
+            source = torch.stack([torch.from_numpy(piece.audio).to(dtype) for piece in group])
+            padding_mask = torch.zeros(len(group), length, dtype=torch.bool)
+            with torch.no_grad():
+                logits = self.hubert_model.extract_features(
+                    source=source.to(self.device),
+                    padding_mask=padding_mask.to(self.device),
+                    output_layer=9 if version == "v1" else 12
+                )
+                feats = self.hubert_model.final_proj(logits[0]) if version == "v1" else logits[0]
+            for i, piece in enumerate(group):
+                piece.feats = feats[i:i + 1]
+
+    def _run_batch(self, batch):
+        """אותם שלבים כמו VC.vc, אבל עם באצ' מרופד ל-HuBERT ול-net_g"""
+        model = batch[0].model
+        window = model["vc"].window
+        dtype = torch.float16 if self.is_half else torch.float32
+
+        # קטעים שהתכונות שלהם הגיעו מהמטמון מדלגים על HuBERT
+        missing = [piece for piece in batch if piece.feats is None]
+        if missing:
+            self._extract(missing, model["version"])
+
+        lengths = [len(piece.audio) for piece in batch]
+        items = []
+        for i, piece in enumerate(batch):
+            feats = piece.feats.to(self.device, dtype)
+            pitch, pitchf = piece.pitch, piece.pitchf
+            protect = piece.protect < 0.5 and pitch is not None and pitchf is not None
+
+            if protect:
+                feats0 = feats.clone()
+            if piece.index is not None and piece.big_npy is not None and piece.index_rate != 0:
+                npy = feats[0].cpu().numpy()
+                if self.is_half:
+                    npy = npy.astype("float32")
+                score, ix = piece.index.search(npy, k=8)
+                weight = np.square(1 / score)
+                weight /= weight.sum(axis=1, keepdims=True)
+                npy = np.sum(piece.big_npy[ix] * np.expand_dims(weight, axis=2), axis=1)
+                if self.is_half:
+                    npy = npy.astype("float16")
+                feats = torch.from_numpy(npy).unsqueeze(0).to(self.device) * piece.index_rate + (1 - piece.index_rate) * feats
+
+            feats = F.interpolate(feats.permute(0, 2, 1), scale_factor=2).permute(0, 2, 1)
+            if protect:
+                feats0 = F.interpolate(feats0.permute(0, 2, 1), scale_factor=2).permute(0, 2, 1)
+
+            p_len = lengths[i] // window
+            if feats.shape[1] < p_len:
+                p_len = feats.shape[1]
+            feats = feats[:, :p_len]
+            if pitch is not None and pitchf is not None:
+                pitch, pitchf = pitch[:, :p_len], pitchf[:, :p_len]
+
+            if protect:
+                pitchff = pitchf.clone()
+                pitchff[pitchf > 0] = 1
+                pitchff[pitchf < 1] = piece.protect
+                pitchff = pitchff.unsqueeze(-1)
+                feats = feats * pitchff + feats0[:, :p_len] * (1 - pitchff)
+                feats = feats.to(feats0.dtype)
+            items.append((feats, p_len, pitch, pitchf))
+
+        max_len = max(p_len for _, p_len, _, _ in items)
+        feats = torch.zeros(len(items), max_len, items[0][0].shape[2], dtype=items[0][0].dtype, device=self.device)
+        for i, (item_feats, p_len, _, _) in enumerate(items):
+            feats[i, :p_len] = item_feats[0]
+        p_lens = torch.tensor([p_len for _, p_len, _, _ in items], device=self.device).long()
+        sid = torch.zeros(len(items), device=self.device).long()
+
+        net_g = model["net_g"]
+        with torch.no_grad():
+            if items[0][2] is not None:
+                pitch = torch.zeros(len(items), max_len, device=self.device).long()
+                pitchf = torch.zeros(len(items), max_len, device=self.device).float()
+                for i, (_, p_len, item_pitch, item_pitchf) in enumerate(items):
+                    pitch[i, :item_pitch.shape[1]] = item_pitch[0]
+                    pitchf[i, :item_pitchf.shape[1]] = item_pitchf[0]
+                audio = net_g.infer(feats, p_lens, pitch, pitchf, sid)[0]
+            else:
+                audio = net_g.infer(feats, p_lens, sid)[0]
+
+        hop = audio.shape[-1] // max_len
+        outputs = [audio[i, 0, :p_len * hop].data.cpu().float().numpy() for i, (_, p_len, _, _) in enumerate(items)]
+        del feats, p_lens, sid, audio
+        return outputs
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'pieces': self.pieces,
+            'avg_batch': round(self.pieces / self.batches, 2) if self.batches else 0
+        }
+
+
+def batched_pipeline(batcher, model, audio, input_audio_path, f0_up_key, f0_method, file_index, index_rate, if_f0,
+                     filter_radius, tgt_sr, rms_mix_rate, protect, crepe_hop_length, feature_cache=None):
+    """כמו VC.pipeline: החיתוך ל-f0 וחישוב ה-f0 נעשים כאן, ו-HuBERT/net_g עוברים דרך ה-batcher
+
+    feature_cache - תכונות HuBERT ו-f0 גולמי של הבלוק נשמרים/נטענים ממנו, כך שהמרה חוזרת של אותו
+    stem (מודל אחר, pitch או protect אחרים) מריצה רק את הסינתיסייזר.
+    """
+    vc = model["vc"]
+    index, big_npy = load_index(file_index, index_rate)
+
+    cache_key, cached = None, None
+    if feature_cache is not None:
+        cache_key = feature_cache.key(
+            audio, hop=vc.window, f0_method=f0_method if if_f0 == 1 else None, filter_radius=filter_radius,
+            crepe_hop_length=crepe_hop_length, version=model["version"], is_half=batcher.is_half,
+            t_pad=vc.t_pad, t_query=vc.t_query, t_center=vc.t_center, t_max=vc.t_max
+        )
+        cached = feature_cache.load(cache_key)
+
+    audio = signal.filtfilt(bh, ah, audio)
+    audio_pad = np.pad(audio, (vc.window // 2, vc.window // 2), mode="reflect")
+    opt_ts = []
+    if audio_pad.shape[0] > vc.t_max:
+        audio_sum = np.zeros_like(audio)
+        for i in range(vc.window):
+            audio_sum += audio_pad[i:i - vc.window]
+        for t in range(vc.t_center, audio.shape[0], vc.t_center):
+            window_sum = np.abs(audio_sum[t - vc.t_query:t + vc.t_query])
+            opt_ts.append(t - vc.t_query + np.where(window_sum == window_sum.min())[0][0])
+
+    audio_pad = np.pad(audio, (vc.t_pad, vc.t_pad), mode="reflect")
+    p_len = audio_pad.shape[0] // vc.window
+    pitch, pitchf, f0_raw = None, None, None
+    if if_f0 == 1:
+        if cached is not None and cached[0] is not None:
+            f0_raw = np.asarray(cached[0], dtype=np.float32)
+        else:
+            # f0 בלי שינוי פיץ' - השינוי והכימות נעשים כאן, כדי שה-f0 הגולמי יתאים לכל pitch
+            f0_raw = vc.get_f0(input_audio_path, audio_pad, p_len, 0, f0_method, filter_radius, crepe_hop_length)[1]
+        pitch, pitchf = f0_to_pitch(f0_raw, f0_up_key)
+        pitch = torch.tensor(pitch[:p_len], device=vc.device).unsqueeze(0).long()
+        pitchf = torch.tensor(pitchf[:p_len].astype(np.float32), device=vc.device).unsqueeze(0).float()
+
+    def piece(start, end=None, f0_end=None):
+        frames = slice(start // vc.window, None if f0_end is None else f0_end // vc.window)
+        return _Piece(
+            model, audio_pad[start:end].astype(np.float32),
+            pitch[:, frames] if pitch is not None else None,
+            pitchf[:, frames] if pitchf is not None else None,
+            index, big_npy, index_rate, protect
+        )
+
+    pieces = []
+    s = 0
+    for t in opt_ts:
+        t = t // vc.window * vc.window
+        pieces.append(piece(s, t + vc.t_pad2 + vc.window, t + vc.t_pad2))
+        s = t
+    pieces.append(piece(s))
+
+    hit = cached is not None and len(cached[1]) == len(pieces) and (if_f0 != 1 or cached[0] is not None)
+    if hit:
+        for p, feats in zip(pieces, cached[1]):
+            p.feats = torch.from_numpy(np.array(feats)).unsqueeze(0)
+
+    audio_opt = np.concatenate([output[vc.t_pad_tgt:-vc.t_pad_tgt] for output in batcher.infer(pieces)])
+    if feature_cache is not None and not hit:
+        feature_cache.store(cache_key, f0_raw, [p.feats[0].cpu().numpy() for p in pieces])
+    if rms_mix_rate != 1:
+        audio_opt = change_rms(audio, 16000, audio_opt, tgt_sr, rms_mix_rate)
+
+    audio_max = np.abs(audio_opt).max() / 0.99
+    max_int16 = 32768
+    if audio_max > 1:
+        max_int16 /= audio_max
+    return (audio_opt * max_int16).astype(np.int16)
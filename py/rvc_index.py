@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+FAISS retrieval index loading without temp copies, cached in memory with precomputed feature vectors
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+_original_read_index = faiss.read_index
+
+
+def read_index_file(path):
+    """קורא אינדקס בלי להעתיק אותו: mmap, ואם לא אפשרי - דרך אובייקט קובץ של Python"""
+    path = str(path)
+    # fopen של faiss לא מתמודד עם נתיבים בעברית ב-Windows, אז mmap רק לנתיבי ASCII
+    if path.isascii() and hasattr(faiss, 'IO_FLAG_MMAP'):
+        try:
+            return _original_read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except Exception as e:
+            print(f"mmap index load failed, reading through Python: {e}")
+
+    # open של Python מקבל כל נתיב, ו-faiss קורא מה-handle בלי קובץ זמני
+    if hasattr(faiss, 'PyCallbackIOReader'):
+        with open(path, 'rb') as f:
+            return _original_read_index(faiss.PyCallbackIOReader(f.read))
+    return faiss.deserialize_index(np.fromfile(path, dtype=np.uint8))
+
+
+class CachedIndex:
+    """עוטף אינדקס טעון; הווקטורים של reconstruct_n מחושבים פעם אחת ונשמרים"""
+
+    def __init__(self, index):
+        self.index = index
+        self.vectors = index.reconstruct_n(0, index.ntotal)
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    def reconstruct_n(self, start, count):
+        if start == 0 and count == self.index.ntotal:
+            return self.vectors
+        return self.index.reconstruct_n(start, count)
+
+    def search(self, x, k):
+        return self.index.search(x, k)
+
+
+class IndexCache:
+    """אינדקסים טעונים לפי נתיב, גודל וזמן שינוי - נשארים בזיכרון בין המרות (LRU)"""
+
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.loads = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+            print(f"Loading index {os.path.basename(path)}...")
+            entry = self._entries[key] = CachedIndex(read_index_file(path))
+            self.loads += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry
+
+
+index_cache = IndexCache()
+
+
+def load_index(file_index, index_rate):
+    """מחזיר (אינדקס, וקטורים) מהמטמון, או (None, None) כשאין אינדקס או index_rate=0"""
+    if file_index and os.path.exists(file_index) and index_rate != 0:
+        index = index_cache.get(file_index)
+        return index, index.vectors
+    return None, None
+
+
+def install():
+    """מחליף את faiss.read_index כך שגם VC.pipeline יקבל אינדקסים מהמטמון"""
+    def read_index(filename, *args):
+        if not args and isinstance(filename, (str, os.PathLike)) and os.path.exists(filename):
+            return index_cache.get(os.fspath(filename))
+        return _original_read_index(filename, *args)
+
+    faiss.read_index = read_index
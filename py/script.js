@@ -148,6 +148,7 @@ const outputPlaceholder = document.getElementById('outputPlaceholder');
 const processingStatus = document.getElementById('processingStatus');
 const audioPlayer = document.getElementById('audioPlayer');
 const enhancedMode = document.getElementById('enhancedMode');
+const previewMode = document.getElementById('previewMode');
 
 // Disable process button initially
 processBtn.disabled = true;
@@ -210,17 +211,6 @@ processBtn.addEventListener('click', async () => {
     statusText.textContent = 'Processing audio...';
     progressFill.style.width = '0%';
 
-    // Simulate progress
-    let progress = 0;
-    const interval = setInterval(() => {
-        progress += 5;
-        progressFill.style.width = progress + '%';
-
-        if (progress >= 95) {
-            clearInterval(interval);
-        }
-    }, 500);
-
     try {
         const response = await fetch('/api/process', {
             method: 'POST',
@@ -229,13 +219,18 @@ processBtn.addEventListener('click', async () => {
             },
             body: JSON.stringify({
                 youtube_url: youtubeUrlToProcess,
-                enhanced: enhancedMode.checked
+                enhanced: enhancedMode.checked,
+                preview: previewMode.checked
             })
         });
 
-        const data = await response.json();
+        const submitted = await response.json();
+        if (submitted.error) {
+            throw new Error(submitted.error);
+        }
+
+        const data = await waitForJob(submitted.job_id, statusText, progressFill);
 
-        clearInterval(interval);
         progressFill.style.width = '100%';
 
         if (data.error) {
@@ -254,7 +249,6 @@ processBtn.addEventListener('click', async () => {
         }, 500);
 
     } catch (error) {
-        clearInterval(interval);
         console.error('Processing error:', error);
         alert('Processing failed: ' + error.message);
         processingStatus.style.display = 'none';
@@ -262,6 +256,93 @@ processBtn.addEventListener('click', async () => {
     }
 });
 
+// Follow a background job until it finishes and return its result
+const stageLabels = {
+    download: 'Downloading audio...',
+    separation: 'Separating vocals...',
+    rvc: 'Processing vocals...',
+    ffmpeg: 'Merging audio...'
+};
+
+function formatEta(seconds) {
+    if (seconds === null || seconds === undefined) return '';
+    const minutes = Math.floor(seconds / 60);
+    const rest = Math.round(seconds % 60);
+    return minutes > 0 ? ` ~${minutes}m ${rest}s left` : ` ~${rest}s left`;
+}
+
+function showJobState(data, statusText, progressFill) {
+    if (data.stage) {
+        const [state, stage] = data.stage.split(':');
+        let label = state === 'waiting'
+            ? `Waiting in queue (${stage})...`
+            : (stageLabels[data.stage] || 'Processing audio...');
+        const progress = data.progress;
+        if (state !== 'waiting' && progress && progress.stage === data.stage) {
+            if (progress.fraction !== null && progress.fraction !== undefined) {
+                label += ` ${Math.round(progress.fraction * 100)}%`;
+            }
+            label += formatEta(progress.eta);
+        }
+        statusText.textContent = label;
+    }
+
+    if (data.progress && progressFill) {
+        progressFill.style.width = Math.round(data.progress.overall * 100) + '%';
+    }
+}
+
+function jobResult(data) {
+    if (data.status === 'done') return data.result;
+    if (data.status === 'cancelled') return { error: 'Job was cancelled' };
+    return { error: data.error || 'Processing failed' };
+}
+
+// One server-sent events connection per job; falls back to polling when it isn't available
+function waitForJob(jobId, statusText, progressFill) {
+    if (!window.EventSource) {
+        return pollJob(jobId, statusText, progressFill);
+    }
+
+    return new Promise((resolve) => {
+        const source = new EventSource(`/api/jobs/${jobId}/events`);
+        let received = false;
+
+        source.addEventListener('progress', (event) => {
+            received = true;
+            showJobState(JSON.parse(event.data), statusText, progressFill);
+        });
+
+        source.addEventListener('done', (event) => {
+            source.close();
+            resolve(jobResult(JSON.parse(event.data)));
+        });
+
+        source.onerror = () => {
+            // EventSource reconnects by itself once the stream was up; fall back if it never connected or gave up
+            if (!received || source.readyState === EventSource.CLOSED) {
+                source.close();
+                resolve(pollJob(jobId, statusText, progressFill));
+            }
+        };
+    });
+}
+
+async function pollJob(jobId, statusText, progressFill) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}/result`);
+        const data = await response.json();
+
+        if (response.status !== 202) {
+            return data;
+        }
+
+        showJobState(data, statusText, progressFill);
+
+        await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+}
+
 // System panel toggle
 const panelToggle = document.getElementById('panelToggle');
 const systemPanel = document.getElementById('systemPanel');
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+In-flight request coalescing: concurrent callers with the same key share one computation
+"""
+
+import threading
+
+from job_scheduler import JobCancelled
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """הקורא הראשון למפתח מריץ את העבודה, והשאר מחכים לתוצאה שלו"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, stage, key, fn, job=None):
+        """מריץ fn() פעם אחת לכל (stage, key) בו-זמנית; מחזיר (ערך, shared)"""
+        flight_key = (stage, key)
+        while True:
+            with self._lock:
+                call = self._calls.get(flight_key)
+                leader = call is None
+                if leader:
+                    call = self._calls[flight_key] = _Call()
+                    self.leaders += 1
+                else:
+                    call.followers += 1
+                    self.coalesced += 1
+
+            if leader:
+                try:
+                    call.value = fn()
+                except BaseException as e:
+                    call.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        del self._calls[flight_key]
+                    call.done.set()
+                return call.value, False
+
+            print(f"[SingleFlight] Waiting for in-flight {stage} {str(key)[:12]}")
+            if job is not None:
+                job.stage = f"waiting:{stage}"
+            # ממתינים בפרוסות זמן כדי שביטול של העוקב ייקלט
+            while not call.done.wait(0.5):
+                if job is not None:
+                    job.check_cancelled()
+
+            # אם המוביל בוטל, העבודה לא נכשלה - אחד העוקבים לוקח את ההובלה
+            if isinstance(call.error, JobCancelled):
+                continue
+            if call.error is not None:
+                raise Exception(str(call.error))
+            return call.value, True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced
+            }
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+sf = pytest.importorskip('soundfile')
+
+import audio_buffers
+
+
+def write_wav(tmp_path, name, data, sr):
+    path = str(tmp_path / name)
+    sf.write(path, data, sr, subtype='FLOAT')
+    return path
+
+
+def noise(seconds, sr, channels, seed=0):
+    return np.random.default_rng(seed).uniform(-0.5, 0.5, (int(seconds * sr), channels)).astype(np.float32)
+
+
+@pytest.mark.parametrize('native_sr', [40000, 44100, 48000])
+def test_read_blocks_matches_whole_file_resample(tmp_path, native_sr):
+    data = noise(3.3, native_sr, 2)
+    path = write_wav(tmp_path, 'a.wav', data, native_sr)
+
+    blocks = list(audio_buffers.read_blocks(path, 44100, block_seconds=0.5))
+    whole = audio_buffers.resample(data, native_sr, 44100)
+
+    assert len(blocks) == 7
+    np.testing.assert_allclose(np.concatenate(blocks), whole, atol=1e-5)
+
+
+def test_read_blocks_window(tmp_path):
+    data = noise(4.0, 40000, 1)
+    path = write_wav(tmp_path, 'a.wav', data, 40000)
+
+    blocks = list(audio_buffers.read_blocks(path, 44100, block_seconds=0.5, start=1.01, duration=2.0))
+    whole = audio_buffers.resample(data, 40000, 44100)
+    first = round(1.01 * 44100)
+
+    joined = np.concatenate(blocks)
+    assert len(joined) == 2 * 44100
+    np.testing.assert_allclose(joined, whole[first:first + len(joined)], atol=1e-5)
+
+
+def test_rechunk():
+    blocks = [np.full((n, 1), i, dtype=np.float32) for i, n in enumerate((3, 5, 4))]
+    chunks = list(audio_buffers.rechunk(blocks, 5))
+    assert [len(chunk) for chunk in chunks] == [5, 5, 2]
+    np.testing.assert_array_equal(np.concatenate(chunks), np.concatenate(blocks))
+
+
+def test_mix_blocks_is_longest_and_normalised():
+    vocals = [np.ones((7, 1), dtype=np.float32)]
+    instrumental = [np.full((4, 2), 0.5, dtype=np.float32), np.full((6, 2), 0.5, dtype=np.float32)]
+    mixed = np.concatenate(list(audio_buffers.mix_blocks([vocals, instrumental], 2, 3, gains=[2.0, 1.0])))
+
+    assert mixed.shape == (10, 2)
+    np.testing.assert_allclose(mixed[:7], 1.25)
+    np.testing.assert_allclose(mixed[7:], 0.25)
+
+
+def test_blocks_rms_and_gain():
+    blocks = [np.full((10, 2), 0.5, dtype=np.float32), np.full((30, 2), 0.5, dtype=np.float32)]
+    assert audio_buffers.blocks_rms(blocks) == pytest.approx(0.5)
+    assert audio_buffers.blocks_rms([]) == 0.0
+    assert audio_buffers.matching_gain(0.1, 0.2) == pytest.approx(2.0)
+    assert audio_buffers.matching_gain(0.01, 1.0) == 4.0
+    assert audio_buffers.matching_gain(0.0, 1.0) == 1.0
+
+
+def test_unreadable_file(tmp_path):
+    path = tmp_path / 'broken.wav'
+    path.write_bytes(b'not audio')
+    with pytest.raises(audio_buffers.UnreadableAudio):
+        audio_buffers.audio_info(str(path))
+    with pytest.raises(audio_buffers.UnreadableAudio):
+        list(audio_buffers.read_blocks(str(path), 44100))
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+from audio_cache import ContentCache, make_key
+
+
+def write_file(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    return str(path)
+
+
+def put(cache, tmp_path, key, size=100):
+    src = write_file(tmp_path / f"{key}.wav", size)
+    return cache.put(key, {'vocals': src})
+
+
+def test_put_get_round_trip(tmp_path):
+    cache = ContentCache(str(tmp_path / 'cache'), 10_000, 'TestCache')
+    paths = put(cache, tmp_path, 'a')
+    cache.release('a')
+
+    assert os.path.exists(paths['vocals'])
+    assert not os.path.exists(tmp_path / 'a.wav')
+    assert cache.get('a') == paths
+    cache.release('a')
+    assert cache.get('missing') is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ContentCache(str(tmp_path / 'cache'), 250, 'TestCache')
+    for key in ('a', 'b'):
+        put(cache, tmp_path, key)
+        cache.release(key)
+    cache.get('a')
+    cache.release('a')
+
+    put(cache, tmp_path, 'c')
+    cache.release('c')
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_pinned_entry_is_not_evicted(tmp_path):
+    cache = ContentCache(str(tmp_path / 'cache'), 250, 'TestCache')
+    pinned = put(cache, tmp_path, 'a')
+    put(cache, tmp_path, 'b')
+    cache.release('b')
+    put(cache, tmp_path, 'c')
+    cache.release('c')
+
+    # a מוצמד, ולכן הפינוי מוחק את b למרות ש-a ישן יותר
+    assert os.path.exists(pinned['vocals'])
+    assert cache.get('b') is None
+
+    cache.release('a')
+    put(cache, tmp_path, 'd')
+    cache.release('d')
+    assert cache.get('a') is None
+
+
+def test_hits_are_flushed_to_index(tmp_path):
+    root = str(tmp_path / 'cache')
+    cache = ContentCache(root, 10_000, 'TestCache', flush_interval=3600)
+    put(cache, tmp_path, 'a')
+    cache.release('a')
+    with open(os.path.join(root, 'index.json'), encoding='utf-8') as f:
+        stored = json.load(f)['a']['last_access']
+
+    cache.get('a')
+    cache.release('a')
+    with open(os.path.join(root, 'index.json'), encoding='utf-8') as f:
+        assert json.load(f)['a']['last_access'] == stored
+
+    cache.flush()
+    with open(os.path.join(root, 'index.json'), encoding='utf-8') as f:
+        assert json.load(f)['a']['last_access'] > stored
+    assert ContentCache(root, 10_000, 'TestCache').get('a') is not None
+
+
+def test_make_key_is_stable():
+    assert make_key('abc', 'htdemucs', 2) == make_key('abc', 'htdemucs', 2)
+    assert make_key('abc', 'htdemucs', 2) != make_key('abc', 'htdemucs', 3)
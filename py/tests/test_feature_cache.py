@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from feature_cache import FeatureCache, f0_to_pitch
+
+
+def test_store_load_round_trip(tmp_path):
+    cache = FeatureCache(str(tmp_path), 10 * 1024 * 1024)
+    audio = np.random.default_rng(0).standard_normal(16000).astype(np.float32)
+    key = cache.key(audio, hop=160, f0_method='rmvpe')
+    f0 = np.linspace(0, 440, 100, dtype=np.float32)
+    feats = [np.random.default_rng(i).standard_normal((50, 768)).astype(np.float32) for i in range(3)]
+
+    assert cache.load(key) is None
+    cache.store(key, f0, feats)
+    loaded_f0, loaded_feats = cache.load(key)
+
+    np.testing.assert_allclose(loaded_f0, f0, rtol=1e-3, atol=0.5)
+    assert len(loaded_feats) == 3
+    for stored, original in zip(loaded_feats, feats):
+        assert stored.dtype == np.float16
+        np.testing.assert_allclose(stored, original, rtol=1e-3, atol=1e-3)
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_store_without_f0(tmp_path):
+    cache = FeatureCache(str(tmp_path), 10 * 1024 * 1024)
+    cache.store('k', None, [np.ones((4, 8), dtype=np.float32)])
+    f0, feats = cache.load('k')
+    assert f0 is None
+    assert feats[0].shape == (4, 8)
+
+
+def test_key_depends_on_audio_and_params():
+    cache_key = FeatureCache.key
+    audio = np.zeros(100, dtype=np.float32)
+    base = cache_key(None, audio, hop=160)
+    assert base == cache_key(None, audio.astype(np.float64), hop=160)
+    assert base != cache_key(None, audio, hop=320)
+    assert base != cache_key(None, audio + 1, hop=160)
+
+
+def test_evicts_oldest_entries_over_limit(tmp_path):
+    feats = [np.zeros((256, 64), dtype=np.float32)]
+    cache = FeatureCache(str(tmp_path), 1)
+    entry_size = None
+    for i, key in enumerate(('a', 'b', 'c')):
+        cache.store(key, None, feats)
+        os.utime(tmp_path / key, (i, i))
+        if entry_size is None:
+            entry_size = cache.stats()['bytes']
+            cache.max_bytes = 2 * entry_size
+    assert sorted(os.listdir(tmp_path)) == ['b', 'c']
+    assert cache.stats()['bytes'] == 2 * entry_size
+
+    # מופע חדש סופר את מה שכבר על הדיסק
+    assert FeatureCache(str(tmp_path), 2 * entry_size).stats()['bytes'] == 2 * entry_size
+
+
+def test_f0_to_pitch():
+    f0 = np.array([0.0, 100.0, 220.0, 2000.0])
+    pitch, pitchf = f0_to_pitch(f0, 12)
+    np.testing.assert_allclose(pitchf, f0 * 2)
+    assert pitch[0] == 1
+    assert pitch[-1] == 255
+    assert np.all((pitch >= 1) & (pitch <= 255))
+    assert pitch[1] < pitch[2]
+
+    _, unshifted = f0_to_pitch(f0, 0)
+    np.testing.assert_allclose(unshifted, f0)
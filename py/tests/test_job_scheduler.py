@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from job_scheduler import JobCancelled, JobScheduler
+
+
+def wait_done(job, timeout=5.0):
+    deadline = time.time() + timeout
+    while not job.done:
+        assert time.time() < deadline, f"job {job.kind} did not finish"
+        job.wait_for_change(job.version, 0.1)
+    return job
+
+
+def blocking_job(scheduler, gate):
+    started = threading.Event()
+
+    def run(job):
+        started.set()
+        gate.wait(5)
+        return 'blocker'
+
+    job = scheduler.submit(run, {}, kind='blocker', lane='batch')
+    assert started.wait(5)
+    return job
+
+
+def test_queued_jobs_run_by_lane_then_arrival():
+    scheduler = JobScheduler({'rvc': 1}, max_active=1, reserved=0)
+    gate = threading.Event()
+    blocker = blocking_job(scheduler, gate)
+
+    order = []
+    jobs = [scheduler.submit(lambda job, name: order.append(name), {'name': name}, lane=lane)
+            for name, lane in (('b1', 'batch'), ('i1', 'interactive'), ('p1', 'preview'), ('b2', 'batch'))]
+    gate.set()
+    for job in [blocker] + jobs:
+        wait_done(job)
+
+    assert order == ['p1', 'i1', 'b1', 'b2']
+
+
+def test_reserved_thread_runs_preview_while_regular_threads_are_busy():
+    scheduler = JobScheduler({'rvc': 1}, max_active=1, reserved=1)
+    gate = threading.Event()
+    blocker = blocking_job(scheduler, gate)
+
+    batch = scheduler.submit(lambda job: 'batch', {}, lane='batch')
+    preview = scheduler.submit(lambda job: 'preview', {}, lane='preview')
+    assert wait_done(preview).result == 'preview'
+    assert batch.status == 'queued'
+
+    gate.set()
+    assert wait_done(batch).result == 'batch'
+    wait_done(blocker)
+
+
+def test_cancel_queued_job_never_runs():
+    scheduler = JobScheduler({'rvc': 1}, max_active=1, reserved=0)
+    gate = threading.Event()
+    blocker = blocking_job(scheduler, gate)
+
+    ran = []
+    job = scheduler.submit(lambda job: ran.append(job.id), {})
+    scheduler.cancel(job.id)
+    gate.set()
+
+    assert wait_done(job).status == 'cancelled'
+    assert job.finished is not None
+    assert ran == []
+    wait_done(blocker)
+
+
+def test_cancel_while_waiting_for_stage_slot():
+    scheduler = JobScheduler({'rvc': 1}, max_active=2, reserved=0)
+    inside = threading.Event()
+    gate = threading.Event()
+
+    def hold_stage(job):
+        with scheduler.stage('rvc', job):
+            inside.set()
+            gate.wait(5)
+
+    def wait_stage(job):
+        with scheduler.stage('rvc', job):
+            return 'never'
+
+    holder = scheduler.submit(hold_stage, {})
+    assert inside.wait(5)
+    waiter = scheduler.submit(wait_stage, {})
+    while waiter.stage != 'waiting:rvc':
+        time.sleep(0.01)
+    scheduler.cancel(waiter.id)
+
+    assert wait_done(waiter).status == 'cancelled'
+    gate.set()
+    assert wait_done(holder).status == 'done'
+
+
+def test_cancel_during_stage_stops_at_next_stage():
+    scheduler = JobScheduler({'separation': 1, 'rvc': 1}, max_active=1, reserved=0)
+    inside = threading.Event()
+    gate = threading.Event()
+    stored = []
+
+    def run(job):
+        with scheduler.stage('separation', job):
+            inside.set()
+            gate.wait(5)
+        # התוצאה של שלב שהסתיים נשמרת גם אם המשימה בוטלה בזמנו
+        stored.append('stems')
+        with scheduler.stage('rvc', job):
+            stored.append('vocals')
+
+    job = scheduler.submit(run, {})
+    assert inside.wait(5)
+    scheduler.cancel(job.id)
+    gate.set()
+
+    assert wait_done(job).status == 'cancelled'
+    assert stored == ['stems']
+
+
+def test_failed_job_records_error():
+    scheduler = JobScheduler({'rvc': 1}, max_active=1, reserved=0)
+
+    def fail(job):
+        raise Exception('boom')
+
+    job = wait_done(scheduler.submit(fail, {}))
+    assert job.status == 'failed'
+    assert job.error == 'boom'
+    assert job.finished is not None
+
+
+def test_held_group_is_not_pruned():
+    scheduler = JobScheduler({'rvc': 1}, max_active=1, history=1, reserved=0)
+    scheduler.hold('batch-1')
+    item = wait_done(scheduler.submit(lambda job: 'item', {}, group='batch-1'))
+    for _ in range(3):
+        wait_done(scheduler.submit(lambda job: None, {}))
+    scheduler.submit(lambda job: None, {})
+
+    assert scheduler.get(item.id) is item
+    scheduler.release_group('batch-1')
+    assert scheduler.get(item.id) is None
+
+
+def test_check_cancelled_raises():
+    scheduler = JobScheduler({'rvc': 1}, max_active=1, reserved=0)
+    job = scheduler.submit(lambda job: None, {})
+    wait_done(job)
+    job.cancel()
+    with pytest.raises(JobCancelled):
+        job.check_cancelled()
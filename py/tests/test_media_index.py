@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import pytest
+
+from media_index import MediaCacheEvictor, MediaIndex, canonical_video_id, media_key
+
+VIDEO_ID = 'dQw4w9WgXcQ'
+
+
+@pytest.mark.parametrize('url', [
+    VIDEO_ID,
+    f'https://www.youtube.com/watch?v={VIDEO_ID}',
+    f'https://youtube.com/watch?v={VIDEO_ID}&t=42s&list=PL123',
+    f'https://m.youtube.com/watch?feature=share&v={VIDEO_ID}',
+    f'youtube.com/watch?v={VIDEO_ID}',
+    f'https://youtu.be/{VIDEO_ID}?si=abcdef',
+    f'https://www.youtube.com/shorts/{VIDEO_ID}',
+    f'https://www.youtube.com/embed/{VIDEO_ID}?start=10',
+    f'https://www.youtube-nocookie.com/embed/{VIDEO_ID}',
+    f'https://music.youtube.com/watch?v={VIDEO_ID}',
+    f'  https://youtu.be/{VIDEO_ID}  ',
+])
+def test_canonical_video_id(url):
+    assert canonical_video_id(url) == VIDEO_ID
+
+
+@pytest.mark.parametrize('url', [
+    '',
+    None,
+    'https://soundcloud.com/artist/track',
+    'https://www.youtube.com/watch?v=short',
+    'https://www.youtube.com/channel/UC1234567890',
+    f'https://notyoutube.com/watch?v={VIDEO_ID}',
+])
+def test_canonical_video_id_rejects(url):
+    assert canonical_video_id(url) is None
+
+
+def test_media_key():
+    assert media_key(f'https://youtu.be/{VIDEO_ID}') == media_key(f'https://www.youtube.com/watch?v={VIDEO_ID}')
+    assert media_key(' https://soundcloud.com/a/b ') == 'https://soundcloud.com/a/b'
+
+
+def add_media(index, tmp_path, key, size, last_access, hits=0):
+    path = tmp_path / f"{key}.mp3"
+    path.write_bytes(b'\0' * size)
+    index.put(key, str(path), key)
+    index._conn.execute('UPDATE media SET last_access = ?, hits = ? WHERE key = ?', (last_access, hits, key))
+    return str(path)
+
+
+@pytest.fixture
+def index(tmp_path):
+    return MediaIndex(str(tmp_path / 'media.db'))
+
+
+def test_get_updates_hits_and_drops_missing_files(index, tmp_path):
+    path = add_media(index, tmp_path, 'a', 10, 1.0)
+    assert index.get('a')['path'] == path
+    assert index.eviction_order()[0]['hits'] == 1
+
+    os.remove(path)
+    assert index.get('a') is None
+    assert index.count() == 0
+
+
+def test_size_eviction_lru(index, tmp_path):
+    now = time.time()
+    paths = {key: add_media(index, tmp_path, key, 100, now - age, hits)
+             for key, age, hits in (('old', 300, 9), ('mid', 200, 0), ('new', 100, 0))}
+    evictor = MediaCacheEvictor(index, max_bytes=150, min_idle=0)
+    evictor.run_once()
+
+    assert not os.path.exists(paths['old'])
+    assert not os.path.exists(paths['mid'])
+    assert os.path.exists(paths['new'])
+    assert evictor.evicted_by_size == 2
+    assert index.total_size() == 100
+
+
+def test_size_eviction_lfu(index, tmp_path):
+    now = time.time()
+    for key, age, hits in (('old', 300, 9), ('mid', 200, 0), ('new', 100, 1)):
+        add_media(index, tmp_path, key, 100, now - age, hits)
+    MediaCacheEvictor(index, max_bytes=250, policy='lfu', min_idle=0).run_once()
+
+    assert [entry['key'] for entry in index.eviction_order('lfu')] == ['new', 'old']
+
+
+def test_age_eviction_respects_min_idle(index, tmp_path):
+    now = time.time()
+    add_media(index, tmp_path, 'stale', 10, now - 7200)
+    add_media(index, tmp_path, 'recent', 10, now - 60)
+    evictor = MediaCacheEvictor(index, max_bytes=0, max_age=30, min_idle=3600)
+    evictor.run_once()
+
+    assert [entry['key'] for entry in index.eviction_order()] == ['recent']
+    assert evictor.evicted_by_age == 1
+
+
+def test_pinned_entries_are_not_evicted(index, tmp_path):
+    now = time.time()
+    pinned = add_media(index, tmp_path, 'pinned', 100, now - 300)
+    add_media(index, tmp_path, 'other', 100, now - 200)
+    index.pin('pinned')
+    MediaCacheEvictor(index, max_bytes=100, min_idle=0).run_once()
+
+    assert os.path.exists(pinned)
+    assert [entry['key'] for entry in index.eviction_order()] == []
+
+    index.release('pinned')
+    assert not index.pinned('pinned')
+    assert [entry['key'] for entry in index.eviction_order()] == ['pinned']
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+import sys
+import threading
+import types
+
+import pytest
+
+np = pytest.importorskip('numpy')
+torch = pytest.importorskip('torch')
+signal = pytest.importorskip('scipy.signal')
+pytest.importorskip('faiss')
+
+if importlib.util.find_spec('vc_infer_pipeline') is None:
+    # מגיע מתיקיית RVC; אותו מסנן high-pass, ו-change_rms לא נקרא עם rms_mix_rate=1
+    bh, ah = signal.butter(N=5, Wn=48, btype="high", fs=16000)
+    sys.modules['vc_infer_pipeline'] = types.SimpleNamespace(bh=bh, ah=ah, change_rms=None)
+
+from rvc_batch import RVCBatcher, _Piece, batched_pipeline
+
+WINDOW = 160
+HOP = 4
+
+
+class FakeHubert:
+    """תכונות לכל 320 דגימות שתלויות רק בדגימות של השורה עצמה"""
+
+    def __init__(self):
+        self.calls = []
+
+    def extract_features(self, source, padding_mask, output_layer):
+        self.calls.append(tuple(source.shape))
+        frames = source.reshape(source.shape[0], -1, 320)
+        feats = torch.stack([frames.mean(-1), frames.std(-1), frames.max(-1).values, frames.min(-1).values], -1)
+        return feats, None
+
+
+class FakeNetG:
+    def infer(self, feats, p_lens, sid):
+        audio = feats.sum(-1).repeat_interleave(HOP, dim=1)
+        return audio.unsqueeze(1), None
+
+
+def make_vc():
+    t_pad = 1600
+    return types.SimpleNamespace(window=WINDOW, t_pad=t_pad, t_pad2=2 * t_pad, t_pad_tgt=t_pad // WINDOW * HOP,
+                                 t_query=1600, t_center=16000, t_max=160000, device='cpu')
+
+
+def make_model(net_g=None, vc=None):
+    return {"vc": vc or make_vc(), "version": "v2", "net_g": net_g or FakeNetG()}
+
+
+def make_pieces(model, lengths, seed=0):
+    rng = np.random.default_rng(seed)
+    return [_Piece(model, rng.standard_normal(length).astype(np.float32), None, None, None, None, 0, 0.5)
+            for length in lengths]
+
+
+def run(max_batch, model, pieces):
+    hubert = FakeHubert()
+    batcher = RVCBatcher(hubert, 'cpu', False, max_batch=max_batch, max_wait=0.5)
+    return batcher.infer(pieces), hubert, batcher
+
+
+def test_batched_output_matches_unbatched_on_same_length_pieces():
+    model = make_model()
+    batched, hubert, batcher = run(3, model, make_pieces(model, [3200] * 3))
+    unbatched, _, single = run(1, model, make_pieces(model, [3200] * 3))
+
+    assert batcher.stats()['batches'] == 1
+    assert single.stats()['batches'] == 3
+    assert hubert.calls == [(3, 3200)]
+    for a, b in zip(batched, unbatched):
+        assert a.shape == (3200 // WINDOW * HOP,)
+        np.testing.assert_allclose(a, b, rtol=1e-6, atol=1e-6)
+
+
+def test_mixed_lengths_run_hubert_per_length():
+    model = make_model()
+    lengths = [3200, 3520, 3200]
+    batched, hubert, batcher = run(3, model, make_pieces(model, lengths))
+    unbatched, _, _ = run(1, model, make_pieces(model, lengths))
+
+    assert batcher.stats()['batches'] == 1
+    assert sorted(hubert.calls) == [(1, 3520), (2, 3200)]
+    for a, b, length in zip(batched, unbatched, lengths):
+        assert a.shape == (length // WINDOW * HOP,)
+        np.testing.assert_allclose(a, b, rtol=1e-6, atol=1e-6)
+
+
+def run_pipelines(batcher, models, audios):
+    """מריץ batched_pipeline לכל שיר בת'רד משלו, כמו משימות מקבילות באותו worker"""
+    outputs = [None] * len(audios)
+
+    def convert(i):
+        outputs[i] = batched_pipeline(batcher, models[i], audios[i], 'song.wav', 0, 'rmvpe', None, 0, 0,
+                                      3, 100 * HOP, 1, 0.33, 120)
+
+    threads = [threading.Thread(target=convert, args=(i,)) for i in range(len(audios))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return outputs
+
+
+def test_songs_with_separate_model_dicts_share_a_batch():
+    # כל קריאה ל-rvc_infer בונה dict משלה סביב אותו net_g טעון
+    net_g, vc = FakeNetG(), make_vc()
+    rng = np.random.default_rng(1)
+    audios = [rng.standard_normal(3200).astype(np.float32) for _ in range(2)]
+
+    batcher = RVCBatcher(FakeHubert(), 'cpu', False, max_batch=2, max_wait=2.0)
+    batched = run_pipelines(batcher, [make_model(net_g, vc), make_model(net_g, vc)], audios)
+    single = RVCBatcher(FakeHubert(), 'cpu', False, max_batch=1, max_wait=0)
+    unbatched = run_pipelines(single, [make_model(net_g, vc)] * 2, audios)
+
+    assert batcher.stats() == {'batches': 1, 'pieces': 2, 'avg_batch': 2.0}
+    for a, b in zip(batched, unbatched):
+        np.testing.assert_allclose(a, b, atol=1)
+
+
+def test_different_voice_models_are_not_batched():
+    batcher = RVCBatcher(FakeHubert(), 'cpu', False, max_batch=2, max_wait=0.2)
+    pieces = make_pieces(make_model(), [3200]) + make_pieces(make_model(), [3200])
+    batcher.infer(pieces)
+    assert batcher.stats()['batches'] == 2
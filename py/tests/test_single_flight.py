@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from job_scheduler import JobCancelled
+from single_flight import SingleFlight
+
+
+def run_concurrently(flight, fns, key='k'):
+    """מריץ כל fn בת'רד משלו על אותו מפתח ומחזיר את התוצאות/החריגות לפי הסדר"""
+    results = [None] * len(fns)
+
+    def call(i, fn):
+        try:
+            results[i] = flight.do('stems', key, fn)
+        except BaseException as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i, fn)) for i, fn in enumerate(fns)]
+    threads[0].start()
+    while not flight.stats()['in_flight']:
+        time.sleep(0.01)
+    for thread in threads[1:]:
+        thread.start()
+    while flight.stats()['coalesced'] < len(fns) - 1:
+        time.sleep(0.01)
+    return threads, results
+
+
+def test_concurrent_callers_share_one_run():
+    flight = SingleFlight()
+    gate = threading.Event()
+    calls = []
+
+    def leader():
+        calls.append('leader')
+        gate.wait(5)
+        return 'stems'
+
+    def follower():
+        calls.append('follower')
+        return 'other'
+
+    threads, results = run_concurrently(flight, [leader, follower, follower])
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ['leader']
+    assert results == [('stems', False), ('stems', True), ('stems', True)]
+    assert flight.stats() == {'in_flight': 0, 'leaders': 1, 'coalesced': 2}
+
+
+def test_leader_error_reaches_followers():
+    flight = SingleFlight()
+    gate = threading.Event()
+
+    def leader():
+        gate.wait(5)
+        raise ValueError('demucs failed')
+
+    threads, results = run_concurrently(flight, [leader, lambda: 'unused'])
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert isinstance(results[0], ValueError)
+    assert isinstance(results[1], Exception)
+    assert str(results[1]) == 'demucs failed'
+    # אחרי כישלון המפתח פנוי, והקריאה הבאה מריצה מחדש
+    assert flight.do('stems', 'k', lambda: 'retry') == ('retry', False)
+
+
+def test_follower_takes_over_when_leader_is_cancelled():
+    flight = SingleFlight()
+    gate = threading.Event()
+
+    def leader():
+        gate.wait(5)
+        raise JobCancelled()
+
+    threads, results = run_concurrently(flight, [leader, lambda: 'taken over'])
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert isinstance(results[0], JobCancelled)
+    assert results[1] == ('taken over', False)
+    assert flight.stats()['leaders'] == 2
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    assert flight.do('stems', 'a', lambda: 1) == (1, False)
+    assert flight.do('stems', 'b', lambda: 2) == (2, False)
+    assert flight.do('rvc', 'a', lambda: 3) == (3, False)
+    assert flight.stats()['coalesced'] == 0
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Resident child-process workers driven over a JSON-lines stdin/stdout protocol
+"""
+
+import json
+import queue
+import subprocess
+import threading
+import uuid
+
+
+class WorkerCrashed(Exception):
+    """תהליך ה-worker נסגר באמצע משימה"""
+
+
+class ResidentWorker:
+    """תהליך-בן קבוע שמקבל משימות כשורות JSON; כמה משימות יכולות לרוץ עליו במקביל"""
+
+    def __init__(self, command, log_prefix):
+        self.log_prefix = log_prefix
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1
+        )
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def _read_loop(self):
+        """מפזר את הודעות הפרוטוקול למשימות הממתינות לפי id"""
+        for line in self.process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                message = None
+
+            if not isinstance(message, dict) or 'event' not in message:
+                print(f"{self.log_prefix} {line}")
+                continue
+
+            with self._lock:
+                waiter = self._pending.get(message.get('id'))
+            if waiter is not None:
+                waiter.put(message)
+
+        # None מסמן לכל הממתינים שהתהליך נסגר
+        with self._lock:
+            waiters = list(self._pending.values())
+        for waiter in waiters:
+            waiter.put(None)
+
+    def request(self, payload, on_event=None):
+        """שולח משימה ומחכה לאירוע result/error התואם"""
+        job_id = payload.setdefault('id', str(uuid.uuid4()))
+        waiter = queue.Queue()
+        with self._lock:
+            self._pending[job_id] = waiter
+
+        try:
+            try:
+                with self._lock:
+                    self.process.stdin.write(json.dumps(payload) + '\n')
+                    self.process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                raise WorkerCrashed(f"{self.log_prefix} worker is not accepting jobs: {e}")
+
+            while True:
+                message = waiter.get()
+                if message is None:
+                    try:
+                        code = self.process.wait(timeout=5)
+                    except subprocess.TimeoutExpired:
+                        code = None
+                    raise WorkerCrashed(f"{self.log_prefix} worker exited with code {code}")
+
+                event = message['event']
+                if event == 'result':
+                    return message
+                if event == 'error':
+                    raise Exception(message.get('error', 'Unknown worker error'))
+                if on_event:
+                    on_event(message)
+        finally:
+            with self._lock:
+                self._pending.pop(job_id, None)
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        try:
+            self.process.wait(timeout=10)
+        except Exception:
+            self.process.kill()
+
+
+class WorkerPool:
+    """מאגר של workers קבועים - כל משימה נשלחת ל-worker שיש לו מקום פנוי
+
+    concurrency - כמה משימות כל worker מקבל במקביל (למשל כדי לאחד אותן לבאצ'ים).
+    """
+
+    def __init__(self, command, size, log_prefix, concurrency=1):
+        self.command = command
+        self.size = max(1, size)
+        self.concurrency = max(1, concurrency)
+        self.log_prefix = log_prefix
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def _spawn(self):
+        """מפעיל worker חדש ומכניס לתור את המקומות הפנויים שלו מלבד אחד"""
+        worker = ResidentWorker(self.command, self.log_prefix)
+        self._workers.append(worker)
+        for _ in range(self.concurrency - 1):
+            self._idle.put(worker)
+        return worker
+
+    def start(self):
+        """מפעיל מראש את כל ה-workers כדי שהמודלים ייטענו לפני הבקשה הראשונה"""
+        with self._lock:
+            while len(self._workers) < self.size:
+                self._idle.put(self._spawn())
+
+    def _acquire(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    if len(self._workers) < self.size:
+                        return self._spawn()
+                worker = self._idle.get()
+
+            # None מסמן מקום שהתפנה אחרי worker שקרס
+            if worker is None:
+                continue
+            if worker.alive():
+                return worker
+            self._discard(worker)
+
+    def _discard(self, worker):
+        with self._lock:
+            known = worker in self._workers
+            if known:
+                self._workers.remove(worker)
+        if known:
+            worker.close()
+        self._idle.put(None)
+
+    def submit(self, payload, on_event=None):
+        """מריץ משימה על worker פנוי ומחזיר את הודעת התוצאה"""
+        worker = self._acquire()
+        try:
+            return worker.request(payload, on_event)
+        except WorkerCrashed:
+            self._discard(worker)
+            worker = None
+            raise
+        finally:
+            if worker is not None:
+                self._idle.put(worker)
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
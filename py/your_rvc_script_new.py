@@ -1,7 +1,14 @@
 # your_rvc_script_new.py
 import argparse
+import json
 import os
+import subprocess
 import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
 from pathlib import Path
 from multiprocessing import cpu_count
 import torch
@@ -17,50 +24,11 @@ now_dir = os.getcwd()
 sys.path.append(now_dir)
 sys.path.append(os.path.join(now_dir, "RVC-v2-UI", "src"))
 
-# Monkey patch faiss to handle Hebrew paths
 import shutil
-def patch_faiss_for_hebrew_paths():
-    try:
-        import faiss
-        original_read_index = faiss.read_index
-        
-        def read_index_with_hebrew_support(filename):
-            try:
-                return original_read_index(filename)
-            except:
-                # אם נכשל, נסה להעתיק לתיקיה זמנית עם שם באנגלית
-                if not isinstance(filename, str):
-                    filename = str(filename)
-                
-                # צור תיקיה זמנית
-                temp_dir = os.path.join(now_dir, "temp_index")
-                os.makedirs(temp_dir, exist_ok=True)
-                
-                # שם קובץ זמני
-                temp_filename = os.path.join(temp_dir, "temp_index.index")
-                
-                # העתק את הקובץ
-                shutil.copy2(filename, temp_filename)
-                
-                # קרא מהקובץ הזמני
-                result = original_read_index(temp_filename)
-                
-                # נקה את הקובץ הזמני
-                try:
-                    os.remove(temp_filename)
-                except:
-                    pass
-                    
-                return result
-        
-        faiss.read_index = read_index_with_hebrew_support
-        return True
-    except Exception as e:
-        print(f"Warning: Could not patch faiss for Hebrew support: {e}")
-        return False
 
-# החל את הpatch
-patch_faiss_for_hebrew_paths()
+# אינדקסים נטענים בלי העתקה (mmap / קריאה דרך Python) ונשמרים בזיכרון בין המרות
+import rvc_index
+rvc_index.install()
 
 from infer_pack.models import (
     SynthesizerTrnMs256NSFsid,
@@ -72,59 +40,121 @@ from infer_pack.models import (
 import ffmpeg
 import numpy as np
 
-def load_audio_safe(file, sr):
-    """Load audio with better path handling for Hebrew characters"""
-    try:
-        file = file.strip(" ").strip('"').strip("\n").strip('"').strip(" ")
+def load_audio_pcm(file, sr, start=None, duration=None):
+    """Decode WAV/FLAC stems straight to float32 without an ffmpeg process"""
+    import audio_buffers
 
-        # אם הנתיב מכיל תווים בעברית, העתק לתיקיה זמנית
-        if any('\u0590' <= c <= '\u05FF' for c in file):
-            temp_dir = os.path.join(now_dir, "temp_audio")
-            os.makedirs(temp_dir, exist_ok=True)
+    data, file_sr = audio_buffers.read_audio(file, start, duration)
+    mono = audio_buffers.to_mono(data)
+    return audio_buffers.resample(mono, file_sr, sr).astype(np.float32)
 
-            temp_file = os.path.join(temp_dir, "temp_input.wav")
-            shutil.copy2(file, temp_file)
-            file_to_process = temp_file
-        else:
-            file_to_process = file
+def seek_options(start=None, duration=None):
+    """אפשרויות input של ffmpeg (-ss/-t) כדי לפענח רק את החלון המבוקש"""
+    options = {}
+    if start:
+        options["ss"] = start
+    if duration:
+        options["t"] = duration
+    return options
+
+def decode_with_ffmpeg(source, sr, stdin=None, start=None, duration=None):
+    """Decode to mono float32 through ffmpeg; source is a path or "pipe:0" with stdin set to an open file"""
+    args = (
+        ffmpeg.input(source, threads=0, **seek_options(start, duration))
+        .output("-", format="f32le", acodec="pcm_f32le", ac=1, ar=sr)
+        .get_args()
+    )
+    if stdin is None:
+        args = ["-nostdin"] + args
+    result = subprocess.run(["ffmpeg"] + args, stdin=stdin, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg failed: {result.stderr.decode('utf-8', errors='replace')}")
+    return np.frombuffer(result.stdout, np.float32).flatten()
 
+def decode_from_scratch(file, sr, start=None, duration=None):
+    """Fallback for non-seekable pipes: a per-call ASCII name, hard-linked when possible instead of copied"""
+    temp_root = os.path.join(now_dir, "temp_audio")
+    os.makedirs(temp_root, exist_ok=True)
+    scratch_dir = tempfile.mkdtemp(prefix="audio_", dir=temp_root)
+    try:
+        scratch_file = os.path.join(scratch_dir, "input" + os.path.splitext(file)[1])
         try:
-            out, err = (
-                ffmpeg.input(file_to_process, threads=0)
-                .output("-", format="f32le", acodec="pcm_f32le", ac=1, ar=sr)
-                .run(cmd=["ffmpeg", "-nostdin"], capture_stdout=True, capture_stderr=True)
-            )
-        except ffmpeg.Error as e:
-            print(f"FFmpeg error stderr: {e.stderr.decode() if e.stderr else 'No stderr'}", file=sys.stderr)
-            raise RuntimeError(f"FFmpeg failed: {e}")
+            os.link(file, scratch_file)
+        except OSError:
+            shutil.copy2(file, scratch_file)
+        return decode_with_ffmpeg(scratch_file, sr, start=start, duration=duration)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
 
-        # נקה קובץ זמני אם יצרנו
-        if file_to_process != file:
+def load_audio_safe(file, sr, start=None, duration=None):
+    """Load audio with better path handling for Hebrew characters; start/duration decode only that window"""
+    try:
+        file = file.strip(" ").strip('"').strip("\n").strip('"').strip(" ")
+
+        # stems מההפרדה הם PCM - קוראים אותם ישירות לזיכרון בלי ffmpeg
+        if os.path.splitext(file)[1].lower() in (".wav", ".flac"):
             try:
-                os.remove(file_to_process)
-            except:
-                pass
+                return load_audio_pcm(file, sr, start, duration)
+            except Exception as e:
+                print(f"Direct PCM decode failed, falling back to ffmpeg: {e}")
+
+        if file.isascii():
+            return decode_with_ffmpeg(file, sr, start=start, duration=duration)
+
+        # נתיב בעברית: Python פותח את הקובץ ו-ffmpeg קורא אותו מ-stdin, בלי העתקה
+        try:
+            with open(file, "rb") as f:
+                return decode_with_ffmpeg("pipe:0", sr, stdin=f, start=start, duration=duration)
+        except RuntimeError as e:
+            # פורמטים שצריכים seek (למשל mp4 עם moov בסוף) לא נקראים מ-pipe
+            print(f"Pipe decode failed, using a scratch link: {e}")
+            return decode_from_scratch(file, sr, start, duration)
 
     except Exception as e:
         raise RuntimeError(f"Failed to load audio: {e}")
 
-    return np.frombuffer(out, np.float32).flatten()
-
 # השתמש בfunc המותאמת במקום המקורית
 load_audio = load_audio_safe
 from vc_infer_pipeline import VC
+from rvc_batch import RVCBatcher, batched_pipeline
+from feature_cache import FeatureCache
+from metrics import measure
+from progress import ProgressReporter
 
 BASE_DIR = Path(now_dir) / "RVC-v2-UI"
 
 
 class Config:
-    def __init__(self, device, is_half):
+    def __init__(self, device, is_half, cpu_processes=0, cpu_threads=0):
         self.device = device
         self.is_half = is_half
         self.n_cpu = 0
         self.gpu_name = None
         self.gpu_mem = None
+        self.cpu_processes = cpu_processes
+        self.cpu_threads = cpu_threads
         self.x_pad, self.x_query, self.x_center, self.x_max = self.device_config()
+        self.configure_cpu()
+
+    def configure_cpu(self):
+        """על CPU: מחלק את הליבות בין תהליכי ההמרה וקובע את מספר ה-threads של torch במפורש"""
+        if self.device != "cpu":
+            self.cpu_processes = 1
+            return
+
+        if self.cpu_processes <= 0:
+            # ברירת מחדל: תהליך לכל 4 ליבות, כל אחד עם intra-op threads משלו
+            self.cpu_processes = max(1, self.n_cpu // 4)
+        if self.cpu_threads <= 0:
+            self.cpu_threads = max(1, self.n_cpu // self.cpu_processes)
+
+        torch.set_num_threads(self.cpu_threads)
+        try:
+            torch.set_num_interop_threads(max(1, min(4, self.cpu_threads // 2)))
+        except RuntimeError:
+            # אפשר לקבוע רק לפני שעבודה מקבילית ראשונה התחילה
+            pass
+        print(f"CPU inference: {self.cpu_processes} process(es) x {self.cpu_threads} thread(s), float32")
 
     def device_config(self) -> tuple:
         if torch.cuda.is_available():
@@ -174,7 +204,8 @@ class Config:
         else:
             print("No supported N-card found, use CPU for inference")
             self.device = "cpu"
-            self.is_half = True
+            # half על CPU איטי יותר ולא נתמך בחלק מהאופרטורים
+            self.is_half = False
 
         if self.n_cpu == 0:
             self.n_cpu = cpu_count()
@@ -252,8 +283,316 @@ def get_vc(device, is_half, config, model_path):
     return cpt, version, net_g, tgt_sr, vc
 
 
-def rvc_infer(index_path, index_rate, input_path, output_path, pitch_change, f0_method, cpt, version, net_g, filter_radius, tgt_sr, rms_mix_rate, protect, crepe_hop_length, vc, hubert_model):
-    audio = load_audio(input_path, 16000)
+def stream_audio(file, sr, block_seconds, start=None, duration=None):
+    """מחזיר את השיר (או את החלון start/duration) כבלוקים רציפים של מונו float32 ב-sr, בלי להחזיק את כל השיר בזיכרון"""
+    file = file.strip(" ").strip('"').strip("\n").strip('"').strip(" ")
+
+    if os.path.splitext(file)[1].lower() not in (".wav", ".flac"):
+        # פורמט דחוס - מפענחים פעם אחת (רק את החלון) וחותכים לבלוקים
+        audio = load_audio(file, sr, start, duration)
+        block = max(1, int(block_seconds * sr))
+        for pos in range(0, len(audio), block):
+            yield audio[pos:pos + block]
+        return
+
+    import audio_buffers
+    import soundfile as sf
+
+    # שוליים קטנים סביב כל בלוק כדי שהדגימה מחדש תהיה רציפה בין בלוקים
+    pad = 256
+    with open(file, "rb") as f, sf.SoundFile(f) as snd:
+        native_sr = snd.samplerate
+        # גבולות החלון בפריימים; הריפוד נקרא גם מחוץ לחלון כדי שהדגימה מחדש תהיה רציפה בקצוות
+        first = min(snd.frames, int(round((start or 0) * native_sr)))
+        total = snd.frames if duration is None else min(snd.frames, first + int(round(duration * native_sr)))
+        block = max(1, int(block_seconds * native_sr))
+        for pos in range(first, total, block):
+            end = min(total, pos + block)
+            read_from = max(0, pos - pad)
+            snd.seek(read_from)
+            data = snd.read(min(snd.frames, end + pad) - read_from, dtype="float32", always_2d=True)
+            out = audio_buffers.resample(audio_buffers.to_mono(data), native_sr, sr)
+            out_pos = round(pos * sr / native_sr)
+            lead = out_pos - round(read_from * sr / native_sr)
+            yield out[lead:lead + round(end * sr / native_sr) - out_pos]
+
+
+def audio_duration(file):
+    """אורך הקובץ בשניות מהכותרת (wav/flac בלבד, בלי פענוח), או None"""
+    if os.path.splitext(file)[1].lower() not in (".wav", ".flac"):
+        return None
+    import soundfile as sf
+    try:
+        with open(file, "rb") as f:
+            return sf.info(f).duration
+    except Exception:
+        return None
+
+
+def window_length(total, start=None, duration=None):
+    """כמה שניות מהקובץ יומרו בפועל בחלון start/duration (או None כשהאורך לא ידוע)"""
+    if total is None:
+        return duration
+    remaining = max(0.0, total - (start or 0))
+    return remaining if duration is None else min(remaining, duration)
+
+
+def iter_converted_chunks(input_path, convert, tgt_sr, chunk_seconds, crossfade_seconds, start=None, duration=None):
+    """מריץ convert על חלונות חופפים של 16kHz ומחזיר את הפלט (ב-tgt_sr) עם crossfade בתפרים"""
+    overlap = int(crossfade_seconds * 16000)
+    carry = np.zeros(0, dtype=np.float32)
+    prev_tail = None
+
+    for block in stream_audio(input_path, 16000, chunk_seconds, start, duration):
+        window = np.concatenate([carry, block])
+        out = convert(window).astype(np.float32) / 32768.0
+        # הצינור מחזיר כ-2 פריימים של HuBERT (~20ms) פחות מאורך החלון; בלי יישור כל תפר
+        # היה מזיז את ה-vocals אחורה ביחס ל-instrumental, וה-crossfade היה מערבב אותות מוזזים
+        target = round(len(window) * tgt_sr / 16000)
+        if len(out) < target:
+            out = np.pad(out, (0, target - len(out)))
+        out = out[:target]
+
+        # החלק הראשון של החלון הנוכחי חופף לזנב של החלון הקודם
+        if prev_tail is not None:
+            n = min(len(prev_tail), len(out))
+            fade = np.linspace(0.0, 1.0, n, dtype=np.float32)
+            out[:n] = prev_tail[:n] * (1.0 - fade) + out[:n] * fade
+
+        carry = window[-overlap:] if overlap else np.zeros(0, dtype=np.float32)
+        hold = min(round(len(carry) * tgt_sr / 16000), len(out))
+        if hold:
+            yield out[:-hold]
+            prev_tail = out[-hold:]
+        else:
+            yield out
+            prev_tail = None
+
+    if prev_tail is not None:
+        yield prev_tail
+
+
+def frame_levels(audio, frame):
+    """עוצמת RMS (dB) של כל פריים שלם באודיו"""
+    n_frames = len(audio) // frame
+    frames = audio[:n_frames * frame].reshape(n_frames, frame).astype(np.float64)
+    return 10 * np.log10(np.mean(np.square(frames), axis=1) + 1e-12)
+
+
+def peak_level(input_path, start=None, duration=None, sr=16000, frame_ms=20, block_seconds=60):
+    """עוצמת הפריים החזק ביותר (dB) בכל ה-stem, במעבר זורם אחד"""
+    frame = max(1, int(sr * frame_ms / 1000))
+    peak = None
+    for block in stream_audio(input_path, sr, block_seconds, start, duration):
+        if len(block) >= frame:
+            level = frame_levels(block, frame).max()
+            peak = level if peak is None else max(peak, level)
+    return peak
+
+
+def find_active_spans(audio, sr=16000, frame_ms=20, threshold_db=-45.0, floor_db=-70.0, min_silence=0.5, pad=0.15, min_span=0.5,
+                      reference_db=None):
+    """מעבר RMS וקטורי על ה-vocals - מחזיר [(start, end)] של אזורים שיש בהם שירה
+
+    reference_db - עוצמת השיא של כל ה-stem (peak_level). בלעדיה הסף נמדד ביחס לשיא של audio עצמו,
+    ואז חלון שיש בו רק דליפה מההפרדה היה מקבל סף נמוך ומומר כאילו הוא שירה.
+    """
+    frame = max(1, int(sr * frame_ms / 1000))
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return [(0, len(audio))] if len(audio) else []
+
+    level = frame_levels(audio, frame)
+    # הסף יחסי לפריים החזק ביותר, כדי שדליפה שקטה מההפרדה לא תיחשב שירה
+    reference = level.max() if reference_db is None else reference_db
+    active = level > max(reference + threshold_db, floor_db)
+    if not active.any():
+        return []
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], active.astype(np.int8), [0]))))
+    starts, ends = edges[0::2], edges[1::2]
+
+    # מרחיבים בשוליים, ומאחדים אזורים שהשקט ביניהם קצר מ-min_silence
+    pad_frames = int(pad * sr / frame)
+    gap_frames = int(min_silence * sr / frame)
+    spans = []
+    for start, end in zip(np.maximum(starts - pad_frames, 0), np.minimum(ends + pad_frames, n_frames)):
+        if spans and start - spans[-1][1] < gap_frames:
+            spans[-1][1] = end
+        else:
+            spans.append([start, end])
+
+    min_frames = int(min_span * sr / frame)
+    result = []
+    for start, end in spans:
+        if end - start < min_frames:
+            grow = (min_frames - (end - start) + 1) // 2
+            start, end = max(0, start - grow), min(n_frames, end + grow)
+        start_sample = int(start * frame)
+        end_sample = len(audio) if end >= n_frames else int(end * frame)
+        if result and start_sample <= result[-1][1]:
+            result[-1] = (result[-1][0], max(result[-1][1], end_sample))
+        else:
+            result.append((start_sample, end_sample))
+    return result
+
+
+def split_at_quiet_points(audio, start, end, max_len, sr=16000, search_seconds=1.0, frame_ms=10):
+    """חותך את [start, end) לחלקים של בערך max_len, בנקודה השקטה ביותר ליד כל גבול"""
+    frame = max(1, int(sr * frame_ms / 1000))
+    radius = int(search_seconds * sr)
+    pieces = []
+    while end - start > max_len + radius:
+        target = start + max_len
+        lo, hi = target - radius, target + radius
+        n = (hi - lo) // frame
+        energy = np.square(audio[lo:lo + n * frame].reshape(n, frame)).sum(axis=1)
+        cut = lo + int(np.argmin(energy)) * frame + frame // 2
+        pieces.append((start, cut))
+        start = cut
+    pieces.append((start, end))
+    return pieces
+
+
+def convert_segments(audio, convert, tgt_sr, skip_silence=False, map_segments=None, sr=16000, fade_ms=10, min_segment_seconds=10.0,
+                     reference_db=None):
+    """מריץ convert על קטעים של האודיו ומחזיר אותם למקומם המקורי
+
+    skip_silence - רק אזורים שיש בהם שירה מומרים, והשקט ביניהם נשמר.
+    reference_db - שיא העוצמה של כל ה-stem, כשהאודיו הוא חלון אחד מתוכו.
+    map_segments - ממיר רשימת קטעים במקביל (מאגר תהליכי CPU); הקטעים הארוכים נחתכים בנקודות שקטות.
+    """
+    if skip_silence:
+        spans = find_active_spans(audio, sr, reference_db=reference_db)
+        active = sum(end - start for start, end in spans)
+        print(f"Active vocals: {100 * active / max(1, len(audio)):.0f}% of {len(audio) / sr:.1f}s")
+    else:
+        spans = [(0, len(audio))] if len(audio) else []
+        active = len(audio)
+
+    if map_segments is None:
+        map_segments = lambda segments: [convert(segment) for segment in segments]
+        pieces = [(start, end, True, True) for start, end in spans]
+    else:
+        max_len = max(int(min_segment_seconds * sr), active // max(1, getattr(map_segments, "workers", 1)))
+        pieces = []
+        for start, end in spans:
+            sub = split_at_quiet_points(audio, start, end, max_len, sr)
+            pieces.extend((s, e, i == 0, i == len(sub) - 1) for i, (s, e) in enumerate(sub))
+
+    if len(pieces) == 1 and pieces[0][:2] == (0, len(audio)):
+        return map_segments([audio])[0]
+
+    out_len = round(len(audio) * tgt_sr / sr)
+    output = np.zeros(out_len, dtype=np.float32)
+    fade = int(tgt_sr * fade_ms / 1000)
+    outputs = map_segments([audio[start:end] for start, end, _, _ in pieces])
+    for (start, end, fade_in, fade_out), converted in zip(pieces, outputs):
+        converted = converted.astype(np.float32)
+        pos = round(start * tgt_sr / sr)
+        converted = converted[:max(0, out_len - pos)]
+        # רמפה קצרה בקצוות שפונים לשקט כדי שלא יהיו קליקים
+        n = min(fade, len(converted) // 2)
+        if n:
+            ramp = np.linspace(0.0, 1.0, n, dtype=np.float32)
+            if fade_in:
+                converted[:n] *= ramp
+            if fade_out:
+                converted[-n:] *= ramp[::-1]
+        output[pos:pos + len(converted)] += converted
+    return np.clip(output, -32768, 32767).astype(np.int16)
+
+
+# ====== מאגר תהליכים להמרה על CPU ======
+_cpu_worker_state = {}
+
+
+def _init_cpu_worker(cpu_threads, max_models):
+    """מאתחל תהליך CPU: טוען את HuBERT פעם אחת; מודלי הקול נטענים בשימוש הראשון"""
+    config = Config("cpu", False, cpu_processes=1, cpu_threads=cpu_threads)
+    hubert_path = BASE_DIR / "rvc_models" / "hubert_base.pt"
+    hubert_model = load_hubert(config.device, config.is_half, str(hubert_path))
+    _cpu_worker_state.update(config=config, hubert_model=hubert_model, models=OrderedDict(), max_models=max_models,
+                             feature_cache=None, batcher=None)
+
+
+def _cpu_worker_feature_cache(spec):
+    """מטמון התכונות בתהליך ה-CPU (אותה תיקייה כמו ה-worker), ו-batcher של קטע אחד שעובר דרכו"""
+    state = _cpu_worker_state
+    if spec and state["feature_cache"] is None:
+        state["feature_cache"] = FeatureCache(*spec)
+        state["batcher"] = RVCBatcher(state["hubert_model"], "cpu", False, max_batch=1, max_wait=0)
+    return state["feature_cache"] if spec else None
+
+
+def _cpu_worker_model(model_path):
+    """מודל הקול בתהליך ה-CPU, עם פינוי של הישנים מעבר ל-max_models"""
+    models = _cpu_worker_state["models"]
+    model = models.get(model_path)
+    if model is None:
+        config = _cpu_worker_state["config"]
+        cpt, version, net_g, tgt_sr, vc = get_vc(config.device, config.is_half, config, model_path)
+        model = models[model_path] = {"cpt": cpt, "version": version, "net_g": net_g, "tgt_sr": tgt_sr, "vc": vc}
+    models.move_to_end(model_path)
+    while len(models) > _cpu_worker_state["max_models"]:
+        models.popitem(last=False)
+    return model
+
+
+def _cpu_convert_segment(task):
+    audio, params = task
+    model = _cpu_worker_model(params["model_path"])
+    feature_cache = _cpu_worker_feature_cache(params.get("feature_cache"))
+    if feature_cache is not None:
+        # HuBERT ו-f0 של הקטע נטענים מהמטמון אם קול אחר כבר המיר אותו
+        return batched_pipeline(
+            _cpu_worker_state["batcher"], model, audio, params["input_path"], params["pitch_change"],
+            params["f0_method"], params["index_path"], params["index_rate"], model["cpt"].get("f0", 1),
+            params["filter_radius"], model["tgt_sr"], params["rms_mix_rate"], params["protect"],
+            params["crepe_hop_length"], feature_cache=feature_cache
+        )
+    return model["vc"].pipeline(
+        _cpu_worker_state["hubert_model"], model["net_g"], 0, audio, params["input_path"], [0, 0, 0],
+        params["pitch_change"], params["f0_method"], params["index_path"], params["index_rate"],
+        model["cpt"].get("f0", 1), params["filter_radius"], model["tgt_sr"], 0,
+        params["rms_mix_rate"], model["version"], params["protect"], params["crepe_hop_length"]
+    )
+
+
+class CpuPool:
+    """תהליכי המרה מקבילים על CPU, כל אחד עם HuBERT ו-threads משלו
+
+    המאגר נוצר פעם אחת לכל worker ומשמש את כל המשימות, בכל מודל: כל תהליך מחזיק עד
+    max_models מודלי קול, כך שעלות ה-spawn וטעינת HuBERT לא חוזרת בכל שיר.
+    """
+
+    def __init__(self, processes, cpu_threads, max_models=2):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.workers = processes
+        # spawn ולא fork - fork אחרי ש-torch פתח threads עלול להיתקע
+        self.executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_cpu_worker,
+            initargs=(cpu_threads, max_models)
+        )
+
+    def mapper(self, params):
+        """params כולל את model_path - כל קטע מומר במודל של המשימה שלו"""
+        def map_segments(segments):
+            return list(self.executor.map(_cpu_convert_segment, [(segment, params) for segment in segments]))
+        map_segments.workers = self.workers
+        return map_segments
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def rvc_infer(index_path, index_rate, input_path, output_path, pitch_change, f0_method, cpt, version, net_g, filter_radius, tgt_sr, rms_mix_rate, protect, crepe_hop_length, vc, hubert_model,
+              chunk_seconds=0, crossfade_seconds=1.0, skip_silence=False, cpu_pool=None, batcher=None,
+              on_progress=None, start=None, duration=None, feature_cache=None, model_path=None):
     times = [0, 0, 0]
     if_f0 = cpt.get('f0', 1)
     
@@ -265,16 +604,67 @@ def rvc_infer(index_path, index_rate, input_path, output_path, pitch_change, f0_
         # אם אין אינדקס או שהוא לא קיים, השתמש בNone
         index_path = None
         index_rate = 0.0
-    
-    audio_opt = vc.pipeline(hubert_model, net_g, 0, audio, input_path, times, pitch_change, f0_method, index_path, index_rate, if_f0, filter_radius, tgt_sr, 0, rms_mix_rate, version, protect, crepe_hop_length)
-    wavfile.write(output_path, tgt_sr, audio_opt)
 
+    def convert_all(audio):
+        if batcher is not None:
+            # HuBERT ו-net_g רצים בבאצ'ים משותפים עם משימות אחרות שמחכות באותו worker
+            return batched_pipeline(
+                batcher, {"vc": vc, "net_g": net_g, "version": version}, audio, input_path, pitch_change, f0_method,
+                index_path, index_rate, if_f0, filter_radius, tgt_sr, rms_mix_rate, protect, crepe_hop_length,
+                feature_cache=feature_cache
+            )
+        return vc.pipeline(hubert_model, net_g, 0, audio, input_path, times, pitch_change, f0_method, index_path, index_rate, if_f0, filter_radius, tgt_sr, 0, rms_mix_rate, version, protect, crepe_hop_length)
+
+    map_segments = None
+    if cpu_pool is not None:
+        map_segments = cpu_pool.mapper({
+            "model_path": model_path, "input_path": input_path, "pitch_change": pitch_change, "f0_method": f0_method,
+            "index_path": index_path, "index_rate": index_rate, "filter_radius": filter_radius, "rms_mix_rate": rms_mix_rate,
+            "protect": protect, "crepe_hop_length": crepe_hop_length,
+            "feature_cache": (feature_cache.root, feature_cache.max_bytes) if feature_cache is not None else None
+        })
+
+    # במצב chunked סף השקט נמדד ביחס לשיא של כל ה-stem, כך שכל החלונות נשפטים באותו סף
+    reference_db = None
+    if skip_silence and chunk_seconds and chunk_seconds > 0:
+        reference_db = peak_level(input_path, start, duration)
 
-def process_rvc(input_path, model_path, output_path, pitch, index_path, index_rate, protect):
+    def convert(audio):
+        # דילוג על אזורים שקטים - HuBERT, f0 והסינתיסייזר רצים רק על שירה
+        if skip_silence or map_segments is not None:
+            return convert_segments(audio, convert_all, tgt_sr, skip_silence, map_segments, reference_db=reference_db)
+        return convert_all(audio)
+
+    if not chunk_seconds or chunk_seconds <= 0:
+        audio = load_audio(input_path, 16000, start, duration)
+        audio_opt = convert(audio)
+        wavfile.write(output_path, tgt_sr, audio_opt)
+        return
+
+    # מצב chunked: הזיכרון חסום לגודל חלון, והפלט נכתב לדיסק תוך כדי. המיקס בשרת לא מתחיל
+    # לפני התוצאה הסופית - התאמת העוצמה שלו צריכה את ה-RMS של כל ה-stem המומר
+    import soundfile as sf
+
+    written = 0
+    total = window_length(audio_duration(input_path), start, duration) if on_progress else None
+    with open(output_path, "wb") as f, sf.SoundFile(f, "w", samplerate=tgt_sr, channels=1, format="WAV", subtype="PCM_16") as out_file:
+        for chunk in iter_converted_chunks(input_path, convert, tgt_sr, chunk_seconds, crossfade_seconds, start, duration):
+            out_file.write(chunk)
+            out_file.flush()
+            written += len(chunk)
+            if total:
+                on_progress(written / tgt_sr / total)
+
+
+def process_rvc(input_path, model_path, output_path, pitch, index_path, index_rate, protect, f0_method="rmvpe", chunk_seconds=0, skip_silence=False,
+                start=None, duration=None, feature_cache_dir=None, feature_cache_max_bytes=0):
+    batcher = None
     try:
         device = "cuda:0" if torch.cuda.is_available() else "cpu"
         is_half = torch.cuda.is_available()
-        config = Config(device, is_half)
+        # בהרצה חד-פעמית מאגר תהליכים היה טוען את HuBERT והמודל מחדש בכל שיר;
+        # תהליך אחד משתמש בכל הליבות, והמאגר שמור ל-worker הקבוע
+        config = Config(device, is_half, cpu_processes=1)
 
         # Load Hubert model
         hubert_path = BASE_DIR / "rvc_models" / "hubert_base.pt"
@@ -282,34 +672,57 @@ def process_rvc(input_path, model_path, output_path, pitch, index_path, index_ra
             print(f"Error: {hubert_path} not found. Make sure RVC models are properly installed.", file=sys.stderr)
             sys.exit(1)
         
+        stages = []
+        progress = ProgressReporter(emit, "rvc")
+        progress.update(0.0, "model_load", force=True)
         print("Loading Hubert model...")
-        hubert_model = load_hubert(config.device, config.is_half, str(hubert_path))
+        with measure("hubert_load", stages.append, cpu_scope="process"):
+            hubert_model = load_hubert(config.device, config.is_half, str(hubert_path))
         
         print("Loading RVC model...")
-        cpt, version, net_g, tgt_sr, vc = get_vc(config.device, config.is_half, config, model_path)
+        with measure("model_load", stages.append, cpu_scope="process", loaded=True):
+            cpt, version, net_g, tgt_sr, vc = get_vc(config.device, config.is_half, config, model_path)
         print(f"Model loaded successfully. Target SR: {tgt_sr}, Version: {version}")
 
+        # מטמון התכונות עובר דרך המסלול של ה-batcher (באצ' של קטע אחד)
+        feature_cache = None
+        if feature_cache_dir and feature_cache_max_bytes > 0:
+            feature_cache = FeatureCache(feature_cache_dir, feature_cache_max_bytes)
+            batcher = RVCBatcher(hubert_model, config.device, config.is_half, max_batch=1, max_wait=0)
+
         print("Starting voice conversion...")
-        rvc_infer(
-            index_path,
-            index_rate,
-            input_path,
-            output_path,
-            pitch,
-            "rmvpe",  # f0_method
-            cpt,
-            version,
-            net_g,
-            3,  # filter_radius
-            tgt_sr,
-            0.25,  # rms_mix_rate
-            protect,
-            120,  # crepe_hop_length
-            vc,
-            hubert_model
-        )
+        # בלי חלונות אין התקדמות אמיתית, אז רק heartbeat
+        heartbeat = progress.estimate("inference", None) if not chunk_seconds or chunk_seconds <= 0 else nullcontext()
+        with measure("inference", stages.append, cpu_scope="process"), heartbeat:
+            rvc_infer(
+                index_path,
+                index_rate,
+                input_path,
+                output_path,
+                pitch,
+                f0_method,
+                cpt,
+                version,
+                net_g,
+                3,  # filter_radius
+                tgt_sr,
+                0.25,  # rms_mix_rate
+                protect,
+                120,  # crepe_hop_length
+                vc,
+                hubert_model,
+                chunk_seconds=chunk_seconds,
+                skip_silence=skip_silence,
+                batcher=batcher,
+                on_progress=lambda fraction: progress.update(fraction, "inference"),
+                start=start,
+                duration=duration,
+                feature_cache=feature_cache
+            )
+        progress.update(1.0, "inference")
         
         print(f"Conversion successful. Output written to: {output_path}")
+        emit({"event": "metrics", "stages": stages})
         # מדפיסים את הנתיב כדי שהשרת הראשי ידע מה לשלוח בחזרה
         print(output_path, flush=True)
 
@@ -318,33 +731,24 @@ def process_rvc(input_path, model_path, output_path, pitch, index_path, index_ra
         raise e
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--input_path", type=str, required=True)
-    parser.add_argument("--model_path", type=str, required=True)
-    parser.add_argument("--output_path", type=str, required=True)
-    parser.add_argument("--pitch", type=int, required=True)
-    parser.add_argument("--index_rate", type=float, default=0.75)
-    parser.add_argument("--protect", type=float, default=0.33)
-    args = parser.parse_args()
-
-    # חיפוש אוטומטי של קובץ אינדקס תואם למודל
+def find_index_file(model_path):
+    """חיפוש אוטומטי של קובץ אינדקס תואם למודל"""
     index_file = None
-    model_dir = os.path.dirname(args.model_path)
-    model_name = os.path.splitext(os.path.basename(args.model_path))[0]
-    
+    model_dir = os.path.dirname(model_path)
+    model_name = os.path.splitext(os.path.basename(model_path))[0]
+
     # נסה מספר אפשרויות לשם קובץ האינדקס
     possible_names = [
         f"{model_name}.index",
     ]
-    
+
     for name in possible_names:
         potential_index_path = os.path.join(model_dir, name)
         if os.path.exists(potential_index_path):
             index_file = potential_index_path
             print("Found index file automatically:", os.path.basename(index_file))
             break
-    
+
     # אם לא נמצא, חפש כל קובץ .index בתיקיה
     if index_file is None:
         try:
@@ -355,12 +759,270 @@ if __name__ == "__main__":
                     break
         except Exception as e:
             print("Error accessing model directory:", str(e))
-    
+
     if index_file is None:
         print("No index file found for the model. Running without index (may affect quality).")
     else:
         print("Will use index file for better quality conversion.")
 
+    return index_file
+
+
+_emit_lock = threading.Lock()
+
+
+def emit(message):
+    """שולח הודעת פרוטוקול (JSON בשורה אחת) לתהליך האב"""
+    with _emit_lock:
+        print(json.dumps(message), flush=True)
+
+
+class ResidentRVC:
+    """מחזיק את HuBERT ואת מודלי הקול האחרונים טעונים בזיכרון בין משימות"""
+
+    def __init__(self, max_models=2, cpu_processes=0, batch_size=1, batch_wait=0.1,
+                 feature_cache_dir=None, feature_cache_max_bytes=0, cpu_mode="pool"):
+        device = "cuda:0" if torch.cuda.is_available() else "cpu"
+        is_half = torch.cuda.is_available()
+        # על CPU צריך לבחור: מאגר תהליכים (ברירת מחדל) או באצ'ים בתהליך אחד שמשתמש בכל הליבות
+        if device == "cpu":
+            if cpu_mode == "batch":
+                cpu_processes = 1
+            elif batch_size > 1:
+                print(f"CPU worker in pool mode: batching off (batch_size {batch_size} ignored)")
+                batch_size = 1
+        self.config = Config(device, is_half, cpu_processes=cpu_processes)
+        self.max_models = max(1, max_models)
+        self.models = OrderedDict()
+        self.cpu_pool = None
+        self._pool_lock = threading.Lock()
+        self.batcher = None
+        # שניות המרה לכל שנייה של אודיו - להערכת ההתקדמות כשאין חלונות
+        self.rate = None
+        self._lock = threading.Lock()
+
+        hubert_path = BASE_DIR / "rvc_models" / "hubert_base.pt"
+        if not hubert_path.exists():
+            raise FileNotFoundError(f"{hubert_path} not found. Make sure RVC models are properly installed.")
+
+        print("Loading Hubert model...")
+        self.hubert_model = load_hubert(self.config.device, self.config.is_half, str(hubert_path))
+
+        # תכונות HuBERT ו-f0 של כל stem נשמרות, כך שהמרה נוספת של אותו stem מריצה רק את הסינתיסייזר
+        self.feature_cache = None
+        if feature_cache_dir and feature_cache_max_bytes > 0:
+            self.feature_cache = FeatureCache(feature_cache_dir, feature_cache_max_bytes)
+
+        # המטמון עובר דרך ה-batcher, ולכן הוא נוצר גם בלי באצ'ים (קטע אחד, בלי המתנה)
+        if batch_size > 1 or self.feature_cache is not None:
+            self.batcher = RVCBatcher(self.hubert_model, self.config.device, self.config.is_half,
+                                      max_batch=batch_size, max_wait=batch_wait if batch_size > 1 else 0)
+
+    def acquire_model(self, job):
+        """מחזיר (מפתח, מודל, האם נטען עכשיו) ומגדיל את מונה ההפניות; מודל נטען רק בשימוש הראשון"""
+        model_path = job["model_path"]
+        # ה-hash מה-registry של השרת מזהה את המודל בלי stat על הקובץ
+        key = job.get("model_hash") or (os.path.abspath(model_path), os.path.getmtime(model_path))
+
+        with self._lock:
+            entry = self.models.get(key)
+            loaded = entry is None
+            if loaded:
+                print("Loading RVC model...")
+                cpt, version, net_g, tgt_sr, vc = get_vc(self.config.device, self.config.is_half, self.config, model_path)
+                print(f"Model loaded successfully. Target SR: {tgt_sr}, Version: {version}")
+                index_path = job["index_path"] if "index_path" in job else find_index_file(model_path)
+                if index_path and os.path.exists(index_path):
+                    rvc_index.index_cache.get(index_path)
+                entry = {
+                    "cpt": cpt,
+                    "version": version,
+                    "net_g": net_g,
+                    "tgt_sr": tgt_sr,
+                    "vc": vc,
+                    "index_path": index_path,
+                    "refs": 0,
+                }
+                self.models[key] = entry
+
+            self.models.move_to_end(key)
+            entry["refs"] += 1
+            self._evict()
+            return key, entry, loaded
+
+    def release_model(self, key):
+        with self._lock:
+            entry = self.models.get(key)
+            if entry is not None:
+                entry["refs"] -= 1
+            self._evict()
+
+    def _evict(self):
+        """מפנה את המודלים הישנים ביותר מעבר ל-max_models, חוץ ממודלים שמשימה משתמשת בהם"""
+        idle = [key for key, entry in self.models.items() if entry["refs"] <= 0]
+        while len(self.models) > self.max_models and idle:
+            del self.models[idle.pop(0)]
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def get_cpu_pool(self):
+        """מאגר תהליכי ה-CPU של ה-worker - נוצר פעם אחת ומשותף לכל המשימות והמודלים"""
+        if self.config.device != "cpu" or self.config.cpu_processes <= 1:
+            return None
+        with self._pool_lock:
+            if self.cpu_pool is None:
+                self.cpu_pool = CpuPool(self.config.cpu_processes, self.config.cpu_threads, self.max_models)
+            return self.cpu_pool
+
+    def convert(self, job, progress=None):
+        """ממיר ומחזיר (נתיב הפלט, מדידות השלבים); progress מקבל את התקדמות השלבים"""
+        stages = []
+        progress = progress or ProgressReporter(lambda message: None, "rvc")
+        progress.update(0.0, "model_load", force=True)
+        with measure("model_load", stages.append, cpu_scope="process") as stage:
+            key, model, stage["loaded"] = self.acquire_model(job)
+
+        # עם חלונות ההתקדמות נמדדת לפי מה שנכתב; אחרת מעריכים לפי הקצב של המשימות הקודמות
+        duration = window_length(audio_duration(job["input_path"]), job.get("start"), job.get("duration"))
+        chunked = job.get("chunk_seconds", 0) > 0
+        expected = duration * self.rate if duration and self.rate else None
+        started = time.time()
+        try:
+            with measure("inference", stages.append, cpu_scope="process"), \
+                    (nullcontext() if chunked else progress.estimate("inference", expected)):
+                self._convert(job, model, lambda fraction: progress.update(fraction, "inference"))
+        finally:
+            self.release_model(key)
+        if duration:
+            observed = (time.time() - started) / duration
+            self.rate = observed if self.rate is None else 0.7 * self.rate + 0.3 * observed
+        progress.update(1.0, "inference")
+        print(f"Conversion successful. Output written to: {job['output_path']}")
+        return job["output_path"], stages
+
+    def _convert(self, job, model, on_progress=None):
+        print("Starting voice conversion...")
+        rvc_infer(
+            model["index_path"],
+            job.get("index_rate", 0.75),
+            job["input_path"],
+            job["output_path"],
+            job["pitch"],
+            job.get("f0_method", "rmvpe"),
+            model["cpt"],
+            model["version"],
+            model["net_g"],
+            3,  # filter_radius
+            model["tgt_sr"],
+            0.25,  # rms_mix_rate
+            job.get("protect", 0.33),
+            120,  # crepe_hop_length
+            model["vc"],
+            self.hubert_model,
+            chunk_seconds=job.get("chunk_seconds", 0),
+            skip_silence=job.get("skip_silence", False),
+            cpu_pool=self.get_cpu_pool(),
+            batcher=self.batcher,
+            on_progress=on_progress,
+            start=job.get("start"),
+            duration=job.get("duration"),
+            feature_cache=self.feature_cache,
+            model_path=job["model_path"]
+        )
+
+
+def run_worker_job(rvc, job):
+    job_id = job.get("id")
+    try:
+        output_path, stages = rvc.convert(job, progress=ProgressReporter(emit, "rvc", job_id))
+        emit({"event": "result", "id": job_id, "output_path": output_path, "metrics": stages})
+    except Exception as e:
+        print(f"Error in RVC processing: {e}", file=sys.stderr)
+        emit({"event": "error", "id": job_id, "error": str(e)})
+
+
+def serve_worker(max_models, cpu_processes=0, batch_size=1, batch_wait=0.1, max_jobs=1,
+                 feature_cache_dir=None, feature_cache_max_bytes=0, cpu_mode="pool"):
+    """מצב worker: קורא משימות JSON מ-stdin ומחזיר תוצאות ב-stdout
+
+    max_jobs - כמה משימות רצות במקביל; עם batch_size > 1 הקטעים שלהן מאוחדים לבאצ'ים.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    try:
+        rvc = ResidentRVC(max_models, cpu_processes, batch_size, batch_wait, feature_cache_dir, feature_cache_max_bytes,
+                          cpu_mode)
+    except Exception as e:
+        print(f"Error in RVC worker startup: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    emit({"event": "ready"})
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_jobs))
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except Exception as e:
+            print(f"Error in RVC processing: {e}", file=sys.stderr)
+            emit({"event": "error", "id": None, "error": str(e)})
+            continue
+        executor.submit(run_worker_job, rvc, job)
+    executor.shutdown(wait=True)
+    if rvc.cpu_pool is not None:
+        rvc.cpu_pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--worker", action="store_true",
+                        help="Stay resident and read conversion jobs as JSON lines from stdin")
+    parser.add_argument("--max_models", type=int, default=2)
+    parser.add_argument("--cpu_processes", type=int, default=0,
+                        help="Worker mode: parallel conversion processes on CPU-only machines (0 = one per 4 cores)")
+    parser.add_argument("--cpu_mode", choices=("pool", "batch"), default="pool",
+                        help="Worker mode on CPU: a process pool (no batching) or batching in one process")
+    parser.add_argument("--batch_size", type=int, default=1,
+                        help="Worker mode: batch HuBERT/synthesizer inference across up to this many segments")
+    parser.add_argument("--batch_wait_ms", type=float, default=100,
+                        help="Worker mode: how long to wait for more segments before running a partial batch")
+    parser.add_argument("--max_jobs", type=int, default=1,
+                        help="Worker mode: how many jobs run concurrently and feed the batcher")
+    parser.add_argument("--input_path", type=str)
+    parser.add_argument("--model_path", type=str)
+    parser.add_argument("--output_path", type=str)
+    parser.add_argument("--pitch", type=int)
+    parser.add_argument("--index_path", type=str,
+                        help="Index file resolved by the model registry (skips the directory scan)")
+    parser.add_argument("--index_rate", type=float, default=0.75)
+    parser.add_argument("--protect", type=float, default=0.33)
+    parser.add_argument("--f0_method", type=str, default="rmvpe")
+    parser.add_argument("--chunk_seconds", type=float, default=0,
+                        help="Convert in overlapping windows of this length (0 = whole track at once)")
+    parser.add_argument("--skip_silence", action="store_true",
+                        help="Only run conversion on regions where the vocal stem is active")
+    parser.add_argument("--start", type=float, help="Convert from this many seconds into the input (seeks, no full decode)")
+    parser.add_argument("--duration", type=float, help="Convert only this many seconds")
+    parser.add_argument("--feature_cache_dir", type=str,
+                        help="Cache HuBERT features and f0 per vocal block here, shared across voice models")
+    parser.add_argument("--feature_cache_max_gb", type=float, default=0,
+                        help="Size limit of the feature cache (0 = disabled)")
+    args = parser.parse_args()
+    feature_cache_max_bytes = int(args.feature_cache_max_gb * 1024 ** 3)
+
+    if args.worker:
+        serve_worker(args.max_models, args.cpu_processes, args.batch_size, args.batch_wait_ms / 1000, args.max_jobs,
+                     args.feature_cache_dir, feature_cache_max_bytes, args.cpu_mode)
+        sys.exit(0)
+
+    for required in ("input_path", "model_path", "output_path", "pitch"):
+        if getattr(args, required) is None:
+            parser.error(f"--{required} is required")
+
+    index_file = args.index_path or find_index_file(args.model_path)
+
     try:
         process_rvc(
             args.input_path,
@@ -369,8 +1031,15 @@ if __name__ == "__main__":
             args.pitch,
             index_file,
             args.index_rate,
-            args.protect
+            args.protect,
+            args.f0_method,
+            args.chunk_seconds,
+            args.skip_silence,
+            args.start,
+            args.duration,
+            args.feature_cache_dir,
+            feature_cache_max_bytes
         )
     except Exception as e:
         print(f"Failed to process RVC: {e}", file=sys.stderr)
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -3,7 +3,14 @@ import argparse
 import os
 import sys
 import json
+import time
+import shutil
+import subprocess
 import ctypes
+from collections import OrderedDict
+
+from metrics import measure
+from progress import ProgressReporter
 
 def load_cudnn_dlls():
     try:
@@ -37,61 +44,119 @@ def load_cudnn_dlls():
 load_cudnn_dlls()
 from audio_separator.separator import Separator
 
-def process_separation(input_path, output_dir, model_filename, vocals_keyword='vocals', instrumental_keyword='instrumental'):
-    try:
-        separator = Separator(output_dir=output_dir)
-        separator.load_model(model_filename=model_filename)
-        output_files = separator.separate(input_path)
-
-        # output_files are in output_dir, make sure they have full paths
-        full_paths = []
-        for f in output_files:
-            if os.path.isabs(f):
-                full_paths.append(f)
-            else:
-                # File is in output_dir
-                full_path = os.path.join(output_dir, f)
-                if not os.path.exists(full_path):
-                    # Try with basename only
-                    full_path = os.path.join(output_dir, os.path.basename(f))
-                full_paths.append(full_path)
-
-        result = {}
-
-        if 'bs_roformer_male_female_by_aufr33_sdr_7.2889' in model_filename:
-            male_vocals_path = next((f for f in full_paths if '(male)' in os.path.basename(f).lower()), None)
-            female_vocals_path = next((f for f in full_paths if '(female)' in os.path.basename(f).lower()), None)
-            if not male_vocals_path or not female_vocals_path:
-                raise Exception("Failed to find male/female vocals")
-            result = {"male_vocals_path": male_vocals_path, "female_vocals_path": female_vocals_path}
+def collect_output_paths(output_files, output_dir):
+    # output_files are in output_dir, make sure they have full paths
+    full_paths = []
+    for f in output_files:
+        if os.path.isabs(f):
+            full_paths.append(f)
         else:
-            vocals_keywords = [k.strip().lower() for k in vocals_keyword.split(',')]
-            instrumental_keywords = [k.strip().lower() for k in instrumental_keyword.split(',')]
-
-            vocals_path = None
-            for keyword in vocals_keywords:
-                # Search for keyword in parentheses to avoid matching model name
-                vocals_path = next((f for f in full_paths if f"({keyword})" in os.path.basename(f).lower()), None)
-                if not vocals_path:
-                    # Fallback to regular search if not found in parentheses
-                    vocals_path = next((f for f in full_paths if keyword in os.path.basename(f).lower()), None)
-                if vocals_path:
-                    break
-
-            instrumental_path = None
-            for keyword in instrumental_keywords:
-                # Search for keyword in parentheses to avoid matching model name
-                instrumental_path = next((f for f in full_paths if f"({keyword})" in os.path.basename(f).lower()), None)
-                if not instrumental_path:
-                    # Fallback to regular search if not found in parentheses
-                    instrumental_path = next((f for f in full_paths if keyword in os.path.basename(f).lower()), None)
-                if instrumental_path:
-                    break
-
-            if not vocals_path or not instrumental_path:
-                raise Exception("Failed to find vocals/instrumental files")
-
-            result = {"vocals_path": vocals_path, "instrumental_path": instrumental_path}
+            # File is in output_dir
+            full_path = os.path.join(output_dir, f)
+            if not os.path.exists(full_path):
+                # Try with basename only
+                full_path = os.path.join(output_dir, os.path.basename(f))
+            full_paths.append(full_path)
+    return full_paths
+
+def find_stem_paths(full_paths, model_filename, vocals_keyword='vocals', instrumental_keyword='instrumental'):
+    if 'bs_roformer_male_female_by_aufr33_sdr_7.2889' in model_filename:
+        male_vocals_path = next((f for f in full_paths if '(male)' in os.path.basename(f).lower()), None)
+        female_vocals_path = next((f for f in full_paths if '(female)' in os.path.basename(f).lower()), None)
+        if not male_vocals_path or not female_vocals_path:
+            raise Exception("Failed to find male/female vocals")
+        return {"male_vocals_path": male_vocals_path, "female_vocals_path": female_vocals_path}
+
+    vocals_keywords = [k.strip().lower() for k in vocals_keyword.split(',')]
+    instrumental_keywords = [k.strip().lower() for k in instrumental_keyword.split(',')]
+
+    vocals_path = None
+    for keyword in vocals_keywords:
+        # Search for keyword in parentheses to avoid matching model name
+        vocals_path = next((f for f in full_paths if f"({keyword})" in os.path.basename(f).lower()), None)
+        if not vocals_path:
+            # Fallback to regular search if not found in parentheses
+            vocals_path = next((f for f in full_paths if keyword in os.path.basename(f).lower()), None)
+        if vocals_path:
+            break
+
+    instrumental_path = None
+    for keyword in instrumental_keywords:
+        # Search for keyword in parentheses to avoid matching model name
+        instrumental_path = next((f for f in full_paths if f"({keyword})" in os.path.basename(f).lower()), None)
+        if not instrumental_path:
+            # Fallback to regular search if not found in parentheses
+            instrumental_path = next((f for f in full_paths if keyword in os.path.basename(f).lower()), None)
+        if instrumental_path:
+            break
+
+    if not vocals_path or not instrumental_path:
+        raise Exception("Failed to find vocals/instrumental files")
+
+    return {"vocals_path": vocals_path, "instrumental_path": instrumental_path}
+
+def audio_duration(path):
+    """Duration in seconds, or None when the file can't be probed without decoding it"""
+    try:
+        import soundfile as sf
+        with open(path, 'rb') as f:
+            return sf.info(f).duration
+    except Exception:
+        pass
+    try:
+        import librosa
+        return librosa.get_duration(path=path)
+    except Exception:
+        return None
+
+def cut_window(input_path, output_dir, start=None, duration=None):
+    """Decode only [start, start + duration) with ffmpeg input seeking into a WAV the separator can read.
+
+    The file keeps the input's base name so the stems are named as before. Returns (path, scratch_dir).
+    """
+    scratch_dir = os.path.join(output_dir, '_window')
+    os.makedirs(scratch_dir, exist_ok=True)
+    window_path = os.path.join(scratch_dir, os.path.splitext(os.path.basename(input_path))[0] + '.wav')
+    command = ['ffmpeg', '-y', '-v', 'error', '-nostdin']
+    if start:
+        command.extend(['-ss', f"{start:.3f}"])
+    if duration:
+        command.extend(['-t', f"{duration:.3f}"])
+    command.extend(['-i', input_path, '-vn', '-c:a', 'pcm_f32le', window_path])
+    result = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', errors='replace')
+    if result.returncode != 0:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        raise Exception(f"Window decode failed: {result.stderr}")
+    return window_path, scratch_dir
+
+def window_length(total, start=None, duration=None):
+    """Seconds of audio actually separated for a start/duration window"""
+    if total is None:
+        return duration
+    remaining = max(0.0, total - (start or 0))
+    return remaining if duration is None else min(remaining, duration)
+
+def process_separation(input_path, output_dir, model_filename, vocals_keyword='vocals', instrumental_keyword='instrumental',
+                       start=None, duration=None):
+    scratch_dir = None
+    try:
+        stages = []
+        progress = ProgressReporter(emit, 'separation')
+        progress.update(0.0, 'model_load', force=True)
+        with measure('model_load', stages.append, cpu_scope='process', loaded=True):
+            separator = Separator(output_dir=output_dir)
+            separator.load_model(model_filename=model_filename)
+        if start or duration:
+            with measure('window', stages.append, cpu_scope='process'):
+                input_path, scratch_dir = cut_window(input_path, output_dir, start, duration)
+        # No history in a one-shot run, so the separate step only sends heartbeats
+        with measure('separate', stages.append, cpu_scope='process'), progress.estimate('separate', None):
+            output_files = separator.separate(input_path)
+        progress.update(1.0, 'separate')
+
+        full_paths = collect_output_paths(output_files, output_dir)
+        result = find_stem_paths(full_paths, model_filename, vocals_keyword, instrumental_keyword)
+        result["metrics"] = stages
 
         print(json.dumps(result))
 
@@ -99,16 +164,124 @@ def process_separation(input_path, output_dir, model_filename, vocals_keyword='v
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
+    finally:
+        if scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+class SeparatorCache:
+    """Keeps recently used Separator instances (and their loaded models) warm, keyed by model_filename"""
+
+    def __init__(self, max_models=2):
+        self.max_models = max(1, max_models)
+        self.separators = OrderedDict()
+        # Seconds of processing per second of audio, per model - drives the progress estimate
+        self.rates = {}
+
+    def get(self, model_filename, output_dir):
+        separator = self.separators.get(model_filename)
+        if separator is not None:
+            self.separators.move_to_end(model_filename)
+        else:
+            print(f"Loading separation model {model_filename}...")
+            separator = Separator(output_dir=output_dir)
+            separator.load_model(model_filename=model_filename)
+            self.separators[model_filename] = separator
+            while len(self.separators) > self.max_models:
+                self.separators.popitem(last=False)
+
+        # The loaded model writes its stems to its own output_dir, so point both at this job
+        separator.output_dir = output_dir
+        if getattr(separator, 'model_instance', None) is not None:
+            separator.model_instance.output_dir = output_dir
+        return separator
+
+    def separate(self, job):
+        output_dir = job["output_dir"]
+        os.makedirs(output_dir, exist_ok=True)
+        stages = []
+        progress = ProgressReporter(emit, 'separation', job.get("id"))
+        progress.update(0.0, 'model_load', force=True)
+        with measure('model_load', stages.append, cpu_scope='process') as stage:
+            stage['loaded'] = job["model_filename"] not in self.separators
+            separator = self.get(job["model_filename"], output_dir)
+
+        # Only the requested window is decoded and separated, so cost follows its length
+        input_path, scratch_dir = job["input_path"], None
+        start, window = job.get("start"), job.get("duration")
+        if start or window:
+            with measure('window', stages.append, cpu_scope='process'):
+                input_path, scratch_dir = cut_window(input_path, output_dir, start, window)
+
+        # audio-separator has no progress hook, so estimate from how fast this model ran before
+        duration = window_length(audio_duration(job["input_path"]), start, window)
+        rate = self.rates.get(job["model_filename"])
+        expected = duration * rate if duration and rate else None
+        started = time.time()
+        try:
+            with measure('separate', stages.append, cpu_scope='process'), progress.estimate('separate', expected):
+                output_files = separator.separate(input_path)
+        finally:
+            if scratch_dir:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+        if duration:
+            observed = (time.time() - started) / duration
+            self.rates[job["model_filename"]] = observed if rate is None else 0.7 * rate + 0.3 * observed
+        progress.update(1.0, 'separate')
+        full_paths = collect_output_paths(output_files, output_dir)
+        result = find_stem_paths(
+            full_paths,
+            job["model_filename"],
+            job.get("vocals_keyword", 'vocals'),
+            job.get("instrumental_keyword", 'instrumental')
+        )
+        result["metrics"] = stages
+        return result
+
+def emit(message):
+    print(json.dumps(message), flush=True)
+
+def serve(max_models):
+    """Daemon mode: read separation jobs as JSON lines from stdin, answer on stdout"""
+    separators = SeparatorCache(max_models)
+    emit({"event": "ready"})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        job_id = None
+        try:
+            job = json.loads(line)
+            job_id = job.get("id")
+            result = separators.separate(job)
+            emit(dict(result, event="result", id=job_id))
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            emit({"event": "error", "id": job_id, "error": str(e)})
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input_path", type=str, required=True)
-    parser.add_argument("--output_dir", type=str, required=True)
+    parser.add_argument("--serve", action="store_true",
+                        help="Stay resident and read separation jobs as JSON lines from stdin")
+    parser.add_argument("--max_models", type=int, default=2)
+    parser.add_argument("--input_path", type=str)
+    parser.add_argument("--output_dir", type=str)
     parser.add_argument("--model_filename", type=str, default='UVR_MDXNET_KARA_2.onnx')
     parser.add_argument("--vocals_keyword", type=str, default='vocals')
     parser.add_argument("--instrumental_keyword", type=str, default='instrumental')
+    parser.add_argument("--start", type=float, help="Separate from this many seconds into the input")
+    parser.add_argument("--duration", type=float, help="Separate only this many seconds")
     args = parser.parse_args()
 
+    if args.serve:
+        serve(args.max_models)
+        sys.exit(0)
+
+    if not args.input_path or not args.output_dir:
+        parser.error("--input_path and --output_dir are required")
+
     try:
-        process_separation(args.input_path, args.output_dir, args.model_filename, args.vocals_keyword, args.instrumental_keyword)
+        process_separation(args.input_path, args.output_dir, args.model_filename, args.vocals_keyword, args.instrumental_keyword,
+                           args.start, args.duration)
     except Exception as e:
         sys.exit(1)